@@ -0,0 +1,147 @@
+''' Duplicate fetches avoided by url canonicalization, and its cost per link
+with and without the LRU cache and a page of links at a time.
+
+    python benchmarks/bench_canonical.py [--pages N] [--links 80] [--targets 20000]
+        [--variant-rate 0.3]
+
+Pages on the seed domains link to a fixed set of real pages, a share of the
+links naming them in another way: upper-case host, default port, "./" and
+"../" segments, index.html, a trailing slash, reordered query parameters,
+session and tracking parameters. Links are counted as the crawler fetches
+them: defragmented by the extractor, then as the original normalize (strip
+trailing slashes) or as the canonicalizer leaves them. Every canonical form
+is checked to be its own canonical form, as the scraper and the frontier
+both canonicalize a link.
+'''
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.canonical import Canonicalizer
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu"]
+SEGMENTS = [
+    "~eppstein", "pubs", "people", "faculty", "research", "events", "news",
+    "seminar", "projects", "courses", "cs121", "about", "grad", "ugrad"]
+
+
+def legacy_normalize(url):
+    ''' utils.normalize before canonicalization. '''
+    if url.endswith("/"):
+        return url.rstrip("/")
+    return url
+
+
+def make_pages(rand, count):
+    ''' (host, path, query parameters) of the pages that exist. '''
+    pages = list()
+    for _ in range(count):
+        path = "/".join(rand.choices(SEGMENTS, k=rand.randint(1, 4)))
+        params = [
+            (name, str(rand.randrange(50)))
+            for name in sorted(rand.sample(("id", "page", "year", "sort"), rand.randint(0, 2)))]
+        pages.append((rand.choice(HOSTS), f"/{path}", params))
+    return pages
+
+
+def page_url(host, path, params):
+    query = "&".join(f"{name}={value}" for name, value in params)
+    return f"https://{host}{path}{f'?{query}' if query else ''}"
+
+
+def variant(rand, host, path, params):
+    ''' One of the ways a link may name the page. '''
+    params = list(params)
+    choice = rand.randrange(8)
+    if choice == 0:
+        host = host.upper()
+    elif choice == 1:
+        host = f"{host}:443"
+    elif choice == 2:
+        head, _, last = path.rpartition("/")
+        path = f"{head}/./{last}"
+    elif choice == 3:
+        path = f"{path}/{rand.choice(('index.html', 'index.html/', 'index.htm/index.html'))}"
+    elif choice == 4:
+        path = f"{path}/"
+    elif choice == 5:
+        rand.shuffle(params)
+        params.reverse()
+    elif choice == 6:
+        params.append(("jsessionid", f"{rand.getrandbits(32):08x}"))
+    else:
+        params.append(("utm_source", rand.choice(("twitter", "newsletter"))))
+    return page_url(host, path, params)
+
+
+def make_links(args):
+    rand = random.Random(0)
+    pages = make_pages(rand, args.targets)
+    link_pages = list()
+    linked = set()
+    for _ in range(args.pages):
+        links = list()
+        for _ in range(args.links):
+            host, path, params = rand.choice(pages)
+            linked.add(page_url(host, path, params))
+            if rand.random() < args.variant_rate:
+                links.append(variant(rand, host, path, params))
+            else:
+                links.append(page_url(host, path, params))
+        link_pages.append(links)
+    return len(linked), link_pages
+
+
+def timed(function, link_pages):
+    links = sum(len(page) for page in link_pages)
+    start = time.perf_counter()
+    for page in link_pages:
+        function(page)
+    return 1e6 * (time.perf_counter() - start) / links
+
+
+def main(args):
+    targets, link_pages = make_links(args)
+    links = [link for page in link_pages for link in page]
+    legacy = {legacy_normalize(link) for link in links}
+    canonicalizer = Canonicalizer()
+    canonical = {canonicalizer.canonicalize(link) for link in links}
+    unstable = [
+        url for url in canonical if canonicalizer.canonicalize(url) != url]
+    assert not unstable, f"not idempotent: {unstable[:5]}"
+    print(f"{len(links)} links to {targets} pages, "
+          f"{args.variant_rate:.0%} of them variants")
+    print(f"  original normalize: {len(legacy):>7} urls to fetch, "
+          f"{len(legacy) - targets} duplicates")
+    print(f"  canonical:          {len(canonical):>7} urls to fetch, "
+          f"{len(canonical) - targets} duplicates")
+
+    def uncached(page):
+        for link in page:
+            canonicalizer._canonicalize(link)
+
+    def cached(page):
+        for link in page:
+            canonicalizer.canonicalize(link)
+
+    canonicalizer = Canonicalizer()
+    print(f"  per link: uncached {timed(uncached, link_pages):.2f}us, "
+          f"cached {timed(cached, link_pages):.2f}us, ", end="")
+    canonicalizer = Canonicalizer()
+    batch = timed(canonicalizer.canonicalize_all, link_pages)
+    print(f"batch {batch:.2f}us (cold cache)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--links", type=int, default=80)
+    parser.add_argument("--targets", type=int, default=20000)
+    parser.add_argument("--variant-rate", type=float, default=0.3)
+    main(parser.parse_args())
@@ -0,0 +1,162 @@
+''' Adaptive concurrency against a simulated cache server whose capacity
+changes over time. Latency grows once more requests are in flight than
+the server's capacity, and beyond twice its capacity a growing share of
+requests fail with 602. One host also answers 503 to some requests.
+
+Runs the same fetchers with a fixed concurrency of --fetchers and under
+crawler.concurrency.ConcurrencyController, and reports per capacity phase
+the successful fetches per second, error rate, p90 latency and the
+controller's mean fetcher limit.
+
+    python benchmarks/bench_concurrency.py [--fetchers 32] [--capacities 16,4,32,8] [--phase 5]
+'''
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.concurrency import ConcurrencyController
+from crawler.frontier import Frontier
+
+HOSTS = [f"host{i}.ics.uci.edu" for i in range(8)]
+FLAKY_HOST = HOSTS[0]
+FLAKY_RATE = 0.3
+
+
+class SimulatedServer(object):
+    def __init__(self, capacities, phase, base_latency, seed=0):
+        self.capacities = capacities
+        self.phase = phase
+        self.base_latency = base_latency
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.in_flight = 0
+        self.started = time.time()
+
+    def capacity(self):
+        index = int((time.time() - self.started) / self.phase)
+        return self.capacities[min(index, len(self.capacities) - 1)]
+
+    def fetch(self, url):
+        ''' Returns the status of url after the simulated latency. '''
+        with self.lock:
+            self.in_flight += 1
+            load = self.in_flight / self.capacity()
+            jitter = self.random.uniform(0.8, 1.2)
+            overloaded = self.random.random() < 1 - 2 / load if load > 2 else False
+            flaky = FLAKY_HOST in url and self.random.random() < FLAKY_RATE
+        time.sleep(self.base_latency * max(1.0, load) * jitter)
+        with self.lock:
+            self.in_flight -= 1
+        if overloaded:
+            return 602
+        return 503 if flaky else 200
+
+
+class PacingRecorder(object):
+    ''' Stands in for the frontier, recording the pacing it is given. '''
+    get_domain = staticmethod(Frontier.get_domain)
+
+    def __init__(self):
+        self.delays = list()
+
+    def set_host_delay(self, domain, delay):
+        self.delays.append((domain, delay))
+
+
+def run(args, adaptive):
+    server = SimulatedServer(args.capacities, args.phase, args.latency)
+    pacing = PacingRecorder()
+    controller = None
+    if adaptive:
+        config = SimpleNamespace(
+            time_delay=args.politeness, target_latency=args.target_latency,
+            max_error_rate=args.max_error_rate)
+        controller = ConcurrencyController(config, pacing, args.fetchers)
+    stop = Event()
+    lock = Lock()
+    fetches = list()
+    limits = list()
+
+    def fetcher(fetcher_id):
+        rand = random.Random(fetcher_id)
+        while not stop.is_set():
+            url = f"https://{rand.choice(HOSTS)}/p{rand.randrange(10 ** 6)}"
+            if controller is not None:
+                controller.acquire()
+            start = time.time()
+            status = server.fetch(url)
+            latency = time.time() - start
+            if controller is not None:
+                controller.release(url, latency, status)
+            with lock:
+                fetches.append((time.time(), latency, status))
+
+    threads = [
+        Thread(target=fetcher, args=(i,), daemon=True)
+        for i in range(args.fetchers)]
+    for thread in threads:
+        thread.start()
+    end = server.started + args.phase * len(args.capacities)
+    while time.time() < end:
+        limits.append((time.time(), controller.limit if controller else args.fetchers))
+        time.sleep(0.05)
+    stop.set()
+    if controller is not None:
+        # Fetchers may be waiting for a slot.
+        with controller.slots:
+            controller.limit = args.fetchers
+            controller.slots.notify_all()
+    for thread in threads:
+        thread.join()
+
+    rows = list()
+    for index, capacity in enumerate(args.capacities):
+        low = server.started + index * args.phase
+        high = low + args.phase
+        phase = [fetch for fetch in fetches if low <= fetch[0] < high]
+        latencies = sorted(latency for _, latency, _ in phase)
+        ok = sum(1 for _, _, status in phase if status == 200)
+        errors = sum(1 for _, _, status in phase if status >= 600)
+        phase_limits = [limit for stamp, limit in limits if low <= stamp < high]
+        rows.append((
+            capacity, ok / args.phase, errors / max(len(phase), 1),
+            latencies[int(0.9 * (len(latencies) - 1))] if latencies else 0.0,
+            sum(phase_limits) / max(len(phase_limits), 1)))
+    below_floor = [delay for _, delay in pacing.delays if delay < args.politeness]
+    return rows, len(pacing.delays), below_floor
+
+
+def main(args):
+    args.capacities = [int(capacity) for capacity in args.capacities.split(",")]
+    print(f"{args.fetchers} fetchers, {args.latency * 1000:.0f}ms base latency, "
+          f"capacities {args.capacities}, {args.phase}s each")
+    for name, adaptive in (("fixed", False), ("adaptive", True)):
+        rows, pacing_changes, below_floor = run(args, adaptive)
+        print(f"\n{name}:")
+        print("  capacity   ok/sec  6xx rate  p90 latency  fetchers")
+        for capacity, ok_rate, error_rate, p90, limit in rows:
+            print(f"  {capacity:8d} {ok_rate:8.1f} {error_rate:9.1%} "
+                  f"{p90 * 1000:10.0f}ms {limit:9.1f}")
+        if adaptive:
+            print(f"  {pacing_changes} host pacing changes, "
+                  f"{len(below_floor)} below politeness")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--fetchers", type=int, default=32)
+    parser.add_argument("--capacities", type=str, default="16,4,32,8")
+    parser.add_argument("--phase", type=float, default=5.0,
+                        help="Seconds of each capacity phase.")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds per request while under capacity.")
+    parser.add_argument("--politeness", type=float, default=0.05)
+    parser.add_argument("--target-latency", type=float, default=0.06)
+    parser.add_argument("--max-error-rate", type=float, default=0.1)
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+''' End-to-end crawl throughput against the local stand-in cache server.
+
+Starts benchmarks/local_cache_server.py in process, runs launch.py against
+it in a scratch directory for a fixed time and reports pages/sec, p50/p99
+fetch latency (from the crawl log in Logs/crawl) and frontier size over time
+(from the log save backend).
+
+    python benchmarks/bench_crawl.py --duration 60 --threads 8
+'''
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from crawler.persistence import read_records
+from utils.crawl_log import CrawlLogReader
+from local_cache_server import add_server_arguments, server_from_arguments
+
+CONFIG = """[IDENTIFICATION]
+USERAGENT = IR benchmark
+[CONNECTION]
+HOST = {host}
+PORT = {port}
+[CRAWLER]
+SEEDURL = {seeds}
+POLITENESS = {politeness}
+[LOCAL PROPERTIES]
+SAVE = frontier.shelve
+SAVEBACKEND = log
+THREADCOUNT = {threads}
+ENGINE = {engine}
+ASYNCCONCURRENCY = {concurrency}
+"""
+
+
+def frontier_size(workdir):
+    ''' Returns (discovered, pending) urls from the log save backend. '''
+    state = dict()
+    for suffix in (".snapshot", ".log"):
+        path = os.path.join(workdir, f"frontier.shelve{suffix}")
+        if os.path.exists(path):
+            with open(path, "rb") as save:
+                for urlhash, _, completed, _ in read_records(save):
+                    state[urlhash] = completed
+    pending = sum(1 for completed in state.values() if not completed)
+    return len(state), pending
+
+
+def fetches(workdir):
+    ''' Returns (timestamp, url, status, seconds) for every logged fetch. '''
+    reader = CrawlLogReader(os.path.join(workdir, "Logs", "crawl"))
+    records = [
+        (record["time"], record["url"], record["status"], record["seconds"])
+        for record in reader.records(events=["fetch"])]
+    reader.close()
+    return records
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main(args):
+    server = server_from_arguments(args).start()
+    samples = list()
+    with tempfile.TemporaryDirectory() as workdir:
+        config_file = os.path.join(workdir, "config.ini")
+        with open(config_file, "w") as config:
+            config.write(CONFIG.format(
+                host=server.host, port=server.port,
+                seeds=",".join(server.corpus.seed_urls),
+                politeness=args.politeness, threads=args.threads,
+                engine=args.engine, concurrency=args.concurrency))
+        crawl = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "launch.py"),
+             "--restart", "--config_file", config_file],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        start = time.time()
+        try:
+            while crawl.poll() is None and time.time() - start < args.duration:
+                time.sleep(args.sample_interval)
+                discovered, pending = frontier_size(workdir)
+                samples.append({
+                    "elapsed": round(time.time() - start, 1),
+                    "requests": len(server.requests),
+                    "discovered": discovered, "pending": pending})
+        finally:
+            if crawl.poll() is None:
+                crawl.send_signal(signal.SIGINT)
+                try:
+                    crawl.wait(10)
+                except subprocess.TimeoutExpired:
+                    crawl.kill()
+            server.stop()
+        records = fetches(workdir)
+
+    if not records:
+        print("No fetches were logged.")
+        return
+    elapsed = max(records[-1][0] - records[0][0], 1e-9)
+    latencies = [seconds for _, _, _, seconds in records]
+    statuses = dict()
+    for _, _, status, _ in records:
+        statuses[status] = statuses.get(status, 0) + 1
+    report = {
+        "engine": args.engine, "threads": args.threads,
+        "pages": len(records),
+        "pages_per_sec": round(len(records) / elapsed, 2),
+        "fetch_p50": percentile(latencies, 0.50),
+        "fetch_p99": percentile(latencies, 0.99),
+        "statuses": statuses,
+        "frontier": samples,
+    }
+    print(f"{report['pages']} pages in {elapsed:.1f}s: "
+          f"{report['pages_per_sec']} pages/sec, "
+          f"fetch p50 {report['fetch_p50']:.3f}s p99 {report['fetch_p99']:.3f}s")
+    print(f"statuses: {statuses}")
+    print(" elapsed  requests  discovered  pending")
+    for sample in samples:
+        print(f"{sample['elapsed']:8} {sample['requests']:9} "
+              f"{sample['discovered']:11} {sample['pending']:8}")
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--sample-interval", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--engine", type=str, default="threads")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--politeness", type=float, default=0.5)
+    parser.add_argument("--json", type=str, default=None,
+                        help="Also write the report to this file.")
+    add_server_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,107 @@
+''' Per-page parse time and peak memory of the streaming lxml extractor
+against the BeautifulSoup tree build.
+
+    python benchmarks/bench_extract.py [--pages N] [--html-dir DIR]
+
+Each method runs in its own process so peak RSS is comparable.
+'''
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.html_extract import extract_soup, extract_streaming
+
+METHODS = {"streaming": extract_streaming, "soup": extract_soup}
+WORDS = (
+    "research student faculty graduate course lecture seminar computer "
+    "science informatics statistics software systems data learning network"
+).split()
+
+
+def synthetic_page(rand, links):
+    paragraphs = "".join(
+        f"<div class='c{i}'><p>{' '.join(rand.choices(WORDS, k=60))}</p></div>"
+        for i in range(rand.randint(10, 60)))
+    anchors = "".join(
+        f"<li><a href='/~u{rand.randrange(500)}/p{i}.html#s{i}'>"
+        f"{rand.choice(WORDS)}</a></li>"
+        for i in range(links))
+    return (
+        "<html><head><title>page</title><script>var a = [1, 2, 3];</script>"
+        "<style>p { margin: 0 }</style></head><body>"
+        f"<nav><ul>{anchors}</ul></nav>{paragraphs}</body></html>"
+    ).encode("utf-8")
+
+
+def load_pages(args):
+    if args.html_dir:
+        pages = list()
+        for name in sorted(os.listdir(args.html_dir)):
+            with open(os.path.join(args.html_dir, name), "rb") as page:
+                pages.append(page.read())
+        return pages
+    rand = random.Random(0)
+    return [synthetic_page(rand, rand.randint(20, 300)) for _ in range(args.pages)]
+
+
+def run_child(args):
+    extract = METHODS[args.child]
+    pages = load_pages(args)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = list()
+    for page in pages:
+        start = time.perf_counter()
+        extract("https://www.ics.uci.edu/index.html", page)
+        timings.append(time.perf_counter() - start)
+    # Separate pass, tracemalloc slows allocation down.
+    py_peak = 0
+    tracemalloc.start()
+    for page in pages:
+        tracemalloc.reset_peak()
+        extract("https://www.ics.uci.edu/index.html", page)
+        py_peak = max(py_peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    timings.sort()
+    print(json.dumps({
+        "mean_ms": 1000 * sum(timings) / len(timings),
+        "p99_ms": 1000 * timings[int(0.99 * (len(timings) - 1))],
+        "py_peak_kib": py_peak / 1024,
+        "rss_growth_kib": resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss - base_rss,
+    }))
+
+
+def main(args):
+    sizes = [len(page) for page in load_pages(args)]
+    print(f"{len(sizes)} pages, mean {sum(sizes) / len(sizes) / 1024:.1f} KiB")
+    for method in METHODS:
+        command = [sys.executable, os.path.abspath(__file__), "--child", method,
+                   "--pages", str(args.pages)]
+        if args.html_dir:
+            command += ["--html-dir", args.html_dir]
+        result = json.loads(subprocess.check_output(command))
+        print(f"{method:>10}: {result['mean_ms']:7.2f} ms/page "
+              f"(p99 {result['p99_ms']:7.2f}), "
+              f"python peak/page {result['py_peak_kib']:7.0f} KiB, "
+              f"rss growth {result['rss_growth_kib']:7.0f} KiB")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--html-dir", type=str, default=None)
+    parser.add_argument("--child", type=str, choices=sorted(METHODS),
+                        help="Internal: run one method and print json.")
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+    else:
+        main(args)
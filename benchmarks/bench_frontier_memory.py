@@ -0,0 +1,79 @@
+''' Memory held by the frontier for N pending urls, with every pending url
+in memory against a bounded window and the rest spilled to disk
+(crawler/spill.py), and the time to add and drain them. Memory of the log
+save backend, which keeps every url whatever the window, is left out; the
+LRU caches of canonical urls and url hashes fill up either way.
+
+    python benchmarks/bench_frontier_memory.py [--urls N] [--window 10000]
+        [--hosts 500]
+'''
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import persistence
+from crawler.frontier import Frontier
+
+
+def make_config(save_file, window):
+    return SimpleNamespace(
+        save_file=save_file, save_backend="log", save_batch=4096,
+        save_interval=1.0, seed_urls=["https://www.ics.uci.edu"],
+        time_delay=0, priority_weights={"depth": 1, "trap": 4},
+        host_budget=0, trap_detection=False, retry_limits={},
+        retry_backoff=60, retry_max_backoff=3600, frontier_window=window, recrawl=False)
+
+
+def measure(args, window):
+    with tempfile.TemporaryDirectory() as workdir:
+        config = make_config(os.path.join(workdir, "frontier.shelve"), window)
+        gc.collect()
+        tracemalloc.start()
+        frontier = Frontier(config, True)
+        start = time.perf_counter()
+        for i in range(args.urls):
+            frontier.add_url(
+                f"https://host{i % args.hosts}.ics.uci.edu/~user{i % 997}/page{i}.html")
+        added = time.perf_counter() - start
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, persistence.__file__)])
+        held = sum(stat.size for stat in snapshot.statistics("filename"))
+        tracemalloc.stop()
+        spilled = len(frontier.spill)
+        start = time.perf_counter()
+        drained = 0
+        with frontier.lock:
+            while True:
+                url, _ = frontier._pop_ready_url()
+                if url is None:
+                    break
+                frontier.mark_url_complete(url)
+                drained += 1
+        elapsed = time.perf_counter() - start
+        frontier.close()
+    name = f"window {window}" if window else "unbounded"
+    print(f"{name:>14}: {held / 2**20:7.1f} MiB held, "
+          f"{spilled} spilled, add {1e6 * added / args.urls:.1f}us/url, "
+          f"drain {1e6 * elapsed / max(drained, 1):.1f}us/url")
+
+
+def main(args):
+    print(f"{args.urls} pending urls on {args.hosts} hosts")
+    measure(args, 0)
+    measure(args, args.window)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.add_argument("--window", type=int, default=10000)
+    parser.add_argument("--hosts", type=int, default=500)
+    main(parser.parse_args())
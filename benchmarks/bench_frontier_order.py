@@ -0,0 +1,162 @@
+''' Useful pages per fetch of a crawl with a fixed fetch budget, over a
+synthetic link graph where ordinary pages also link into crawler traps
+(endless calendars, deep archives, query permutations). Compares the
+original last-in first-out frontier with the priority frontier, without
+and with the trap detector. Pages go through the scraper's near-duplicate
+check, trap pages being the same boilerplate with a few words changed.
+
+    python benchmarks/bench_frontier_order.py [--budget N] [--weights "depth: 1, trap: 4"]
+        [--trap-samples 20] [--trap-min-yield 0.2]
+'''
+import os
+import random
+import sys
+import tempfile
+from argparse import ArgumentParser
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.frontier import Frontier
+from utils.near_dup import NearDupIndex, content_checksum
+from simhash import Simhash
+import scraper
+
+WORDS = (
+    "research student faculty graduate course lecture seminar computer "
+    "science informatics statistics software systems data learning network "
+    "security theory algorithm database vision language human interaction"
+).split()
+
+
+class TrapGraph(object):
+    ''' pages_per_host useful pages on each host, each linking to fanout
+    useful pages and, with trap_rate, into one of the traps. Trap pages
+    mostly link to more trap pages. '''
+    def __init__(self, hosts=10, pages_per_host=2000, fanout=8,
+                 trap_rate=0.5, seed=0):
+        self.hosts = [f"host{i}.ics.uci.edu" for i in range(hosts)]
+        self.pages_per_host = pages_per_host
+        self.fanout = fanout
+        self.trap_rate = trap_rate
+        self.seed = seed
+
+    @property
+    def seed_urls(self):
+        return [f"https://{host}/p0.html" for host in self.hosts]
+
+    @staticmethod
+    def is_useful(url):
+        path = urlparse(url).path
+        return path.startswith("/p") and not urlparse(url).query
+
+    def text(self, url):
+        rand = random.Random(f"{self.seed}:text:{url}")
+        if self.is_useful(url):
+            return " ".join(rand.choices(WORDS, k=100))
+        boilerplate = random.Random(urlparse(url).path.split("/")[1])
+        words = boilerplate.choices(WORDS, k=100)
+        words[rand.randrange(len(words))] = rand.choice(WORDS)
+        return " ".join(words)
+
+    def links(self, url):
+        parsed = urlparse(url)
+        rand = random.Random(f"{self.seed}:{url}")
+        host = parsed.netloc
+        if self.is_useful(url):
+            links = [
+                f"https://{rand.choice(self.hosts) if rand.random() < 0.2 else host}"
+                f"/p{rand.randrange(self.pages_per_host)}.html"
+                for _ in range(self.fanout)]
+            if rand.random() < self.trap_rate:
+                links.append(rand.choice((
+                    f"https://{host}/events/calendar?date=2019-{rand.randrange(1, 13):02}-01",
+                    f"https://{host}/archive/{rand.randrange(2000, 2020)}",
+                    f"https://{host}/wiki/doku.php?id=start&do=edit&rev={rand.randrange(10 ** 6)}")))
+            return links
+        # Trap pages: next and previous pages, more views, rarely a way out.
+        links = [
+            f"{url}/{rand.randrange(100)}" if "/archive/" in url
+            else f"{url}&v={rand.randrange(10 ** 6)}"
+            for _ in range(3)]
+        if rand.random() < 0.05:
+            links.append(f"https://{host}/p{rand.randrange(self.pages_per_host)}.html")
+        return links
+
+
+class StackFrontier(object):
+    ''' The original frontier order: one list used as a stack. '''
+    def __init__(self, seed_urls):
+        self.seen = set(seed_urls)
+        self.to_be_downloaded = list(seed_urls)
+
+    def get_tbd_url(self):
+        return self.to_be_downloaded.pop() if self.to_be_downloaded else None
+
+    def add_url(self, url, parent=None):
+        if url not in self.seen:
+            self.seen.add(url)
+            self.to_be_downloaded.append(url)
+
+    def mark_url_complete(self, url):
+        pass
+
+
+def crawl(frontier, graph, budget):
+    useful = 0
+    scraper.near_duplicates = NearDupIndex(k=3)
+    for _ in range(budget):
+        url = frontier.get_tbd_url()
+        if url is None:
+            break
+        useful += graph.is_useful(url)
+        text = graph.text(url)
+        scraper.record_page(
+            url, [], {}, Simhash(text).value, content_checksum(text))
+        for link in graph.links(url):
+            frontier.add_url(link, url)
+        frontier.mark_url_complete(url)
+    return useful
+
+
+def main(args):
+    graph = TrapGraph(trap_rate=args.trap_rate)
+    useful = crawl(StackFrontier(graph.seed_urls), graph, args.budget)
+    print(f"     stack: {useful} useful pages in {args.budget} fetches "
+          f"({useful / args.budget:.1%})")
+    weights = {
+        name.strip(): float(weight)
+        for name, weight in (item.split(":") for item in args.weights.split(","))}
+    for name, trap_detection in (("priority", False), ("traps", True)):
+        with tempfile.TemporaryDirectory() as workdir:
+            config = SimpleNamespace(
+                save_file=os.path.join(workdir, "frontier.shelve"),
+                save_backend="log", save_batch=4096, save_interval=5.0,
+                seed_urls=graph.seed_urls, time_delay=0,
+                priority_weights=weights, host_budget=500,
+                trap_detection=trap_detection, trap_samples=args.trap_samples,
+                trap_min_yield=args.trap_min_yield,
+                trap_file=os.path.join(workdir, "traps.json"),
+                trap_report=os.path.join(workdir, "trap_report.txt"),
+                retry_limits={}, retry_backoff=60, retry_max_backoff=3600,
+                frontier_window=100000, recrawl=False)
+            frontier = Frontier(config, True)
+            useful = crawl(frontier, graph, args.budget)
+            if frontier.traps is not None:
+                report = frontier.traps.report()
+            frontier.close()
+        print(f"{name:>10}: {useful} useful pages in {args.budget} fetches "
+              f"({useful / args.budget:.1%})")
+    print("\n".join(f"    {line}" for line in report))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--budget", type=int, default=10000)
+    parser.add_argument("--trap-rate", type=float, default=0.5)
+    parser.add_argument(
+        "--weights", default="depth: 1, host: 1, inlinks: 1, trap: 4")
+    parser.add_argument("--trap-samples", type=int, default=20)
+    parser.add_argument("--trap-min-yield", type=float, default=0.2)
+    main(parser.parse_args())
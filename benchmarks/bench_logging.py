@@ -0,0 +1,146 @@
+''' Cost of logging every fetch on the worker threads: the original
+synchronous file and console handlers writing a "Downloaded ..." line,
+the same line through the queued pipeline (utils/log_pipeline.py), and a
+record in the structured crawl log (utils/crawl_log.py).
+
+    python benchmarks/bench_logging.py [--records 200000] [--threads 4] [--lookups 20]
+
+Reports the time the worker threads spend per record, and the time until
+everything is written out. Console output goes to /dev/null. The crawl log
+is then searched for the records of --lookups urls through its index.
+'''
+import logging
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import log_pipeline
+from utils.crawl_log import CrawlLog, CrawlLogReader
+
+
+def urls(count):
+    return [f"https://www.ics.uci.edu/~user{i % 500}/page{i}.html" for i in range(count)]
+
+
+def run_threads(threads, work):
+    ''' Runs work(thread_index) on threads threads, returns the seconds
+    until all are done. '''
+    workers = [Thread(target=work, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def line_logger(name, handlers):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+def synchronous(args, workdir, devnull):
+    ''' utils.get_logger before the pipeline. '''
+    formatter = logging.Formatter(log_pipeline.LOG_FORMAT)
+    handlers = [
+        logging.FileHandler(os.path.join(workdir, "Worker.log")),
+        logging.StreamHandler(devnull)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    logger = line_logger("bench.synchronous", handlers)
+    batches = split(urls(args.records), args.threads)
+
+    def work(index):
+        for url in batches[index]:
+            logger.info(
+                f"Downloaded {url}, status <200>, "
+                f"using cache ('127.0.0.1', 9000), in 0.123s.")
+    elapsed = run_threads(args.threads, work)
+    for handler in handlers:
+        handler.close()
+    return elapsed, elapsed
+
+
+def pipeline(args, workdir, devnull):
+    previous = os.getcwd()
+    os.chdir(workdir)
+    log_pipeline.console.setStream(devnull)
+    logger = logging.getLogger("bench.pipeline")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    log_pipeline.attach(logger, "Worker")
+    batches = split(urls(args.records), args.threads)
+
+    def work(index):
+        for url in batches[index]:
+            logger.info(
+                f"Downloaded {url}, status <200>, "
+                f"using cache ('127.0.0.1', 9000), in 0.123s.")
+    start = time.perf_counter()
+    elapsed = run_threads(args.threads, work)
+    log_pipeline.stop()
+    total = time.perf_counter() - start
+    os.chdir(previous)
+    return elapsed, total
+
+
+def crawl_log(args, workdir, devnull):
+    log = CrawlLog(os.path.join(workdir, "crawl"), summary_interval=3600)
+    batches = split(urls(args.records), args.threads)
+
+    def work(index):
+        for url in batches[index]:
+            log.record("fetch", url, 200, 0.123)
+    start = time.perf_counter()
+    elapsed = run_threads(args.threads, work)
+    log.close()
+    return elapsed, time.perf_counter() - start
+
+
+def lookup(args, workdir):
+    ''' Seconds per url to read back every record of a url. '''
+    reader = CrawlLogReader(os.path.join(workdir, "crawl"))
+    wanted = urls(args.records)[::max(args.records // args.lookups, 1)][:args.lookups]
+    start = time.perf_counter()
+    for url in wanted:
+        found = list(reader.records(url=url))
+        assert [record["url"] for record in found] == [url], url
+    elapsed = time.perf_counter() - start
+    reader.close()
+    return elapsed / len(wanted)
+
+
+def split(items, parts):
+    return [items[index::parts] for index in range(parts)]
+
+
+def main(args):
+    print(f"{args.records} records from {args.threads} threads")
+    with open(os.devnull, "w") as devnull:
+        for name, method in (("synchronous lines", synchronous),
+                             ("queued lines", pipeline),
+                             ("crawl log", crawl_log)):
+            with tempfile.TemporaryDirectory() as workdir:
+                elapsed, total = method(args, workdir, devnull)
+                print(f"{name:>18}: {1e6 * elapsed * args.threads / args.records:6.2f}us "
+                      f"per record on the workers, written out in {total:.2f}s")
+                if method is crawl_log and args.lookups:
+                    print(f"{'url lookup':>18}: {1e3 * lookup(args, workdir):6.2f}ms "
+                          f"per url through the index")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=20)
+    main(parser.parse_args())
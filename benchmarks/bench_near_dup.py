@@ -0,0 +1,68 @@
+''' Insert and lookup latency of NearDupIndex as it grows.
+
+    python benchmarks/bench_near_dup.py [--pages N] [--compare]
+
+--compare also times simhash.SimhashIndex, which the index replaced, up to
+the first checkpoint.
+'''
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.near_dup import NearDupIndex
+
+PROBES = 2000
+
+
+def checkpoints(total):
+    size = 10000
+    while size < total:
+        yield size
+        size *= 10
+    yield total
+
+
+def main(args):
+    rand = random.Random(0)
+    index = NearDupIndex(k=3)
+    inserted = previous = 0
+    print(f"{'pages':>10} {'insert us':>10} {'lookup us':>10}")
+    for size in checkpoints(args.pages):
+        start = time.perf_counter()
+        while inserted < size:
+            index.is_duplicate(rand.randbytes(8), rand.getrandbits(64))
+            inserted += 1
+        batch = (time.perf_counter() - start) / (size - previous)
+        previous = size
+        # Lookups of near copies of random fingerprints that are not there,
+        # the common case for a crawler.
+        probes = [rand.getrandbits(64) for _ in range(PROBES)]
+        start = time.perf_counter()
+        for fingerprint in probes:
+            index._near(fingerprint)
+        lookup = time.perf_counter() - start
+        print(f"{size:>10} {1e6 * batch:>10.2f} "
+              f"{1e6 * lookup / PROBES:>10.2f}")
+
+    if args.compare:
+        from simhash import Simhash, SimhashIndex
+        old = SimhashIndex([], k=3)
+        count = min(args.pages, 10000)
+        start = time.perf_counter()
+        for i in range(count):
+            value = Simhash(rand.getrandbits(64))
+            if not old.get_near_dups(value):
+                old.add(str(i), value)
+        print(f"SimhashIndex: {1e6 * (time.perf_counter() - start) / count:.2f} "
+              f"us per lookup+insert at {count} pages")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000000)
+    parser.add_argument("--compare", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+''' Page store write throughput and compression ratio, and how fast
+launch.py --offline regenerates output.txt from it.
+
+Stores --pages synthetic pages from the local cache server's corpus with
+each available codec, then reprocesses the zlib store with 1 and with
+--processes parse processes, each run in a fresh process and directory.
+
+    python benchmarks/bench_page_store.py [--pages 5000] [--processes 4]
+'''
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from crawler.page_store import CODECS, PageStore
+from local_cache_server import SyntheticCorpus
+
+
+class FetchedPage(object):
+    def __init__(self, url, status, headers, content):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = memoryview(content)
+
+
+def synthetic_pages(count):
+    hosts = ["www.ics.uci.edu", "www.cs.uci.edu", "vision.ics.uci.edu"]
+    corpus = SyntheticCorpus(hosts, count // len(hosts) + 1, fanout=20)
+    for i in range(count):
+        url = f"https://{hosts[i % len(hosts)]}/section0/{i // len(hosts)}.html"
+        status, headers, content = corpus.get(url)
+        yield FetchedPage(url, status, headers, content)
+
+
+def store_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory))
+
+
+def offline(directory, processes, queue):
+    from crawler.offline import reprocess
+    os.chdir(tempfile.mkdtemp())
+    config = SimpleNamespace(page_store=directory, shards=1, parse_processes=0)
+    start = time.perf_counter()
+    reprocess(config, processes)
+    queue.put(time.perf_counter() - start)
+
+
+def main(args):
+    pages = list(synthetic_pages(args.pages))
+    raw_bytes = sum(len(page.body) for page in pages)
+    print(f"{len(pages)} pages, {raw_bytes / 1e6:.1f}MB of bodies")
+    with tempfile.TemporaryDirectory() as workdir:
+        for codec in CODECS:
+            directory = os.path.join(workdir, codec)
+            try:
+                store = PageStore(directory, compression=codec)
+            except ValueError as error:
+                print(f"  {codec}: skipped, {error}")
+                continue
+            start = time.perf_counter()
+            for page in pages:
+                store.add(page.url, page)
+            store.close()
+            elapsed = time.perf_counter() - start
+            print(f"  {codec}: {len(pages) / elapsed:8.0f} pages/sec, "
+                  f"{raw_bytes / elapsed / 1e6:6.1f}MB/s, "
+                  f"ratio {raw_bytes / store_size(directory):.1f}x")
+        context = multiprocessing.get_context("spawn")
+        for processes in sorted({1, args.processes}):
+            queue = context.Queue()
+            process = context.Process(
+                target=offline,
+                args=(os.path.join(workdir, "zlib"), processes, queue))
+            process.start()
+            elapsed = queue.get()
+            process.join()
+            print(f"  offline, {processes} parse processes: "
+                  f"{len(pages) / elapsed:6.0f} pages/sec ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    main(parser.parse_args())
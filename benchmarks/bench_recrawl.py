@@ -0,0 +1,97 @@
+''' Cost of a refresh pass after the fetches: every page run through the
+scraper again, as without RECRAWL, against the recrawl index
+(crawler/recrawl.py) hashing the body and skipping the unchanged pages.
+
+    python benchmarks/bench_recrawl.py [--pages 5000] [--changed 0.1]
+
+Pages come from the local cache server's corpus. A first pass records the
+pages, then a refresh pass finds the --changed fraction of them changed,
+which are parsed as before. Each run is in a fresh directory.
+'''
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from crawler.recrawl import RecrawlIndex
+from local_cache_server import SyntheticCorpus
+import scraper
+
+
+class FetchedPage(object):
+    def __init__(self, url, headers, content):
+        self.url = url
+        self.status = 200
+        self.error = None
+        self.headers = headers
+        self.body = memoryview(content)
+        self.size = len(content)
+
+
+def synthetic_pages(count, changed):
+    ''' (first version, refreshed version) of count pages. '''
+    hosts = ["www.ics.uci.edu", "www.cs.uci.edu", "vision.ics.uci.edu"]
+    corpus = SyntheticCorpus(hosts, count // len(hosts) + 1, fanout=20)
+    every = round(1 / changed) if changed else 0
+    for i in range(count):
+        url = f"https://{hosts[i % len(hosts)]}/section0/{i // len(hosts)}.html"
+        _, headers, content = corpus.get(url)
+        refreshed = content
+        if every and i % every == 0:
+            refreshed = content.replace(b"</body>", b"<p>updated today</p></body>")
+        yield (FetchedPage(url, headers, content),
+               FetchedPage(url, headers, refreshed))
+
+
+def process(pages, index):
+    ''' What a worker does with each fetched page, returns the seconds. '''
+    start = time.perf_counter()
+    for page in pages:
+        if not scraper.accept_response(page):
+            if index is not None:
+                index.unchanged(page.url, page, accepted=False)
+            continue
+        if index is not None and index.unchanged(page.url, page):
+            continue
+        scraper.scraper(page.url, page, {}, "", 0)
+    return time.perf_counter() - start
+
+
+def run(versions, recrawl):
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        index = None
+        if recrawl:
+            index = RecrawlIndex(SimpleNamespace(
+                save_file="frontier", recrawl_interval=86400, recrawl_min=3600,
+                recrawl_max=2592000, save_interval=1.0))
+            scraper.parse_observers.append(index.observe_parse)
+        first = process([first for first, _ in versions], index)
+        refresh = process([refreshed for _, refreshed in versions], index)
+        if index is not None:
+            scraper.parse_observers.remove(index.observe_parse)
+            index.close()
+        os.chdir(previous)
+    return first, refresh
+
+
+def main(args):
+    versions = list(synthetic_pages(args.pages, args.changed))
+    print(f"{len(versions)} pages, {args.changed:.0%} changed on the refresh")
+    for name, recrawl in (("scraper only", False), ("recrawl index", True)):
+        first, refresh = run(versions, recrawl)
+        print(f"{name:>14}: first pass {1e6 * first / len(versions):7.1f}us/page, "
+              f"refresh {1e6 * refresh / len(versions):7.1f}us/page")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--changed", type=float, default=0.1)
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+''' Cost per response of unpickling every cache server reply up front
+against decoding lazily, with the size and content type gates of
+scraper.accept_response running before the body is touched.
+
+    python benchmarks/bench_response.py [--responses 2000]
+
+Each mix is a list of cbor replies as the cache server sends them: html
+pages, 404s, and binaries of a few MB, some over the 10MB limit.
+'''
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cbor
+
+import scraper
+from local_cache_server import encode_response
+from utils.response import Response
+
+# (html pages, 404s, 2MB pdfs, 12MB pdfs) out of 100 responses.
+MIXES = {
+    "pages": (100, 0, 0, 0),
+    "error-heavy": (30, 70, 0, 0),
+    "large-files": (70, 0, 25, 5),
+}
+
+
+def replies(mix, count, rand):
+    html = (b"<html><body><p>" + b"research student faculty " * 800
+            + b"</p></body></html>")
+    kinds = [
+        ("page.html", 200, "text/html", html),
+        ("missing.html", 404, "text/html", b"<html>Not Found</html>"),
+        ("paper.pdf", 200, "application/pdf", rand.randbytes(2 << 20)),
+        ("dataset.pdf", 200, "application/pdf", rand.randbytes(12 << 20)),
+    ]
+    encoded = [
+        encode_response(f"https://www.ics.uci.edu/{name}", status,
+                        {"content-type": content_type}, content)
+        for name, status, content_type, content in kinds]
+    weights = MIXES[mix]
+    return [encoded[i] for i in rand.choices(range(len(kinds)), weights, k=count)]
+
+
+def eager(reply):
+    ''' The previous Response: full unpickle, then the content-length gate. '''
+    resp = Response(cbor.loads(reply))
+    raw = resp.raw_response
+    if not scraper.handle_response_error(resp):
+        return None
+    if raw and int(raw.headers.get("content-length", 0)) > scraper.MAX_CONTENT_LENGTH:
+        return None
+    if resp.status == 200 and raw and raw.content:
+        return raw.content
+    return None
+
+
+def lazy(reply):
+    resp = Response(cbor.loads(reply))
+    return scraper.page_content(resp) if scraper.accept_response(resp) else None
+
+
+def main(args):
+    rand = random.Random(0)
+    for mix in MIXES:
+        batch = replies(mix, args.responses, rand)
+        results = list()
+        for method in (eager, lazy):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for reply in batch:
+                    method(reply)
+            results.append(1e6 * (time.perf_counter() - start) / len(batch))
+        print(f"{mix:>12}: eager {results[0]:8.1f} us/response, "
+              f"lazy {results[1]:8.1f} us/response ({results[0] / results[1]:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--responses", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+''' Restart time of a crawl with N discovered urls: the original rescan of
+the whole save file (re-running is_valid on every pending url) against
+loading the resume index (crawler/resume.py).
+
+    python benchmarks/bench_resume.py [--urls N] [--pending 0.1]
+'''
+import os
+import random
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.frontier import Frontier
+from crawler.persistence import get_backend
+from crawler.resume import ResumeIndex
+from utils import get_urlhash
+from utils.seen_set import SeenSet
+import scraper
+
+
+def make_config(save_file):
+    return SimpleNamespace(
+        save_file=save_file, save_backend="log", save_batch=4096,
+        save_interval=1.0, seed_urls=["https://www.ics.uci.edu"],
+        time_delay=0.5, priority_weights={"depth": 1, "trap": 4},
+        host_budget=500, trap_detection=False, retry_limits={},
+        retry_backoff=60, retry_max_backoff=3600, frontier_window=100000, recrawl=False)
+
+
+def write_crawl(config, count, pending_ratio):
+    ''' Writes the save file and resume index of a crawl that discovered
+    count urls and has pending_ratio of them left to download. '''
+    rand = random.Random(0)
+    save = get_backend(config.save_backend)(config)
+    seen = SeenSet(bloom_bits=1 << 23)
+    pending = list()
+    for i in range(count):
+        url = f"https://www.ics.uci.edu/~user{i % 500}/page{i}.html"
+        completed = rand.random() >= pending_ratio
+        save[get_urlhash(url)] = (url, completed)
+        seen.add(url)
+        if not completed:
+            pending.append((url, 0, 0))
+    save.close()
+    index = ResumeIndex(config)
+    index.create(seen, pending)
+    index.close()
+    return len(pending)
+
+
+def original_restart(config):
+    ''' The frontier load before the resume index. '''
+    save = get_backend(config.save_backend)(config)
+    seen = SeenSet(bloom_bits=1 << 23)
+    to_be_downloaded = list()
+    for url, completed in save.values():
+        seen.add(url)
+        if not completed and scraper.is_valid(url):
+            to_be_downloaded.append(url)
+    save.close()
+    return len(to_be_downloaded)
+
+
+def indexed_restart(config):
+    frontier = Frontier(config, False)
+    frontier.resume.close()
+    frontier.save.close()
+    pending = frontier.tbd_count + len(frontier.spill)
+    frontier.spill.close()
+    return pending
+
+
+def timed(name, restart, config):
+    start = time.perf_counter()
+    pending = restart(config)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>9}: {elapsed:8.2f}s, {pending} urls to be downloaded")
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        config = make_config(os.path.join(workdir, "frontier.shelve"))
+        start = time.perf_counter()
+        pending = write_crawl(config, args.urls, args.pending)
+        print(f"wrote {args.urls} urls ({pending} pending) "
+              f"in {time.perf_counter() - start:.1f}s")
+        timed("original", original_restart, config)
+        timed("indexed", indexed_restart, config)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--pending", type=float, default=0.1)
+    main(parser.parse_args())
@@ -0,0 +1,54 @@
+''' Measures Frontier.add_url throughput with each save backend.
+
+    python benchmarks/bench_save_backends.py [--urls N]
+'''
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.frontier import Frontier
+from crawler.persistence import BACKENDS
+
+
+def make_config(save_file, backend):
+    return SimpleNamespace(
+        save_file=save_file, save_backend=backend, save_batch=256,
+        save_interval=1.0, seed_urls=["https://www.ics.uci.edu"],
+        time_delay=0.5, priority_weights={"depth": 1, "trap": 4},
+        host_budget=500, trap_detection=False, retry_limits={},
+        retry_backoff=60, retry_max_backoff=3600, frontier_window=100000, recrawl=False)
+
+
+def bench(backend, urls, workdir):
+    config = make_config(os.path.join(workdir, f"{backend}.shelve"), backend)
+    frontier = Frontier(config, True)
+    start = time.perf_counter()
+    for url in urls:
+        frontier.add_url(url)
+    frontier.save.sync()
+    elapsed = time.perf_counter() - start
+    frontier.resume.close()
+    frontier.save.close()
+    return len(urls) / elapsed
+
+
+def main(count):
+    urls = [
+        f"https://www.ics.uci.edu/~user{i % 500}/page{i}.html"
+        for i in range(count)]
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in BACKENDS:
+            rate = bench(backend, urls, workdir)
+            print(f"{backend:>8}: {rate:12.0f} add_url/s ({count} urls)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.urls)
@@ -0,0 +1,64 @@
+''' Compares memory and lookup speed of a set of url strings with SeenSet.
+
+    python benchmarks/bench_seen_set.py [--urls N]
+'''
+import os
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.seen_set import SeenSet
+
+
+def make_url(i):
+    return f"https://www.ics.uci.edu/~user{i % 500}/papers/page{i}.html"
+
+
+def build(factory, count):
+    # Urls are created while tracing, as a crawler would see them, so the
+    # set of str pays for keeping its strings alive.
+    tracemalloc.start()
+    seen = factory()
+    for i in range(count):
+        seen.add(make_url(i))
+    _, peak = tracemalloc.get_traced_memory()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seen, current, peak
+
+
+def lookups_per_second(seen, urls):
+    start = time.perf_counter()
+    for url in urls:
+        url in seen
+    return len(urls) / (time.perf_counter() - start)
+
+
+def main(count):
+    urls = [make_url(i) for i in range(count)]
+    misses = [f"{url}?miss" for url in urls]
+    candidates = {
+        "set of str": set,
+        "SeenSet(8)": lambda: SeenSet(8),
+        "SeenSet(16)": lambda: SeenSet(16),
+        "SeenSet(8)+bloom": lambda: SeenSet(8, bloom_bits=count * 10),
+    }
+    print(f"{count} urls")
+    for name, factory in candidates.items():
+        seen, current, peak = build(factory, count)
+        hits = lookups_per_second(seen, urls)
+        miss = lookups_per_second(seen, misses)
+        print(
+            f"{name:>17}: {current / count:6.1f} B/url "
+            f"(peak {peak / 2**20:7.1f} MiB), "
+            f"{hits:10.0f} hits/s, {miss:10.0f} misses/s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200000)
+    args = parser.parse_args()
+    main(args.urls)
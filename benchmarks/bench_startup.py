@@ -0,0 +1,134 @@
+''' Startup time of launch.py: import time of its modules (python -X
+importtime) and wall clock from starting it to the first request reaching
+the local stand-in cache server, for a fresh crawl (which registers), a
+resumed crawl with the registration cached and one without the cache.
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 12]
+'''
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_cache_server import add_server_arguments, server_from_arguments
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+CONFIG = """[IDENTIFICATION]
+USERAGENT = IR benchmark
+[CONNECTION]
+HOST = {host}
+PORT = {port}
+REGISTRATIONCACHE = {registration_cache}
+[CRAWLER]
+SEEDURL = {seeds}
+POLITENESS = 0.5
+[LOCAL PROPERTIES]
+SAVE = frontier.shelve
+SAVEBACKEND = log
+THREADCOUNT = 1
+"""
+
+
+def import_times():
+    ''' Returns (module, nesting level, cumulative microseconds) of every
+    module imported by launch.py. '''
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import launch"],
+        cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        text=True, check=True).stderr
+    modules = list()
+    for line in output.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            _, cumulative, indent, module = match.groups()
+            modules.append((module, len(indent) // 2, int(cumulative)))
+    return modules
+
+
+def first_request(server, workdir, config_file, restart, duration=0.0):
+    ''' Seconds from starting launch.py to the first request it sends to
+    the cache. The crawl is interrupted duration seconds later. '''
+    with server.lock:
+        server.requests.clear()
+    command = [sys.executable, os.path.join(ROOT, "launch.py"),
+               "--config_file", config_file]
+    if restart:
+        command.append("--restart")
+    start = time.time()
+    crawl = subprocess.Popen(
+        command, cwd=workdir, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    try:
+        while not server.requests and crawl.poll() is None:
+            time.sleep(0.002)
+        if not server.requests:
+            raise RuntimeError("launch.py exited before its first request.")
+        time.sleep(duration)
+        return server.requests[0][0] - start
+    finally:
+        crawl.send_signal(signal.SIGINT)
+        try:
+            crawl.wait(10)
+        except subprocess.TimeoutExpired:
+            crawl.kill()
+            crawl.wait()
+
+
+def main(args):
+    modules = import_times()
+    total = sum(cumulative for _, level, cumulative in modules if level == 0)
+    print(f"import time of launch.py and python startup: {total / 1000:.1f}ms")
+    heaviest = sorted(
+        (entry for entry in modules if 1 <= entry[1] <= 3),
+        key=lambda entry: -entry[2])[:args.top]
+    for module, level, cumulative in heaviest:
+        print(f"  {cumulative / 1000:7.1f}ms  {'  ' * (level - 1)}{module}")
+
+    server = server_from_arguments(args).start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            config_files = dict()
+            for name, registration_cache in (
+                    ("cached", "registration.json"), ("uncached", "")):
+                config_files[name] = os.path.join(workdir, f"{name}.ini")
+                with open(config_files[name], "w") as config:
+                    config.write(CONFIG.format(
+                        host=server.host, port=server.port,
+                        registration_cache=registration_cache,
+                        seeds=",".join(server.corpus.seed_urls)))
+            runs = {"fresh": [], "resumed, cached": [], "resumed, uncached": []}
+            for _ in range(args.runs):
+                runs["fresh"].append(first_request(
+                    server, workdir, config_files["cached"], True))
+            # Crawl long enough for the save file to hold pending urls.
+            first_request(server, workdir, config_files["cached"], True, 3.0)
+            for _ in range(args.runs):
+                runs["resumed, cached"].append(first_request(
+                    server, workdir, config_files["cached"], False))
+                runs["resumed, uncached"].append(first_request(
+                    server, workdir, config_files["uncached"], False))
+    finally:
+        server.stop()
+    print(f"time to first request, median of {args.runs}:")
+    for name, seconds in runs.items():
+        print(f"  {name:>18}: {1000 * statistics.median(seconds):7.1f}ms "
+              f"(min {1000 * min(seconds):.1f}ms)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    add_server_arguments(parser)
+    parser.set_defaults(latency=0.0, jitter=0.0, error_rate=0.0)
+    main(parser.parse_args())
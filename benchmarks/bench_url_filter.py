@@ -0,0 +1,135 @@
+''' Throughput of the compiled UrlFilter against the original is_valid on
+real-shaped urls, filtered one page (batch) at a time.
+
+    python benchmarks/bench_url_filter.py [--urls N] [--batch 100]
+'''
+import os
+import random
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.url_filter import UrlFilter, repeating_path
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "vision.ics.uci.edu", "sdcl.ics.uci.edu",
+    "wics.ics.uci.edu", "www.uci.edu", "www.eng.uci.edu", "github.com",
+    "www.youtube.com", "evoke.ics.uci.edu"]
+SEGMENTS = [
+    "~eppstein", "pubs", "people", "faculty", "research", "events",
+    "calendar", "wiki", "doku.php", "index.php", "news", "seminar", "2019",
+    "projects", "courses", "cs121", "files", "img"]
+EXTENSIONS = ["", "", "", ".html", ".htm", ".php", ".pdf", ".png", ".css"]
+QUERIES = [
+    "", "", "", "", "id=12", "do=edit&rev=3", "page=2",
+    "share=twitter&nb=1&utm=3&x=4", "tribe-bar-date=2019-03"]
+
+
+def make_urls(count, seed=0):
+    rand = random.Random(seed)
+    urls = list()
+    for _ in range(count):
+        path = "/".join(rand.choices(SEGMENTS, k=rand.randint(0, 7)))
+        url = f"{rand.choice(('https', 'http'))}://{rand.choice(HOSTS)}/{path}"
+        url += rand.choice(EXTENSIONS) if path else ""
+        query = rand.choice(QUERIES)
+        urls.append(f"{url}?{query}" if query else url)
+    return urls
+
+
+def legacy_filter():
+    ''' The original scraper.is_valid, with its unbounded counters. '''
+    tracked_urls = set()
+    redirect_tracking = Counter()
+    php_trap_counter = Counter()
+    url_trap_counter = Counter()
+
+    def is_valid(url):
+        parsed = urlparse(url)
+        allowed_subdomains = {"ics", "cs", "informatics", "stat"}
+        allowed_domains = {"uci.edu"}
+        netloc_parts = parsed.netloc.split('.')
+        if len(netloc_parts) < 2:
+            return False
+        if redirect_tracking[url] > 5:
+            return False
+        redirect_tracking[url] += 1
+        domain = ".".join(netloc_parts[-2:])
+        if domain not in allowed_domains:
+            return False
+        if len(netloc_parts) > 2 and netloc_parts[-3] not in allowed_subdomains:
+            return False
+        if repeating_path(parsed.path):
+            return False
+        if parsed.path.count("/") > 5:
+            return False
+        if re.search(r'\d{4}-\d{2}', url):
+            return False
+        if url in tracked_urls:
+            return False
+        if parsed.query.count("%") >= 3 or parsed.query.count("=") >= 3 or parsed.query.count("&") >= 3:
+            return False
+        if parsed.scheme not in {"http", "https"}:
+            return False
+        if re.match(r".*\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|pdf|docx|pptx|exe|zip|rar|gz)$", parsed.path.lower()):
+            return False
+        php_url = url.strip().split(".php")[0] + ".php"
+        if php_trap_counter[php_url] > 10:
+            return False
+        php_trap_counter[php_url] += 1
+        if url_trap_counter[parsed.netloc + parsed.path] > 10:
+            return False
+        url_trap_counter[parsed.netloc + parsed.path] += 1
+        return True
+
+    def filter_batch(urls):
+        valid = [url for url in urls if is_valid(url)]
+        tracked_urls.update(valid)
+        return valid
+
+    counters = (redirect_tracking, php_trap_counter, url_trap_counter)
+    return filter_batch, lambda: sum(len(counter) for counter in counters)
+
+
+def compiled_filter():
+    tracked_urls = set()
+    url_filter = UrlFilter(
+        {"uci.edu"}, {"ics", "cs", "informatics", "stat"},
+        is_tracked=tracked_urls.__contains__)
+
+    def filter_batch(urls):
+        valid = url_filter.filter(urls)
+        tracked_urls.update(valid)
+        return valid
+
+    return filter_batch, lambda: len(url_filter.revisits)
+
+
+def run(name, factory, urls, batch):
+    filter_batch, counter_entries = factory()
+    kept = 0
+    start = time.perf_counter()
+    for offset in range(0, len(urls), batch):
+        kept += len(filter_batch(urls[offset:offset + batch]))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>9}: {len(urls) / elapsed:10.0f} urls/s, kept {kept}, "
+          f"{counter_entries()} counter entries")
+
+
+def main(args):
+    urls = make_urls(args.urls)
+    run("original", legacy_filter, urls, args.batch)
+    run("compiled", compiled_filter, urls, args.batch)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=100)
+    main(parser.parse_args())
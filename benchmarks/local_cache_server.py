@@ -0,0 +1,264 @@
+''' Local stand-in for the spacetime cache server.
+
+Implements the same registration handshake (a spacetime dataframe holding
+utils.pcc_models.Register objects, answered with a load balancer tuple) and
+the same HTTP protocol as the real cache: GET /?q=<url>&u=<useragent>
+answered with a cbor dict holding url, status and either an error or a
+pickled requests.Response. Pages come from a synthetic link graph or from
+a recorded corpus, with configurable latency and injected 600-608 errors.
+
+    python benchmarks/local_cache_server.py --port 9000 --http-port 9001
+
+then point HOST/PORT in config.ini at localhost:9000.
+'''
+import json
+import os
+import pickle
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cbor
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spacetime import Node
+from utils.pcc_models import Register
+
+CACHE_ERRORS = {
+    600: "Request Malformed.",
+    601: "Download Exception.",
+    602: "Spacetime Server Failure.",
+    603: "URL scheme must be http or https.",
+    604: "Domain must be within specified domains.",
+    605: "Invalid file extension detected.",
+    606: "Cannot parse URL.",
+    607: "Content exceeds size limit.",
+    608: "Access denied by robots.txt.",
+}
+
+WORDS = (
+    "research student faculty graduate course lecture seminar computer "
+    "science informatics statistics software systems data learning network "
+    "security theory algorithm database vision language human interaction "
+    "project paper publication award department school university campus "
+    "event news alumni undergraduate program admission schedule office"
+).split()
+
+
+def serve_registrations(df, load_balancer):
+    ''' Spacetime app that hands load_balancer to every new Register. '''
+    while True:
+        try:
+            df.checkout_await(1)
+        except TimeoutError:
+            continue
+        changed = False
+        for reg in df.read_all(Register):
+            if not reg.load_balancer and not reg.invalid:
+                reg.load_balancer = tuple(load_balancer)
+                changed = True
+        if changed:
+            df.commit()
+
+
+class SyntheticCorpus(object):
+    ''' Deterministic pages on pages_per_host pages of each host, each
+    linking to fanout other pages, a few of them on other hosts. '''
+    def __init__(self, hosts, pages_per_host, fanout, seed=0):
+        self.hosts = hosts
+        self.pages_per_host = pages_per_host
+        self.fanout = fanout
+        self.seed = seed
+
+    @property
+    def seed_urls(self):
+        return [f"https://{host}" for host in self.hosts]
+
+    def _page_number(self, parsed):
+        if parsed.path in ("", "/"):
+            return 0
+        try:
+            return int(parsed.path.rsplit("/", 1)[-1].split(".")[0])
+        except ValueError:
+            return None
+
+    def get(self, url):
+        parsed = urlparse(url)
+        number = self._page_number(parsed)
+        if (parsed.netloc not in self.hosts or number is None
+                or not 0 <= number < self.pages_per_host):
+            return 404, {"content-type": "text/html"}, b"<html>Not Found</html>"
+        rand = random.Random(f"{self.seed}:{parsed.netloc}:{number}")
+        links = list()
+        for _ in range(self.fanout):
+            host = (
+                rand.choice(self.hosts) if rand.random() < 0.2
+                else parsed.netloc)
+            target = rand.randrange(self.pages_per_host)
+            links.append(
+                f'<a href="https://{host}/section{target % 10}/{target}.html">'
+                f'{rand.choice(WORDS)}</a>')
+        text = " ".join(rand.choice(WORDS) for _ in range(rand.randint(50, 800)))
+        body = (
+            f"<html><head><title>{parsed.netloc} {number}</title></head>"
+            f"<body><p>{text}</p>{''.join(links)}</body></html>")
+        return 200, {"content-type": "text/html"}, body.encode("utf-8")
+
+
+class RecordedCorpus(object):
+    ''' Pages replayed from a jsonl file of
+    {"url", "status", "headers", "content"} records. '''
+    def __init__(self, path):
+        self.pages = dict()
+        with open(path) as corpus:
+            for line in corpus:
+                record = json.loads(line)
+                self.pages[record["url"].rstrip("/")] = (
+                    record.get("status", 200),
+                    record.get("headers", {"content-type": "text/html"}),
+                    record["content"].encode("utf-8"))
+        self.seed_urls = list(self.pages)[:4]
+
+    def get(self, url):
+        return self.pages.get(
+            url.rstrip("/"),
+            (404, {"content-type": "text/html"}, b"<html>Not Found</html>"))
+
+
+def encode_response(url, status, headers, content):
+    raw = requests.models.Response()
+    raw.status_code = status
+    raw.url = url
+    raw.headers.update(headers)
+    raw.headers["content-length"] = str(len(content))
+    raw._content = content
+    raw.encoding = "utf-8"
+    return cbor.dumps({
+        "url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+class LocalCacheServer(object):
+    ''' Registration dataframe on port and HTTP cache on http_port.
+    Every answered request is recorded in self.requests as
+    (start, end, url, status). '''
+    def __init__(self, corpus, host="127.0.0.1", port=0, http_port=0,
+                 latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_codes=tuple(CACHE_ERRORS), seed=0):
+        self.corpus = corpus
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.random = random.Random(seed)
+        self.requests = list()
+        self.lock = threading.Lock()
+        self.http = ThreadingHTTPServer((host, http_port), self._handler())
+        self.http.daemon_threads = True
+        self.http_port = self.http.server_address[1]
+        self.node = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                start = time.time()
+                status, payload = server.answer(self.path)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with server.lock:
+                    server.requests.append(
+                        (start, time.time(), self.path, status))
+        return Handler
+
+    def answer(self, path):
+        query = parse_qs(urlparse(path).query)
+        url = query.get("q", [""])[0]
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.random.gauss(self.latency, self.jitter)))
+        if not url:
+            return 600, cbor.dumps(
+                {"url": url, "status": 600, "error": CACHE_ERRORS[600]})
+        if self.error_codes and self.random.random() < self.error_rate:
+            code = self.random.choice(self.error_codes)
+            return code, cbor.dumps(
+                {"url": url, "status": code, "error": CACHE_ERRORS[code]})
+        status, headers, content = self.corpus.get(url)
+        return status, encode_response(url, status, headers, content)
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        self.node = Node(
+            serve_registrations, server_port=self.port, Types=[Register])
+        self.node.daemon = True
+        self.node.start_async((self.host, self.http_port))
+        # The dataframe reports its bound address as (host, port).
+        self.port = self.node.details[1]
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+        if self.node is not None:
+            self.node.terminate()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Mean seconds added to every response.")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.02,
+                        help="Fraction of requests answered with a 6xx error.")
+    parser.add_argument("--error-codes", type=str,
+                        default=",".join(str(code) for code in CACHE_ERRORS))
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="Recorded jsonl corpus instead of synthetic pages.")
+    parser.add_argument("--hosts", type=str, default=(
+        "www.ics.uci.edu,www.cs.uci.edu,www.informatics.uci.edu,"
+        "www.stat.uci.edu,vision.ics.uci.edu,sdcl.ics.uci.edu"))
+    parser.add_argument("--pages-per-host", type=int, default=2000)
+    parser.add_argument("--fanout", type=int, default=20)
+
+
+def server_from_arguments(args, port=0, http_port=0):
+    if args.corpus:
+        corpus = RecordedCorpus(args.corpus)
+    else:
+        corpus = SyntheticCorpus(
+            args.hosts.split(","), args.pages_per_host, args.fanout)
+    error_codes = [int(code) for code in args.error_codes.split(",") if code]
+    return LocalCacheServer(
+        corpus, port=port, http_port=http_port, latency=args.latency,
+        jitter=args.jitter, error_rate=args.error_rate,
+        error_codes=error_codes)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--http-port", type=int, default=9001)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    server = server_from_arguments(args, args.port, args.http_port).start()
+    print(f"Registration on {server.host}:{server.port}, "
+          f"cache on {server.host}:{server.http_port}, "
+          f"seeds {','.join(server.corpus.seed_urls)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,465 @@
+''' Microbenchmarks of the crawler's hot paths over the checked-in corpus in
+benchmarks/corpus, with regression tracking against a stored baseline.
+
+    python benchmarks/suite.py [--only extract_next_links,is_valid] [--repeat 5]
+        [--threads 4] [--output results.json] [--baseline benchmarks/baseline.json]
+        [--tolerance 0.3] [--update-baseline] [--make-corpus]
+
+Each case reports its throughput, the best of --repeat timings, and from
+one more run under tracemalloc the peak memory it allocated and the bytes
+per operation it kept. Results are written as JSON to --output and compared
+with --baseline: a case whose throughput fell, or whose allocations grew, by
+more than --tolerance is reported as a regression and the suite exits with
+status 1. Throughput depends on the machine, so the baseline is only
+meaningful where it was recorded; refresh it with --update-baseline.
+
+--make-corpus regenerates the corpus (html pages and a url list) from its
+fixed seed.
+'''
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from threading import Thread
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.frontier import Frontier
+from utils import get_urlhash, normalize, normalize_all
+from utils.canonical import Canonicalizer
+from utils.crawl_log import CrawlLog
+from utils.near_dup import NearDupIndex
+from utils.statistics import CrawlStatistics
+from utils.url_filter import UrlFilter, repeating_path
+import scraper
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Cases without state are run in a loop for at least this long per timing.
+MIN_SAMPLE = 0.2
+# Allocation changes under these are noise, whatever the tolerance.
+PEAK_SLACK_KB = 64
+RETAINED_SLACK = 16
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "vision.ics.uci.edu", "sdcl.ics.uci.edu",
+    "wics.ics.uci.edu", "www.uci.edu", "www.eng.uci.edu", "github.com",
+    "www.youtube.com", "evoke.ics.uci.edu"]
+SEGMENTS = [
+    "~eppstein", "pubs", "people", "faculty", "research", "events",
+    "calendar", "wiki", "doku.php", "index.php", "news", "seminar", "2019",
+    "projects", "courses", "cs121", "files", "img"]
+EXTENSIONS = ["", "", "", ".html", ".htm", ".php", ".pdf", ".png", ".css"]
+QUERIES = [
+    "", "", "", "", "id=12", "do=edit&rev=3", "page=2",
+    "share=twitter&nb=1&utm=3&x=4", "tribe-bar-date=2019-03"]
+WORDS = (
+    "research student faculty graduate course lecture seminar computer "
+    "science informatics statistics software systems data learning network "
+    "security theory algorithm database vision language human interaction "
+    "the of and to in for with on by about from"
+).split()
+
+
+def make_url(rand):
+    path = "/".join(rand.choices(SEGMENTS, k=rand.randint(0, 7)))
+    url = f"{rand.choice(('https', 'http'))}://{rand.choice(HOSTS)}/{path}"
+    url += rand.choice(EXTENSIONS) if path else ""
+    query = rand.choice(QUERIES)
+    return f"{url}?{query}" if query else url
+
+
+def make_link(rand, index):
+    # Half absolute urls, half relative links with a fragment.
+    if rand.random() < 0.5:
+        return make_url(rand)
+    return f"/{rand.choice(SEGMENTS)}/p{rand.randrange(1000)}.html#s{index}"
+
+
+def make_page(rand, index):
+    anchors = "".join(
+        f"<li><a href='{make_link(rand, i)}'>{rand.choice(WORDS)}</a></li>"
+        for i in range(rand.randint(20, 150)))
+    paragraphs = "".join(
+        f"<div class='c{i}'><h2>{' '.join(rand.choices(WORDS, k=4))}</h2>"
+        f"<p>{' '.join(rand.choices(WORDS, k=rand.randint(20, 120)))}</p></div>"
+        for i in range(rand.randint(5, 25)))
+    return (
+        f"<!DOCTYPE html>\n<html><head><title>page {index}</title>"
+        "<script>var a = [1, 2, 3];</script>"
+        "<style>p { margin: 0 }</style></head><body>"
+        f"<nav><ul>{anchors}</ul></nav>{paragraphs}</body></html>\n")
+
+
+def make_corpus(pages=24, urls=4000, seed=0):
+    rand = random.Random(seed)
+    os.makedirs(os.path.join(CORPUS_DIR, "pages"), exist_ok=True)
+    for index in range(pages):
+        with open(os.path.join(CORPUS_DIR, "pages", f"page{index:02}.html"), "w") as fp:
+            fp.write(make_page(rand, index))
+    with open(os.path.join(CORPUS_DIR, "urls.txt"), "w") as fp:
+        fp.write("".join(f"{make_url(rand)}\n" for _ in range(urls)))
+
+
+def load_corpus():
+    pages_dir = os.path.join(CORPUS_DIR, "pages")
+    pages = list()
+    for name in sorted(os.listdir(pages_dir)):
+        with open(os.path.join(pages_dir, name), "rb") as fp:
+            pages.append((f"https://www.ics.uci.edu/corpus/{name}", fp.read()))
+    with open(os.path.join(CORPUS_DIR, "urls.txt")) as fp:
+        urls = fp.read().split()
+    return SimpleNamespace(pages=pages, urls=urls)
+
+
+class Case(object):
+    ''' run() does ops operations. reset(), if any, is called untimed
+    before every run and close() once after the last. A case without
+    reset can run several times in a row. '''
+    def __init__(self, ops, run, reset=None, close=None):
+        self.ops = ops
+        self.run = run
+        self.loops = 1 if reset else None
+        self.reset = reset or (lambda: None)
+        self.close = close or (lambda: None)
+
+
+CASES = dict()
+
+
+def case(function):
+    CASES[function.__name__] = function
+    return function
+
+
+def fresh_url_filter():
+    return UrlFilter(
+        scraper.ALLOWED_DOMAINS, scraper.ALLOWED_SUBDOMAINS,
+        is_tracked=lambda url: url in scraper.tracked_urls)
+
+
+def fresh_scraper_state():
+    scraper.near_duplicates = NearDupIndex(k=3)
+    scraper.statistics = CrawlStatistics(top_k=50)
+    scraper.url_filter = fresh_url_filter()
+    # Nothing is restored from the files earlier cases left behind.
+    scraper.output_loaded = True
+
+
+@case
+def extract_next_links(corpus, args):
+    responses = [
+        (url, SimpleNamespace(status=200, body=memoryview(body)))
+        for url, body in corpus.pages]
+
+    def run():
+        for url, resp in responses:
+            scraper.extract_next_links(url, resp)
+    return Case(len(responses), run, fresh_scraper_state)
+
+
+@case
+def is_valid(corpus, args):
+    def run():
+        for url in corpus.urls:
+            scraper.is_valid(url)
+    return Case(len(corpus.urls), run, fresh_scraper_state)
+
+
+@case
+def repeating_path_check(corpus, args):
+    paths = [urlparse(url).path for url in corpus.urls]
+
+    def run():
+        for path in paths:
+            repeating_path(path)
+    return Case(len(paths), run)
+
+
+def fingerprints(count, seed):
+    rand = random.Random(seed)
+    return [(rand.randbytes(8), rand.getrandbits(64)) for _ in range(count)]
+
+
+@case
+def simhash_insert(corpus, args):
+    pages = fingerprints(len(corpus.urls), 1)
+    state = SimpleNamespace(index=None)
+
+    def reset():
+        state.index = NearDupIndex(k=3)
+
+    def run():
+        for checksum, fingerprint in pages:
+            state.index.is_duplicate(checksum, fingerprint)
+    return Case(len(pages), run, reset)
+
+
+@case
+def simhash_lookup(corpus, args):
+    index = NearDupIndex(k=3)
+    for checksum, fingerprint in fingerprints(len(corpus.urls), 1):
+        index.is_duplicate(checksum, fingerprint)
+    # Mostly misses, as for a crawler, and near copies of stored pages.
+    rand = random.Random(2)
+    probes = [
+        fingerprint ^ (1 << rand.randrange(64)) if rand.random() < 0.1
+        else rand.getrandbits(64)
+        for _, fingerprint in fingerprints(len(corpus.urls), 1)]
+
+    def run():
+        for fingerprint in probes:
+            index._near(fingerprint)
+    return Case(len(probes), run)
+
+
+@case
+def save_to_output(corpus, args):
+    saves = 10
+
+    def reset():
+        fresh_scraper_state()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for url, body in corpus.pages:
+                links = scraper.extract_next_links(
+                    url, SimpleNamespace(status=200, body=memoryview(body)))
+                scraper.track_urls(links)
+
+    def run():
+        for _ in range(saves):
+            scraper.save_to_output()
+    return Case(saves, run, reset)
+
+
+@case
+def crawl_log_record(corpus, args):
+    log = CrawlLog("crawl_log", summary_interval=3600)
+    log.logger.disabled = True
+
+    def reset():
+        # Let the writer catch up, so queued records are not counted.
+        while not log.queue.empty():
+            time.sleep(0.001)
+
+    def run():
+        for url in corpus.urls:
+            log.record("fetch", url, 200, 0.1)
+    return Case(len(corpus.urls), run, reset, log.close)
+
+
+@case
+def url_hash(corpus, args):
+    def run():
+        for url in corpus.urls:
+            get_urlhash(url)
+    return Case(len(corpus.urls), run)
+
+
+@case
+def url_normalize(corpus, args):
+    def run():
+        for url in corpus.urls:
+            normalize(url)
+    return Case(len(corpus.urls), run)
+
+
+@case
+def url_normalize_batch(corpus, args):
+    pages = [corpus.urls[start:start + 80] for start in range(0, len(corpus.urls), 80)]
+
+    def run():
+        for page in pages:
+            normalize_all(page)
+    return Case(len(corpus.urls), run)
+
+
+@case
+def url_canonicalize_uncached(corpus, args):
+    canonicalize = Canonicalizer()._canonicalize
+
+    def run():
+        for url in corpus.urls:
+            canonicalize(url)
+    return Case(len(corpus.urls), run)
+
+
+@case
+def frontier_contention(corpus, args):
+    ''' args.threads threads each adding their share of the urls, found on
+    a page of the previous one, then draining the frontier. '''
+    urls = sorted(set(corpus.urls))
+    shares = [urls[thread::args.threads] for thread in range(args.threads)]
+    config = SimpleNamespace(
+        save_file=None, save_backend="log", save_batch=4096,
+        save_interval=60.0, seed_urls=[], time_delay=0,
+        priority_weights={"depth": 1, "host": 1, "inlinks": 1, "trap": 4},
+        host_budget=500, trap_detection=False, retry_limits={},
+        retry_backoff=60, retry_max_backoff=3600, frontier_window=100000, recrawl=False)
+    state = SimpleNamespace(frontier=None, runs=0)
+
+    def close():
+        if state.frontier is not None:
+            state.frontier.close()
+
+    def reset():
+        close()
+        # A new save file every run, so there is none to delete.
+        state.runs += 1
+        config.save_file = f"frontier{state.runs}.shelve"
+        state.frontier = Frontier(config, True)
+
+    def work(share):
+        frontier = state.frontier
+        parent = None
+        for url in share:
+            frontier.add_url(url, parent)
+            parent = url
+        while True:
+            url, _ = frontier.try_get_tbd_url()
+            if url is None:
+                break
+            frontier.mark_url_complete(url)
+
+    def run():
+        threads = [Thread(target=work, args=(share,)) for share in shares]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return Case(2 * len(urls), run, reset, close)
+
+
+def timed(bench, loops):
+    bench.reset()
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            bench.run()
+        return (time.perf_counter() - start) / loops
+    finally:
+        gc.enable()
+
+
+def measure(bench, repeat):
+    loops = bench.loops
+    if loops is None:
+        # Double the runs per timing until it takes MIN_SAMPLE.
+        loops = 1
+        while timed(bench, loops) * loops < MIN_SAMPLE:
+            loops *= 2
+    best = min(timed(bench, loops) for _ in range(repeat))
+    bench.reset()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        bench.run()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        bench.close()
+    return {
+        "ops": bench.ops,
+        "ops_per_sec": bench.ops / best,
+        "peak_kb": peak / 1024,
+        "retained_bytes_per_op": retained / bench.ops}
+
+
+def regressions(name, result, baseline, tolerance):
+    if baseline is None:
+        return []
+    found = list()
+    if result["ops_per_sec"] < baseline["ops_per_sec"] * (1 - tolerance):
+        found.append(
+            f"throughput {result['ops_per_sec']:.0f} ops/s, baseline "
+            f"{baseline['ops_per_sec']:.0f}")
+    if (result["peak_kb"] > baseline["peak_kb"] * (1 + tolerance)
+            and result["peak_kb"] - baseline["peak_kb"] > PEAK_SLACK_KB):
+        found.append(
+            f"peak {result['peak_kb']:.0f}KB, baseline {baseline['peak_kb']:.0f}KB")
+    if (result["retained_bytes_per_op"] > baseline["retained_bytes_per_op"] * (1 + tolerance)
+            and result["retained_bytes_per_op"] - baseline["retained_bytes_per_op"] > RETAINED_SLACK):
+        found.append(
+            f"retained {result['retained_bytes_per_op']:.0f}B/op, baseline "
+            f"{baseline['retained_bytes_per_op']:.0f}B/op")
+    return [f"{name}: {message}" for message in found]
+
+
+def main(args):
+    if args.make_corpus:
+        make_corpus()
+    corpus = load_corpus()
+    names = args.only.split(",") if args.only else list(CASES)
+    baseline = dict()
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)["cases"]
+    results = dict()
+    failures = list()
+    print(f"{'case':>26} {'ops/s':>12} {'vs base':>8} {'peak KB':>9} {'kept B/op':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        # Output files, logs and save files of the cases stay in workdir.
+        os.chdir(workdir)
+        try:
+            for name in names:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = measure(CASES[name](corpus, args), args.repeat)
+                results[name] = result
+                base = baseline.get(name)
+                change = (
+                    f"{result['ops_per_sec'] / base['ops_per_sec'] - 1:+.0%}"
+                    if base else "-")
+                print(f"{name:>26} {result['ops_per_sec']:>12.0f} {change:>8} "
+                      f"{result['peak_kb']:>9.0f} "
+                      f"{result['retained_bytes_per_op']:>10.1f}")
+                failures += regressions(name, result, base, args.tolerance)
+        finally:
+            os.chdir(cwd)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "threads": args.threads,
+        "cases": results}
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fp:
+                report["cases"] = dict(json.load(fp)["cases"], **results)
+        with open(args.baseline, "w") as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+        print(f"Baseline written to {args.baseline}.")
+    if failures:
+        print("\nREGRESSIONS:", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--only", default="", help=f"Any of {', '.join(CASES)}.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--output", default="")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--make-corpus", action="store_true")
+    main(parser.parse_args())
@@ -1,12 +1,37 @@
-from utils import get_logger
+from utils import canonical, get_logger, log_pipeline
+from utils.crawl_log import close_crawl_log, open_crawl_log
 from crawler.frontier import Frontier
-from crawler.worker import Worker
+from crawler.worker import Worker, catch_interrupts, interrupted
+from crawler.async_worker import AsyncWorker
+from crawler.parse_pool import shutdown_parse_stage
+from crawler.concurrency import reset_controller
+from crawler.page_store import close_page_store
+import scraper
+
+# ShardedCrawler is imported at the end, crawler.shards imports Crawler.
+__all__ = ["Crawler", "ShardedCrawler", "ENGINES"]
+
+# How often join checks for an interrupt while the workers run.
+JOIN_POLL = 0.5
+
+# Worker factories selectable with ENGINE in config.ini or --engine.
+ENGINES = {
+    "threads": Worker,
+    "asyncio": AsyncWorker,
+}
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        catch_interrupts()
+        log_pipeline.configure(config.console_rate)
+        open_crawl_log(config)
+        canonical.configure(config.strip_params, config.index_pages)
+        # Before the frontier, so that its lock is timed.
+        start_metrics(config)
         self.frontier = frontier_factory(config, restart)
+        watch_frontier(self.frontier)
         self.workers = list()
         self.worker_factory = worker_factory
 
@@ -23,4 +48,21 @@ class Crawler(object):
 
     def join(self):
         for worker in self.workers:
-            worker.join()
+            while worker.is_alive():
+                worker.join(JOIN_POLL)
+                if interrupted.is_set():
+                    self.frontier.stop()
+        shutdown_parse_stage()
+        # After the parse stage, whose last pages still complete urls.
+        self.frontier.close()
+        if interrupted.is_set():
+            scraper.print_statistics()
+            print("Process paused.")
+        close_page_store()
+        close_crawl_log()
+        stop_metrics()
+        reset_controller()
+
+
+from crawler.shards import ShardedCrawler
+from crawler.instrumentation import start_metrics, stop_metrics, watch_frontier
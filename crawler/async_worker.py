@@ -0,0 +1,155 @@
+import asyncio
+import time
+from threading import Thread
+
+from crawler.concurrency import get_controller
+from crawler.page_store import get_page_store
+from crawler.parse_pool import get_parse_stage
+from crawler.retry import classify
+from crawler.worker import check_scraper_source, interrupted
+from utils.async_download import ConnectionPool, download_async
+from utils import crawl_log, get_logger
+import scraper
+
+# How often a fetch loop retries for a slot under the adaptive limit.
+SLOT_POLL = 0.01
+
+
+class AsyncWorker(Thread):
+    ''' Runs config.async_concurrency fetch loops on one asyncio event loop,
+    sharing a keep-alive connection pool to the cache server. Politeness is
+    still enforced per host by the frontier. '''
+    def __init__(self, worker_id, config, frontier):
+        self.logger = get_logger(f"AsyncWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        self.in_flight = 0
+        self.word_statistics = {}
+        self.max_word_count_url = ""
+        self.max_word_count = 0
+        self.parse_stage = get_parse_stage(config, frontier)
+        self.controller = get_controller(config, frontier)
+        self.page_store = get_page_store(config)
+        check_scraper_source()
+        super().__init__(daemon=True)
+
+    def run(self):
+        try:
+            asyncio.run(self._crawl())
+            # Print final statistics when crawling is complete, an
+            # interrupted crawl prints them on the main thread.
+            if not interrupted.is_set():
+                scraper.print_statistics()
+        except Exception as error:
+            scraper.print_statistics()  # Print statistics on unexpected error
+            self.logger.error(f"Unexpected error: {error}")
+
+    async def _crawl(self):
+        host, port = self.config.cache_server
+        pool = ConnectionPool(host, port, self.config.async_concurrency)
+        try:
+            await asyncio.gather(*[
+                self._fetch_loop(pool)
+                for _ in range(self.config.async_concurrency)])
+        finally:
+            pool.close()
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    async def _next_url(self):
+        while True:
+            url, wait = self.frontier.try_get_tbd_url()
+            if url:
+                return url
+            if wait is None:
+                if not self.in_flight and not (
+                        self.parse_stage and self.parse_stage.pending):
+                    return None
+                # Fetches still in flight may add more urls.
+                wait = self.config.time_delay
+            await asyncio.sleep(wait)
+
+    async def _fetch_loop(self, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            tbd_url = await self._next_url()
+            if not tbd_url:
+                break
+            self.in_flight += 1
+            try:
+                fetch_start = time.time()
+                response = await self._fetch(pool, tbd_url)
+                crawl_log.record(
+                    "fetch", tbd_url, response.status, time.time() - fetch_start)
+                if self.page_store:
+                    # Compressing is blocking, keep it off the event loop.
+                    await loop.run_in_executor(
+                        None, self.page_store.add, tbd_url, response)
+                if response.status != 200:
+                    self.frontier.fail_url(tbd_url, classify(response.status))
+                else:
+                    # Parsing is blocking, keep it off the event loop.
+                    await loop.run_in_executor(
+                        None, self._process, tbd_url, response)
+            except asyncio.TimeoutError:
+                crawl_log.record(
+                    "timeout", tbd_url,
+                    detail=f"passed its {self.config.fetch_deadline}s deadline")
+                self.frontier.fail_url(tbd_url, "timeout")
+            except Exception as error:
+                self.logger.error(f"An exception occurred: {error}")
+                crawl_log.record("error", tbd_url, detail=str(error))
+                self.frontier.fail_url(tbd_url, classify(error=error))
+            finally:
+                self.frontier.release_url(tbd_url)
+                self.in_flight -= 1
+            await self.politeness_sleep()
+
+    async def _fetch(self, pool, url):
+        ''' Downloads url, within the adaptive concurrency limit if any. '''
+        if self.controller is None:
+            return await download_async(
+                url, self.config, pool, self.logger, self.config.fetch_deadline)
+        while not self.controller.try_acquire():
+            await asyncio.sleep(SLOT_POLL)
+        fetch_start = time.time()
+        status = None
+        timed_out = False
+        try:
+            response = await download_async(
+                url, self.config, pool, self.logger, self.config.fetch_deadline)
+            status = response.status
+            return response
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.controller.release(
+                url, time.time() - fetch_start, status, timed_out)
+
+    async def politeness_sleep(self):
+        # The adaptive controller paces hosts through the frontier instead.
+        if self.controller is None:
+            await asyncio.sleep(self.config.time_delay)
+
+    def _process(self, tbd_url, response):
+        if not scraper.accept_response(response):
+            # Nothing to parse, nor to hash for the recrawl index.
+            self.frontier.unchanged(tbd_url, response, accepted=False)
+            self.frontier.mark_url_complete(tbd_url)
+            return
+        if self.frontier.unchanged(tbd_url, response):
+            crawl_log.record("unchanged", tbd_url)
+            self.frontier.mark_url_complete(tbd_url, unchanged=True)
+            return
+        if self.parse_stage:
+            scraper.initialize(
+                self.word_statistics, self.max_word_count_url,
+                self.max_word_count)
+            self.parse_stage.submit(tbd_url, response)
+            return
+        extracted_urls = scraper.scraper(
+            tbd_url, response, self.word_statistics,
+            self.max_word_count_url, self.max_word_count)
+        for extracted_url in extracted_urls:
+            self.frontier.add_url(extracted_url, tbd_url)
+        self.frontier.mark_url_complete(tbd_url)
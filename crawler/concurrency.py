@@ -0,0 +1,150 @@
+import time
+from threading import Condition, Lock
+
+from utils import get_logger
+
+# Multiplicative decrease of the fetcher limit, and of a host's pacing.
+BACKOFF = 0.5
+# The limit is reconsidered once this many fetches, or the limit if more,
+# completed since the last decision.
+MIN_WINDOW = 8
+# Pacing of a failing host grows at most to this many seconds.
+MAX_HOST_DELAY = 30.0
+# Pacing steps when POLITENESS is zero.
+MIN_HOST_STEP = 0.1
+# Cache server statuses meaning it is overloaded (602: spacetime server
+# failure), and ones meaning the origin host failed (601: download
+# exception). Other 6xx reject the url itself and are neither.
+SERVER_ERRORS = {602}
+HOST_ERRORS = {601}
+
+
+class ConcurrencyController(object):
+    ''' AIMD control of how many fetches run at once and of per-host pacing.
+
+    Workers take a slot with acquire (or try_acquire) before downloading
+    and give it back with release. Each window of completed fetches the
+    limit grows by one, or is halved if the window's p90 latency was over
+    target_latency or more than max_error_rate of its fetches timed out,
+    raised or got a SERVER_ERRORS status. Fetches that started before a
+    decrease are left out of the next decision, so one slow burst is not
+    punished twice.
+
+    A host whose fetch times out or gets a 5xx or HOST_ERRORS status has
+    its pacing doubled, and every other fetch takes one POLITENESS step
+    off again. Pacing is applied by the frontier, which never lets it go
+    below POLITENESS. '''
+    def __init__(self, config, frontier, max_fetchers):
+        self.logger = get_logger("CONCURRENCY")
+        self.frontier = frontier
+        self.floor = config.time_delay
+        self.step = max(config.time_delay, MIN_HOST_STEP)
+        self.target_latency = config.target_latency
+        self.max_error_rate = config.max_error_rate
+        self.max_limit = max(1, max_fetchers)
+        self.limit = max(1, self.max_limit // 2)
+        self.active = 0
+        self.slots = Condition(Lock())
+        self.window = list()
+        self.window_errors = 0
+        self.decreased_at = 0.0
+        # Pacing of hosts above POLITENESS.
+        self.host_delays = dict()
+
+    def acquire(self):
+        with self.slots:
+            self.slots.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    def try_acquire(self):
+        with self.slots:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def release(self, url, latency, status=None, timed_out=False):
+        ''' Returns the slot of a fetch of url that took latency seconds and
+        got status, None if it raised. '''
+        overloaded = timed_out or status is None or status in SERVER_ERRORS
+        host_error = timed_out or status in HOST_ERRORS or (
+            status is not None and 500 <= status < 600)
+        self._pace(url, host_error, status, timed_out)
+        with self.slots:
+            self.active -= 1
+            if time.time() - latency >= self.decreased_at:
+                self.window.append(latency)
+                self.window_errors += overloaded
+                if len(self.window) >= max(self.limit, MIN_WINDOW):
+                    self._decide()
+            self.slots.notify_all()
+
+    def _decide(self):
+        # Called with self.slots held.
+        fetches = len(self.window)
+        latency = sorted(self.window)[int(0.9 * (fetches - 1))]
+        error_rate = self.window_errors / fetches
+        self.window = list()
+        self.window_errors = 0
+        old_limit = self.limit
+        if error_rate > self.max_error_rate or latency > self.target_latency:
+            self.limit = max(1, int(self.limit * BACKOFF))
+            self.decreased_at = time.time()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+        if self.limit != old_limit:
+            self.logger.info(
+                f"Fetchers {old_limit} -> {self.limit}: p90 latency "
+                f"{latency:.3f}s, error rate {error_rate:.2f} over the last "
+                f"{fetches} fetches.")
+
+    def _pace(self, url, error, status, timed_out):
+        domain = self.frontier.get_domain(url)
+        with self.slots:
+            delay = self.host_delays.get(domain, self.floor)
+            if error:
+                new_delay = min(MAX_HOST_DELAY, max(delay, self.step) / BACKOFF)
+            else:
+                new_delay = max(self.floor, delay - self.step)
+            if new_delay > self.floor:
+                self.host_delays[domain] = new_delay
+            else:
+                self.host_delays.pop(domain, None)
+        if new_delay == delay:
+            return
+        self.frontier.set_host_delay(domain, new_delay)
+        if error:
+            reason = "timeout" if timed_out else f"status {status}"
+            self.logger.info(
+                f"Pacing {domain} at {new_delay:.2f}s after {reason}.")
+        elif new_delay == self.floor:
+            self.logger.info(f"Pacing {domain} back at politeness.")
+
+
+shared_controller = None
+shared_lock = Lock()
+
+
+def max_fetchers(config):
+    if config.engine == "asyncio":
+        return config.threads_count * config.async_concurrency
+    return config.threads_count
+
+
+def get_controller(config, frontier):
+    ''' The ConcurrencyController shared by all workers, or None when
+    ADAPTIVE is off and every worker fetches without limit. '''
+    global shared_controller
+    if not config.adaptive:
+        return None
+    with shared_lock:
+        if shared_controller is None:
+            shared_controller = ConcurrencyController(
+                config, frontier, max_fetchers(config))
+        return shared_controller
+
+
+def reset_controller():
+    global shared_controller
+    with shared_lock:
+        shared_controller = None
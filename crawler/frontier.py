@@ -1,85 +1,388 @@
-import os
-import shelve
 import time
+from heapq import heappush, heappop
+from itertools import chain, count
 from urllib.parse import urlparse
 
-from threading import RLock
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from threading import RLock, Condition
+from utils import get_logger, get_urlhash, metrics, normalize
+from utils.seen_set import SeenSet
+from utils.url_filter import LRUCache
+import scraper
+from scraper import in_scope
+from crawler.persistence import get_backend
+from crawler.priority import HostQueue, Scorer
+from crawler.recrawl import RecrawlIndex
+from crawler.resume import ResumeIndex
+from crawler.retry import FAILED, RetryQueue
+from crawler.spill import SpillQueue
+from crawler.traps import TrapDetector
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        self.lock = RLock() 
+        # Pending urls, one priority queue per host, best first. At most
+        # config.frontier_window of them are kept here, the others wait in
+        # self.spill and are moved back in batches as these run low.
+        self.to_be_downloaded = dict()
+        self.tbd_count = 0
+        self.window = config.frontier_window
+        self.spill = SpillQueue(f"{config.save_file}.spill")
+        self.scorer = Scorer(config.priority_weights, config.host_budget)
+        self.sequence = count()
+        # Heap of (next allowed fetch time, host) for every host with
+        # pending urls that is still in its politeness window.
+        self.ready_hosts = list()
+        # Heap of (best pending priority, host) for hosts whose window has
+        # passed, and the set of those hosts. Entries whose priority is no
+        # longer the host's best are skipped.
+        self.best_hosts = list()
+        self.open_hosts = set()
+        # Heap of (due time, seq, url, depth, inlinks) of failed urls waiting
+        # for their retry, see fail_url.
+        self.retry_heap = list()
+        self.lock = metrics.timed_lock(RLock(), "frontier.lock")
+        self.host_ready = Condition(self.lock)
+        # Set by stop, nothing more is handed out.
+        self.stopped = False
         self.domains_last_accessed = {}
-        if not os.path.exists(self.config.save_file) and not restart:
+        # Pacing of hosts slowed down beyond POLITENESS, see set_host_delay.
+        self.host_delays = dict()
+        self.host_fetches = dict()
+        # Depth of urls handed out, for the depth of the links they contain.
+        self.fetched_depths = LRUCache(1 << 16)
+        # Every url ever added, checked before touching the save file.
+        self.seen = SeenSet(bloom_bits=1 << 23)
+        # Prunes url templates whose pages stop yielding anything new.
+        self.traps = None
+        if config.trap_detection:
+            self.traps = TrapDetector(
+                config.trap_file, config.trap_report, config.trap_samples,
+                config.trap_min_yield, restart)
+            scraper.page_observers.append(self.traps.observe_page)
+        backend = get_backend(self.config.save_backend)
+        if not backend.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif backend.exists(self.config.save_file) and restart:
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            backend.remove(self.config.save_file)
+        if restart or not backend.exists(self.config.save_file):
+            # The resume index is only valid next to its save file.
+            ResumeIndex.remove(self.config.save_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = backend(self.config)
+        self.resume = ResumeIndex(self.config)
+        self.retries = RetryQueue(self.config, restart)
+        # Metadata of every fetched page, to skip unchanged ones on a
+        # recrawl, see crawler/recrawl.py.
+        self.recrawl = None
+        if config.recrawl:
+            self.recrawl = RecrawlIndex(config, restart)
+            scraper.parse_observers.append(self.recrawl.observe_parse)
         if restart:
+            self.resume.create(self.seen, [])
             for url in self.config.seed_urls:
                 self.add_url(url)
+        elif ResumeIndex.exists(self.config.save_file):
+            # Only the pending urls are read, the save file is left alone.
+            self._load_resume_index()
         else:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
+            self.resume.create(self.seen, chain(
+                (entry for queue in self.to_be_downloaded.values()
+                 for entry in queue),
+                self.spill,
+                (entry[2:] for entry in self.retry_heap)))
             if not self.save:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+        if self.recrawl is not None and not restart:
+            self._queue_recrawl()
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        retry_due = {url: due for due, url in self.retries.pending()}
+        with self.lock:
+            for url, completed in self.save.values():
+                self.seen.add(url)
+                if not completed and in_scope(url):
+                    self._queue_pending(url, 0, 0, retry_due)
+                    tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    def _load_resume_index(self):
+        pending = self.resume.load()
+        self.seen = self.resume.seen
+        tbd_count = 0
+        retry_due = {url: due for due, url in self.retries.pending()}
+        with self.lock:
+            for url, depth, inlinks in pending:
+                if in_scope(url):
+                    self._queue_pending(url, depth, inlinks, retry_due)
+                    tbd_count += 1
+        self.logger.info(
+            f"Found {tbd_count} urls to be downloaded from {len(self.seen)} "
+            f"total urls discovered, using the resume index.")
+
+    def _queue_recrawl(self):
+        ''' Queues the completed urls due for another fetch. Permanently
+        failed urls are left alone. '''
+        now = time.time()
+        completed_count = 0
+        due_count = 0
+        with self.lock:
+            for url, completed in self.save.values():
+                if not completed or not in_scope(url):
+                    continue
+                completed_count += 1
+                entry = self.retries.entries.get(url)
+                if entry is not None and entry[0] == FAILED:
+                    continue
+                if not self.recrawl.due(url, now):
+                    continue
+                self.save[get_urlhash(url)] = (url, False)
+                self._queue_url(url, self.recrawl.depth(url), 0)
+                due_count += 1
+            if due_count:
+                # The resume index has these urls as completed for good.
+                self.resume.create(self.seen, chain(
+                    (entry for queue in self.to_be_downloaded.values()
+                     for entry in queue),
+                    self.spill,
+                    (entry[2:] for entry in self.retry_heap)))
+        self.logger.info(
+            f"Queued {due_count} of {completed_count} completed urls for "
+            f"a recrawl.")
+
+    def _queue_pending(self, url, depth, inlinks, retry_due):
+        # A url that failed before the restart waits for its retry.
+        due = retry_due.get(url)
+        if due is None:
+            self._queue_url(url, depth, inlinks)
+        else:
+            heappush(self.retry_heap, (
+                due, next(self.sequence), url, depth, inlinks))
+
+    def _queue_url(self, url, depth=0, inlinks=0):
+        # A new pending url, spilled to disk once the window is full.
+        if self.window and self.tbd_count >= self.window:
+            self.spill.push(url, depth, inlinks)
+        else:
+            self._push_url(url, depth, inlinks)
+
+    def _refill(self):
+        ''' Moves spilled urls back until the window is full. '''
+        for url, depth, inlinks in self.spill.pop_batch(self.window - self.tbd_count):
+            self._push_url(url, depth, inlinks)
+
+    def _push_url(self, url, depth=0, inlinks=0, domain=None):
+        ''' Queue url under its host, or re-prioritize it if already
+        queued, scheduling the host if it was idle. '''
+        domain = domain or self.get_domain(url)
+        queue = self.to_be_downloaded.get(domain)
+        if queue is None:
+            queue = self.to_be_downloaded[domain] = HostQueue()
+            heappush(self.ready_hosts, (self._next_allowed(domain), domain))
+            self.host_ready.notify()
+        if url not in queue:
+            self.tbd_count += 1
+        priority = self.scorer(
+            url, depth, inlinks, self.host_fetches.get(domain, 0))
+        queue.push(url, priority, next(self.sequence), depth, inlinks)
+        if domain in self.open_hosts and priority <= queue.head_priority():
+            heappush(self.best_hosts, (priority, domain))
+
+    def _next_allowed(self, domain):
+        last_accessed = self.domains_last_accessed.get(domain)
+        if last_accessed is None:
+            return 0.0
+        return last_accessed + self.host_delays.get(domain, self.config.time_delay)
+
+    def _pop_ready_url(self):
+        ''' Returns (url, 0) with the best url of any host that is ready,
+        otherwise (None, wait) where wait is the time until the next host
+        becomes ready or the next failed url is due for a retry. '''
+        if self.stopped:
+            return None, None
+        now = time.time()
+        if self.spill and self.tbd_count <= self.window // 2:
+            self._refill()
+        while self.retry_heap and self.retry_heap[0][0] <= now:
+            _, _, url, depth, inlinks = heappop(self.retry_heap)
+            self._push_url(url, depth, inlinks)
+        while self.ready_hosts and self.ready_hosts[0][0] <= now:
+            _, domain = heappop(self.ready_hosts)
+            self.open_hosts.add(domain)
+            heappush(self.best_hosts, (
+                self.to_be_downloaded[domain].head_priority(), domain))
+        while self.best_hosts:
+            priority, domain = heappop(self.best_hosts)
+            if (domain in self.open_hosts and priority
+                    == self.to_be_downloaded[domain].head_priority()):
+                break
+        else:
+            wakeups = [
+                heap[0][0] for heap in (self.ready_hosts, self.retry_heap) if heap]
+            if not wakeups:
+                return None, None
+            return None, min(wakeups) - now
+        self.open_hosts.discard(domain)
+        queue = self.to_be_downloaded[domain]
+        url, depth = queue.pop()
+        self.tbd_count -= 1
+        self.fetched_depths[url] = depth
+        self.host_fetches[domain] = self.host_fetches.get(domain, 0) + 1
+        self.domains_last_accessed[domain] = now
+        if queue:
+            heappush(self.ready_hosts, (self._next_allowed(domain), domain))
+        else:
+            del self.to_be_downloaded[domain]
+        return url, 0
+
     def get_tbd_url(self):
+        ''' Returns a url from any host whose politeness window has passed,
+        blocking only while every host with pending urls is still waiting.
+        Returns None when nothing is left to download. '''
+        with self.lock:
+            while True:
+                url, wait = self._pop_ready_url()
+                if url is not None or wait is None:
+                    return url
+                self.host_ready.wait(wait)
+
+    def try_get_tbd_url(self):
+        ''' Non-blocking get_tbd_url for event loops. Returns (url, 0) when a
+        host is ready, (None, wait) when the next host is ready in wait
+        seconds, and (None, None) when nothing is left to download. '''
         with self.lock:
-            try:
-                url = self.to_be_downloaded.pop()
-                domain = self.get_domain(url)
-                if domain in self.domains_last_accessed:
-                    elapsed_time = time.time() - self.domains_last_accessed[domain]
-                    if elapsed_time < 0.5:
-                        time.sleep(0.5 - elapsed_time)
-                self.domains_last_accessed[domain] = time.time()
-                return url
-            except IndexError:
-                return None
-
-    def add_url(self, url):
+            return self._pop_ready_url()
+
+    def add_url(self, url, parent=None):
+        ''' Adds url, found on the page of parent (None for seeds). A url
+        found again while still pending gains an in-link, and a shorter
+        depth if parent is closer to the seeds, and is re-prioritized. '''
         url = normalize(url)
         with self.lock:
-            urlhash = get_urlhash(url)
-            if urlhash not in self.save:
-                self.save[urlhash] = (url, False)
-                self.save.sync()
-                self.to_be_downloaded.append(url)
+            depth = 0
+            if parent is not None:
+                depth = self.fetched_depths.get(parent, 0) + 1
+                if self.traps is not None:
+                    self.traps.observe_link(parent, url)
+            self._add_url(url, depth, parent is not None)
+
+    def _add_url(self, url, depth, linked):
+        # Called with self.lock held.
+        if self.seen.add(url):
+            if linked and self.traps is not None and not self.traps.admit(url):
+                return
+            self.save[get_urlhash(url)] = (url, False)
+            inlinks = 1 if linked else 0
+            self.resume.add(url, depth, inlinks)
+            self._queue_url(url, depth, inlinks)
+            return
+        domain = self.get_domain(url)
+        queue = self.to_be_downloaded.get(domain)
+        if linked and queue is not None and url in queue:
+            _, _, old_depth, inlinks = queue.entries[url]
+            depth = min(depth, old_depth)
+            self.resume.add(url, depth, inlinks + 1)
+            self._push_url(url, depth, inlinks + 1, domain)
 
-    def mark_url_complete(self, url):
+    def mark_url_complete(self, url, unchanged=False):
+        ''' unchanged is True for a page the recrawl index found unchanged,
+        see unchanged. It was not parsed, so the trap detector leaves the
+        yield of its template as its earlier fetch counted it. '''
         with self.lock:
-            urlhash = get_urlhash(url)
-            if urlhash not in self.save:
+            if url not in self.seen:
                 # This should not happen.
                 self.logger.error(
                     f"Completed url {url}, but have not seen it before.")
 
-            self.save[urlhash] = (url, True)
-            self.save.sync()
+            self.save[get_urlhash(url)] = (url, True)
+            self.resume.complete(url)
+            self.retries.succeeded(url)
+            if self.traps is not None and not unchanged:
+                self.traps.complete(url)
+
+    def unchanged(self, url, resp, accepted=True):
+        ''' Called by workers for a url from get_tbd_url fetched with
+        status 200. Returns True if RECRAWL is on and its body is the one
+        fetched last time, in which case the worker only marks it complete
+        with unchanged=True: it is not parsed, counted or searched for links
+        again. accepted is False for a page scraper.accept_response
+        rejected, which is only recorded, see RecrawlIndex.unchanged. '''
+        if self.recrawl is None:
+            return False
+        return self.recrawl.unchanged(
+            url, resp, self.fetched_depths.get(url, 0), accepted)
+
+    def fail_url(self, url, error_class):
+        ''' Called by workers for a url from get_tbd_url whose fetch failed
+        with an error of error_class, see crawler.retry.classify. The url is
+        handed out again after a backoff, or once it failed too often, it is
+        marked complete in the save file and never fetched again. '''
+        with self.lock:
+            due = self.retries.failed(url, error_class)
+            if due is None:
+                self.logger.warning(
+                    f"Giving up on {url} after its fetch failed with a "
+                    f"{error_class} error.")
+                self.save[get_urlhash(url)] = (url, True)
+                self.resume.complete(url)
+                return
+            heappush(self.retry_heap, (
+                due, next(self.sequence), url,
+                self.fetched_depths.get(url, 0), 0))
+            self.host_ready.notify()
+
+    def release_url(self, url):
+        ''' Called by workers once they are done with a url from
+        get_tbd_url, whether it was completed, failed or neither. A url that
+        was neither stays pending in the save file for the next run. '''
+        pass
+
+    def stop(self):
+        ''' Makes get_tbd_url return None from now on, waking the workers
+        waiting in it. Urls not completed stay pending in the save file. '''
+        with self.lock:
+            self.stopped = True
+            self.host_ready.notify_all()
+
+    def set_host_delay(self, domain, delay):
+        ''' Paces domain at delay seconds between fetches, from its next
+        fetch on. Never less than POLITENESS. '''
+        with self.lock:
+            if delay > self.config.time_delay:
+                self.host_delays[domain] = delay
+            else:
+                self.host_delays.pop(domain, None)
+
+    def close(self):
+        ''' Commits everything still buffered in the save file, the resume
+        index, the retry queue and the recrawl index, and saves the trap
+        detector's state. '''
+        with self.lock:
+            self.resume.close()
+            self.retries.close()
+            if self.recrawl is not None:
+                self.recrawl.close()
+                scraper.parse_observers.remove(self.recrawl.observe_parse)
+                self.recrawl = None
+            self.save.close()
+            self.spill.close()
+            if self.traps is not None:
+                self.traps.close()
+                scraper.page_observers.remove(self.traps.observe_page)
+                self.traps = None
 
     @staticmethod
     def get_domain(url):
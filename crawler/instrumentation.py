@@ -0,0 +1,88 @@
+from crawler import async_worker, concurrency, parse_pool, worker
+from crawler.async_worker import AsyncWorker
+from crawler.frontier import Frontier
+from crawler.page_store import PageStore
+from crawler.persistence import LogBackend, ShelveBackend
+from crawler.resume import ResumeIndex
+from crawler.shards import ShardedFrontier
+from crawler.worker import Worker
+from utils import metrics
+from utils.near_dup import NearDupIndex
+from utils.response import Response
+from utils.url_filter import UrlFilter
+import scraper
+
+
+def count_status(registry, response):
+    registry.count(f"status.{response.status}")
+
+
+# (owner, attribute, histogram) of every timed stage. Only attributes an
+# owner defines itself are listed, so no call is timed twice.
+STAGES = [
+    # Waiting for a url: politeness windows of every pending host, and
+    # the fixed delay after each fetch.
+    (Frontier, "get_tbd_url", "frontier.wait"),
+    (ShardedFrontier, "get_tbd_url", "frontier.wait"),
+    (AsyncWorker, "_next_url", "frontier.wait"),
+    (Worker, "politeness_sleep", "politeness_sleep"),
+    (AsyncWorker, "politeness_sleep", "politeness_sleep"),
+    (worker, "download", "download", count_status),
+    (async_worker, "download_async", "download", count_status),
+    (Response, "_decode", "response.decode"),
+    (Response, "_decode_raw", "response.unpickle"),
+    (PageStore, "add", "page_store.add"),
+    # With PARSEPROCESSES this runs, and is timed, in the parse processes.
+    (scraper, "parse_content", "parse"),
+    (NearDupIndex, "is_duplicate", "simhash_lookup"),
+    (UrlFilter, "filter", "is_valid"),
+    (Frontier, "add_url", "frontier.add_url"),
+    (Frontier, "mark_url_complete", "frontier.complete"),
+    (ShelveBackend, "__setitem__", "save.sync"),
+    (LogBackend, "sync", "save.sync"),
+    (ResumeIndex, "sync", "resume.sync"),
+]
+
+reporter = None
+
+
+def start_metrics(config):
+    ''' Enables metrics and times the crawler's hot paths if config.metrics
+    is set, before the frontier is created so that its lock is timed.
+    Returns the Metrics, or None when disabled, in which case nothing is
+    wrapped. '''
+    global reporter
+    if not config.metrics:
+        return None
+    if metrics.registry is None:
+        metrics.enable()
+        for stage in STAGES:
+            metrics.instrument(*stage)
+    if reporter is None:
+        reporter = metrics.Reporter(
+            metrics.registry, config.metrics_interval, config.metrics_file,
+            config.metrics_port)
+    return metrics.registry
+
+
+def watch_frontier(frontier):
+    ''' Queue depth gauges, nothing while metrics are disabled. '''
+    metrics.gauge("frontier.pending", lambda: frontier.tbd_count)
+    metrics.gauge("frontier.spilled", lambda: len(frontier.spill))
+    metrics.gauge("frontier.hosts", lambda: len(frontier.to_be_downloaded))
+    metrics.gauge("frontier.open_hosts", lambda: len(frontier.open_hosts))
+    metrics.gauge("parse.pending", lambda: (
+        parse_pool.shared_stage.pending if parse_pool.shared_stage else 0))
+    metrics.gauge("fetchers.active", lambda: (
+        concurrency.shared_controller.active
+        if concurrency.shared_controller else None))
+    metrics.gauge("fetchers.limit", lambda: (
+        concurrency.shared_controller.limit
+        if concurrency.shared_controller else None))
+
+
+def stop_metrics():
+    global reporter
+    if reporter is not None:
+        reporter.stop()
+        reporter = None
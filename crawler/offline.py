@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from crawler.page_store import PageReader
+from crawler.shards import shard_dir
+from utils import canonical, get_logger
+import scraper
+
+# Stored pages handed to a parse process at a time.
+BATCH_SIZE = 64
+
+readers = dict()
+
+
+def store_directories(config):
+    if config.shards > 1:
+        return [
+            os.path.join(shard_dir(shard_id), os.path.basename(config.page_store))
+            for shard_id in range(config.shards)]
+    return [config.page_store]
+
+
+def parse_stored(directory, positions):
+    ''' Runs in a parse process: reads the stored pages at positions and
+    returns (url, parse_content result) for each, with None for pages the
+    scraper would not parse. '''
+    reader = readers.get(directory)
+    if reader is None:
+        reader = readers[directory] = PageReader(directory)
+    results = list()
+    for position in positions:
+        page = reader.read(*position)
+        content = None
+        if scraper.accept_response(page):
+            content = scraper.page_content(page)
+        results.append((
+            page.url,
+            scraper.parse_content(page.url, content) if content is not None else None))
+    return results
+
+
+def latest_fetches(reader):
+    ''' (segment, offset, length) of the last stored fetch of each url, in
+    the order they were fetched. '''
+    last = dict()
+    for position, (digest, _, _, _) in enumerate(reader.entries()):
+        last[digest] = position
+    batch = list()
+    for position, (digest, number, offset, length) in enumerate(reader.entries()):
+        if last[digest] == position:
+            batch.append((number, offset, length))
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = list()
+    if batch:
+        yield batch
+
+
+def reprocess(config, processes=None):
+    ''' Regenerates output.txt and the scraper's checkpoints from the page
+    store alone, without the cache server. Pages are parsed in processes
+    (PARSEPROCESSES, or one per cpu) and merged in the order they were
+    fetched, like the parse stage of a crawl. '''
+    logger = get_logger("OFFLINE")
+    canonical.configure(config.strip_params, config.index_pages)
+    # Start from empty statistics rather than those of the last crawl.
+    scraper.output_loaded = True
+    pages = 0
+    with ProcessPoolExecutor(processes or config.parse_processes or None) as executor:
+        for directory in store_directories(config):
+            if not os.path.isdir(directory):
+                logger.info(f"No page store at {directory}, skipping it.")
+                continue
+            reader = PageReader(directory)
+            logger.info(f"Reprocessing {len(reader)} stored fetches in {directory}.")
+            results = executor.map(
+                partial(parse_stored, directory), latest_fetches(reader))
+            for batch in results:
+                for url, parsed in batch:
+                    if parsed is not None:
+                        scraper.filter_links(scraper.record_page(url, *parsed))
+                        pages += 1
+            reader.close()
+    scraper.save_to_output(checkpoint=True)
+    logger.info(f"Wrote output.txt from {pages} stored pages.")
@@ -0,0 +1,316 @@
+import atexit
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from threading import Lock
+
+from utils import get_urldigest
+
+# Record layout: crc32, codec, url length, payload length, url, payload.
+# The crc covers everything after itself, so a torn tail is detected. The
+# url is left uncompressed so the index can be rebuilt without inflating.
+RECORD_HEADER = struct.Struct(">IBHI")
+# Compressed payload: metadata length, JSON metadata, body.
+META_LENGTH = struct.Struct(">I")
+# Index entry: url digest, segment number, offset, record length.
+INDEX_ENTRY = struct.Struct(">8sIQI")
+INDEX_FILE = "index"
+SEGMENT_NAME = re.compile(r"^segment-(\d+)\.seg$")
+
+CODECS = {"zlib": 0, "zstd": 1}
+
+
+def segment_file(directory, number):
+    return os.path.join(directory, f"segment-{number:06d}.seg")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            "PAGECOMPRESSION = zstd needs the zstandard package "
+            "(python -m pip install zstandard).")
+    return zstandard
+
+
+def compress(codec, data):
+    if codec == CODECS["zstd"]:
+        return _zstandard().ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(codec, data):
+    if codec == CODECS["zstd"]:
+        return _zstandard().ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_page(codec, url, status, headers, fetched_at, content):
+    meta = json.dumps({
+        "status": status, "headers": headers,
+        "fetched_at": fetched_at}).encode("utf-8")
+    payload = compress(codec, META_LENGTH.pack(len(meta)) + meta + content)
+    body = url.encode("utf-8")
+    header = RECORD_HEADER.pack(0, codec, len(body), len(payload))[4:]
+    crc = zlib.crc32(payload, zlib.crc32(body, zlib.crc32(header)))
+    return struct.pack(">I", crc) + header + body + payload
+
+
+def read_records(fp):
+    ''' Yields (url, offset, length) of the records of a segment from the
+    current position, until its end or the first torn or corrupt record. '''
+    offset = fp.tell()
+    while True:
+        header = fp.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        crc, _, url_len, payload_len = RECORD_HEADER.unpack(header)
+        rest = fp.read(url_len + payload_len)
+        if (len(rest) < url_len + payload_len
+                or zlib.crc32(rest, zlib.crc32(header[4:])) != crc):
+            return
+        length = RECORD_HEADER.size + url_len + payload_len
+        yield rest[:url_len].decode("utf-8"), offset, length
+        offset += length
+
+
+class RawPage(object):
+    ''' Stands in for the requests.Response of a stored page, falsy for
+    statuses of 400 and up like requests.Response. '''
+    def __init__(self, url, status, headers, content):
+        self.url = url
+        self.status_code = status
+        self.headers = headers
+        self.content = content
+
+    def __bool__(self):
+        return self.status_code < 400
+
+
+class StoredPage(object):
+    ''' A page read back from the store, shaped like utils.response.Response
+    so scraper functions take it unchanged. '''
+    def __init__(self, url, status, headers, fetched_at, content):
+        self.url = url
+        self.status = status
+        self.error = None
+        self.fetched_at = fetched_at
+        self.headers = headers
+        self.body = memoryview(content)
+        self.size = len(content)
+        self.raw_response = RawPage(url, status, headers, content)
+
+
+def decode_page(record):
+    _, codec, url_len, _ = RECORD_HEADER.unpack_from(record)
+    url = record[RECORD_HEADER.size:RECORD_HEADER.size + url_len].decode("utf-8")
+    data = decompress(codec, record[RECORD_HEADER.size + url_len:])
+    meta_len, = META_LENGTH.unpack_from(data)
+    meta = json.loads(data[META_LENGTH.size:META_LENGTH.size + meta_len])
+    return StoredPage(
+        url, meta["status"], meta["headers"], meta["fetched_at"],
+        data[META_LENGTH.size + meta_len:])
+
+
+class PageStore(object):
+    ''' Fetched pages, compressed one record each into append-only
+    segment files of about segment_bytes, with an index of fixed width
+    (url digest, segment, offset, length) entries in fetch order.
+
+    Records are compressed on the calling thread and only appended under
+    the lock. Segments and index are flushed every interval seconds and
+    fsynced when a segment is sealed or the store closed. On
+    open, a torn tail of the last segment is truncated, and records it
+    holds but the index lost are indexed again. '''
+    def __init__(self, directory, segment_bytes=64 << 20, compression="zlib",
+                 interval=1.0):
+        if compression not in CODECS:
+            raise ValueError(
+                f"Unknown PAGECOMPRESSION {compression}, "
+                f"expected one of {', '.join(CODECS)}.")
+        self.codec = CODECS[compression]
+        if compression == "zstd":
+            _zstandard()
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.interval = interval
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index_file = os.path.join(directory, INDEX_FILE)
+        self.segment_number = max(self.segment_numbers(directory), default=0)
+        self._recover()
+        self.index = open(self.index_file, "ab")
+        self.segment = open(segment_file(directory, self.segment_number), "ab")
+        self.last_flush = time.time()
+        atexit.register(self.close)
+
+    @staticmethod
+    def segment_numbers(directory):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            int(match.group(1)) for match in map(
+                SEGMENT_NAME.match, os.listdir(directory)) if match)
+
+    def _recover(self):
+        path = segment_file(self.directory, self.segment_number)
+        segment_size = os.path.getsize(path) if os.path.exists(path) else 0
+        index_size = 0
+        if os.path.exists(self.index_file):
+            index_size = os.path.getsize(self.index_file)
+        index_size -= index_size % INDEX_ENTRY.size
+        # Drop index entries past the end of the last segment.
+        indexed_end = 0
+        with open(self.index_file, "a+b") as index:
+            while index_size:
+                index.seek(index_size - INDEX_ENTRY.size)
+                _, number, offset, length = INDEX_ENTRY.unpack(
+                    index.read(INDEX_ENTRY.size))
+                if number < self.segment_number or (
+                        number == self.segment_number
+                        and offset + length <= segment_size):
+                    if number == self.segment_number:
+                        indexed_end = offset + length
+                    break
+                index_size -= INDEX_ENTRY.size
+            index.truncate(index_size)
+            # Index what the last segment holds past its indexed records.
+            valid_end = indexed_end
+            if segment_size > indexed_end:
+                with open(path, "rb") as segment:
+                    segment.seek(indexed_end)
+                    for url, offset, length in read_records(segment):
+                        index.write(INDEX_ENTRY.pack(
+                            get_urldigest(url), self.segment_number,
+                            offset, length))
+                        valid_end = offset + length
+                with open(path, "r+b") as segment:
+                    segment.truncate(valid_end)
+
+    def add(self, url, response, fetched_at=None):
+        ''' Stores a fetched Response with its body and headers. Responses
+        without a page (cache server errors) are not stored. '''
+        body = response.body
+        if body is None:
+            return
+        headers = {key.lower(): value for key, value in response.headers.items()}
+        record = encode_page(
+            self.codec, url, response.status, headers,
+            fetched_at or time.time(), body)
+        with self.lock:
+            if self.segment.closed:
+                return
+            if self.segment.tell() and self.segment.tell() + len(record) > self.segment_bytes:
+                self._rotate()
+            offset = self.segment.tell()
+            self.segment.write(record)
+            self.index.write(INDEX_ENTRY.pack(
+                get_urldigest(url), self.segment_number, offset, len(record)))
+            if time.time() - self.last_flush >= self.interval:
+                self._flush()
+
+    def _flush(self, sync=False):
+        # The segment first, so the index never points past its end.
+        for fp in (self.segment, self.index):
+            fp.flush()
+            if sync:
+                os.fsync(fp.fileno())
+        self.last_flush = time.time()
+
+    def _rotate(self):
+        self._flush(sync=True)
+        self.segment.close()
+        self.segment_number += 1
+        self.segment = open(
+            segment_file(self.directory, self.segment_number), "ab")
+
+    def close(self):
+        with self.lock:
+            if self.segment.closed:
+                return
+            self._flush(sync=True)
+            self.segment.close()
+            self.index.close()
+
+
+class PageReader(object):
+    ''' Read side of a PageStore directory: the index and segments are
+    memory-mapped, so records are sliced out without copying the files. '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = dict()
+        index_file = os.path.join(directory, INDEX_FILE)
+        self.index = None
+        if os.path.exists(index_file) and os.path.getsize(index_file):
+            with open(index_file, "rb") as index:
+                self.index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        self.positions = None
+
+    def __len__(self):
+        return len(self.index) // INDEX_ENTRY.size if self.index else 0
+
+    def entries(self):
+        ''' Yields (url digest, segment, offset, length) in fetch order. '''
+        if self.index is None:
+            return
+        end = len(self.index) - len(self.index) % INDEX_ENTRY.size
+        yield from INDEX_ENTRY.iter_unpack(memoryview(self.index)[:end])
+
+    def _segment(self, number):
+        segment = self.segments.get(number)
+        if segment is None:
+            with open(segment_file(self.directory, number), "rb") as fp:
+                segment = self.segments[number] = mmap.mmap(
+                    fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return segment
+
+    def read(self, number, offset, length):
+        return decode_page(self._segment(number)[offset:offset + length])
+
+    def get(self, url):
+        ''' The last stored fetch of url, or None. '''
+        if self.positions is None:
+            self.positions = {
+                digest: (number, offset, length)
+                for digest, number, offset, length in self.entries()}
+        position = self.positions.get(get_urldigest(url))
+        return self.read(*position) if position else None
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = dict()
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+shared_store = None
+shared_lock = Lock()
+
+
+def get_page_store(config):
+    ''' The PageStore shared by all workers, or None when PAGESTORE is not
+    set and page bodies are not kept. '''
+    global shared_store
+    if not config.page_store:
+        return None
+    with shared_lock:
+        if shared_store is None:
+            shared_store = PageStore(
+                config.page_store, config.segment_bytes,
+                config.page_compression, config.save_interval)
+        return shared_store
+
+
+def close_page_store():
+    global shared_store
+    with shared_lock:
+        if shared_store is not None:
+            shared_store.close()
+            shared_store = None
@@ -0,0 +1,96 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Condition, Lock
+
+from utils import crawl_log, get_logger
+import scraper
+
+
+class ParseStage(object):
+    ''' Parses page bodies in a pool of processes.
+
+    Fetch threads call submit, which blocks once config.parse_queue pages
+    are waiting (backpressure). Each result is merged back in this process
+    by scraper.record_page and scraper.filter_links, then its links are
+    added to the frontier and the url is marked complete. '''
+    def __init__(self, config, frontier):
+        self.logger = get_logger("PARSER")
+        self.frontier = frontier
+        self.executor = ProcessPoolExecutor(config.parse_processes)
+        self.slots = BoundedSemaphore(config.parse_queue)
+        self.idle = Condition()
+        self.pending = 0
+
+    def submit(self, url, resp):
+        ''' Queue a fetched page, or complete it at once if there is
+        nothing to parse. '''
+        content = scraper.page_content(resp) if scraper.accept_response(resp) else None
+        if content is None:
+            self.frontier.mark_url_complete(url)
+            return
+        self.slots.acquire()
+        with self.idle:
+            self.pending += 1
+        try:
+            # A memoryview body cannot be pickled to the parse process.
+            future = self.executor.submit(scraper.parse_content, url, bytes(content))
+        except Exception:
+            self._done()
+            raise
+        future.add_done_callback(lambda future: self._merge(url, future))
+
+    def _merge(self, url, future):
+        try:
+            links = scraper.filter_links(
+                scraper.record_page(url, *future.result()))
+            for link in links:
+                self.frontier.add_url(link, url)
+            self.frontier.mark_url_complete(url)
+        except Exception as error:
+            self.logger.error(f"Failed to parse {url}: {error}")
+            crawl_log.record("error", url, detail=f"Failed to parse: {error}")
+            self.frontier.fail_url(url, "error")
+        finally:
+            self._done()
+
+    def _done(self):
+        self.slots.release()
+        with self.idle:
+            self.pending -= 1
+            if not self.pending:
+                self.idle.notify_all()
+
+    def wait_idle(self):
+        ''' Wait for queued pages to be merged. Returns True if there were
+        any, since they may have added urls to the frontier. '''
+        with self.idle:
+            had_pending = self.pending > 0
+            self.idle.wait_for(lambda: not self.pending)
+        return had_pending
+
+    def shutdown(self):
+        self.wait_idle()
+        self.executor.shutdown()
+
+
+shared_stage = None
+shared_lock = Lock()
+
+
+def get_parse_stage(config, frontier):
+    ''' The ParseStage shared by all workers, or None when
+    PARSEPROCESSES is 0 and pages are parsed on the worker threads. '''
+    global shared_stage
+    if config.parse_processes <= 0:
+        return None
+    with shared_lock:
+        if shared_stage is None:
+            shared_stage = ParseStage(config, frontier)
+        return shared_stage
+
+
+def shutdown_parse_stage():
+    global shared_stage
+    with shared_lock:
+        if shared_stage is not None:
+            shared_stage.shutdown()
+            shared_stage = None
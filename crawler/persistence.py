@@ -0,0 +1,247 @@
+import atexit
+import os
+import shelve
+import struct
+import time
+import zlib
+from threading import RLock
+
+
+class ShelveBackend(object):
+    ''' Stores the frontier in a shelve and syncs it on every write. '''
+    def __init__(self, config):
+        self.save_file = config.save_file
+        self.db = shelve.open(self.save_file)
+
+    @staticmethod
+    def exists(save_file):
+        return os.path.exists(save_file)
+
+    @staticmethod
+    def remove(save_file):
+        os.remove(save_file)
+
+    def __contains__(self, urlhash):
+        return urlhash in self.db
+
+    def __getitem__(self, urlhash):
+        return self.db[urlhash]
+
+    def __setitem__(self, urlhash, value):
+        self.db[urlhash] = value
+        self.db.sync()
+
+    def __len__(self):
+        return len(self.db)
+
+    def values(self):
+        return self.db.values()
+
+    def sync(self):
+        self.db.sync()
+
+    def close(self):
+        self.db.close()
+
+
+# Record layout: crc32, completed flag, key length, url length, key, url.
+# The crc covers everything after itself so a torn tail is detected on replay.
+RECORD_HEADER = struct.Struct(">IBHI")
+# Flag of the empty record that ends every group commit. A log ending in
+# one was fully written, so it can be appended to without a replay.
+COMMIT_FLAG = 2
+# The log is not compacted while smaller than this.
+COMPACT_MIN_BYTES = 1 << 20
+
+
+def encode_record(urlhash, url, completed):
+    key = urlhash.encode("utf-8")
+    body = url.encode("utf-8")
+    header = RECORD_HEADER.pack(0, completed, len(key), len(body))[4:]
+    crc = zlib.crc32(body, zlib.crc32(key, zlib.crc32(header)))
+    return struct.pack(">I", crc) + header + key + body
+
+
+def read_records(fp):
+    ''' Yields (urlhash, url, completed, end_offset) until the end of the
+    file or the first torn or corrupt record. Commit markers are skipped. '''
+    offset = fp.tell()
+    while True:
+        header = fp.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        crc, completed, key_len, url_len = RECORD_HEADER.unpack(header)
+        key = fp.read(key_len)
+        body = fp.read(url_len)
+        if len(key) < key_len or len(body) < url_len:
+            return
+        if zlib.crc32(body, zlib.crc32(key, zlib.crc32(header[4:]))) != crc:
+            return
+        offset += RECORD_HEADER.size + key_len + url_len
+        if completed == COMMIT_FLAG:
+            continue
+        yield key.decode("utf-8"), body.decode("utf-8"), bool(completed), offset
+
+
+COMMIT_RECORD = encode_record("", "", COMMIT_FLAG)
+
+
+def ends_committed(path):
+    ''' True if the file at path is empty or ends with a commit marker. '''
+    with open(path, "rb") as fp:
+        size = fp.seek(0, os.SEEK_END)
+        if size == 0:
+            return True
+        if size < len(COMMIT_RECORD):
+            return False
+        fp.seek(-len(COMMIT_RECORD), os.SEEK_END)
+        return fp.read() == COMMIT_RECORD
+
+
+class LogBackend(object):
+    ''' Keeps the frontier in memory and persists it as an append-only log
+    of (urlhash, url, completed) records.
+
+    Writes are buffered and group committed once save_batch records are
+    pending or save_interval seconds have passed since the last commit.
+    When the log grows past compact_ratio times the snapshot it is folded
+    into a new snapshot. The snapshot and log are only replayed when the
+    frontier is first read, so a resume that never reads it skips the
+    replay; a torn final record is truncated away before appending. '''
+    def __init__(self, config):
+        self.save_file = config.save_file
+        self.snapshot_file = f"{self.save_file}.snapshot"
+        self.log_file = f"{self.save_file}.log"
+        self.batch_size = config.save_batch
+        self.interval = config.save_interval
+        self.compact_ratio = 4
+        self.lock = RLock()
+        self.db = None
+        self.pending = list()
+        self.log = None
+        self.last_commit = time.time()
+        if os.path.exists(self.log_file) and not ends_committed(self.log_file):
+            # Possibly torn by a crash, replay now to find where to append.
+            self._recover()
+        self.log = open(self.log_file, "ab")
+        self.log_bytes = self.log.tell()
+        self.snapshot_bytes = (os.path.getsize(self.snapshot_file)
+                               if os.path.exists(self.snapshot_file) else 0)
+        atexit.register(self.close)
+
+    @staticmethod
+    def exists(save_file):
+        return (os.path.exists(f"{save_file}.snapshot")
+                or os.path.exists(f"{save_file}.log"))
+
+    @staticmethod
+    def remove(save_file):
+        for path in (f"{save_file}.snapshot", f"{save_file}.log"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _recover(self):
+        ''' Replay the snapshot and the log into memory. '''
+        with self.lock:
+            if self.db is not None:
+                return
+            self._write_pending()
+            db = dict()
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, "rb") as snapshot:
+                    for urlhash, url, completed, _ in read_records(snapshot):
+                        db[urlhash] = (url, completed)
+            if os.path.exists(self.log_file):
+                valid_end = 0
+                with open(self.log_file, "rb") as log:
+                    for urlhash, url, completed, valid_end in read_records(log):
+                        db[urlhash] = (url, completed)
+                if (valid_end != os.path.getsize(self.log_file)
+                        and not ends_committed(self.log_file)):
+                    # Drop the partially written record left by a crash.
+                    with open(self.log_file, "r+b") as log:
+                        log.truncate(valid_end)
+            self.db = db
+
+    def _loaded(self):
+        if self.db is None:
+            self._recover()
+        return self.db
+
+    def __contains__(self, urlhash):
+        return urlhash in self._loaded()
+
+    def __getitem__(self, urlhash):
+        return self._loaded()[urlhash]
+
+    def __setitem__(self, urlhash, value):
+        url, completed = value
+        with self.lock:
+            if self.db is not None:
+                self.db[urlhash] = value
+            self.pending.append(encode_record(urlhash, url, completed))
+            if (len(self.pending) >= self.batch_size
+                    or time.time() - self.last_commit >= self.interval):
+                self.sync()
+
+    def __len__(self):
+        return len(self._loaded())
+
+    def values(self):
+        return self._loaded().values()
+
+    def _write_pending(self):
+        if self.pending and self.log is not None:
+            self.pending.append(COMMIT_RECORD)
+            data = b"".join(self.pending)
+            self.log.write(data)
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.log_bytes += len(data)
+            self.pending = list()
+
+    def sync(self):
+        ''' Group commit every pending record with a single write and fsync. '''
+        with self.lock:
+            self._write_pending()
+            self.last_commit = time.time()
+            if self.log_bytes > self.compact_ratio * max(self.snapshot_bytes, COMPACT_MIN_BYTES):
+                self.compact()
+
+    def compact(self):
+        ''' Write the live state to a new snapshot and start an empty log. '''
+        with self.lock:
+            db = self._loaded()
+            tmp_file = f"{self.snapshot_file}.tmp"
+            with open(tmp_file, "wb") as snapshot:
+                for urlhash, (url, completed) in db.items():
+                    snapshot.write(encode_record(urlhash, url, completed))
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+                self.snapshot_bytes = snapshot.tell()
+            os.replace(tmp_file, self.snapshot_file)
+            self.log.close()
+            self.log = open(self.log_file, "wb")
+            self.log_bytes = 0
+
+    def close(self):
+        with self.lock:
+            if self.log.closed:
+                return
+            self.sync()
+            self.log.close()
+
+
+BACKENDS = {
+    "shelve": ShelveBackend,
+    "log": LogBackend,
+}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown save backend {name}, "
+            f"expected one of {', '.join(BACKENDS)}.")
@@ -0,0 +1,132 @@
+import math
+import re
+from heapq import heappush, heappop
+from urllib.parse import urlparse
+
+# Path and query shapes that crawler traps tend to have.
+TRAP_SEGMENT = re.compile(
+    r"(calendar|ical|events?|archive|tag|page|feed|print|login|share)$", re.I)
+TRAP_QUERY_KEY = re.compile(
+    r"(^|&)(do|action|share|replytocom|rev|version|sort|order|"
+    r"tribe[-\w]*|ical|outlook-ical|format|view|page|c|s)=", re.I)
+DIGITS = re.compile(r"\d")
+
+
+def trap_likelihood(url):
+    ''' Rough 0..1 likelihood that url is part of a crawler trap, judged
+    only from the shape of its path and query. '''
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    score = 0.0
+    if parsed.query:
+        score += 0.15 + 0.1 * parsed.query.count("&")
+        if TRAP_QUERY_KEY.search(parsed.query):
+            score += 0.3
+    if len(segments) > 3:
+        score += 0.1 * (len(segments) - 3)
+    if len(set(segments)) < len(segments):
+        score += 0.3
+    for segment in segments:
+        if TRAP_SEGMENT.match(segment):
+            score += 0.2
+        digits = len(DIGITS.findall(segment))
+        if digits >= 4 or digits * 2 > len(segment):
+            score += 0.15
+        if len(segment) > 40:
+            score += 0.1
+    if len(url) > 150:
+        score += 0.2
+    return min(score, 1.0)
+
+
+def depth_feature(url, depth, inlinks, host_fetches, host_budget):
+    return depth
+
+
+def host_feature(url, depth, inlinks, host_fetches, host_budget):
+    return host_fetches / host_budget
+
+
+def inlinks_feature(url, depth, inlinks, host_fetches, host_budget):
+    return -math.log2(1 + inlinks)
+
+
+def trap_feature(url, depth, inlinks, host_fetches, host_budget):
+    return trap_likelihood(url)
+
+
+# Each feature maps a url and what is known about it to a cost; a url's
+# priority is the weighted sum and lower priorities are fetched first.
+FEATURES = {
+    "depth": depth_feature,
+    "host": host_feature,
+    "inlinks": inlinks_feature,
+    "trap": trap_feature,
+}
+
+
+class Scorer(object):
+    ''' Weighted sum of FEATURES. New features can be registered in
+    FEATURES and given a weight in PRIORITYWEIGHTS. With every weight at
+    zero the frontier is first in, first out. '''
+    def __init__(self, weights, host_budget=500):
+        for name in weights:
+            if name not in FEATURES:
+                raise ValueError(
+                    f"Unknown priority feature {name}, "
+                    f"expected one of {', '.join(FEATURES)}.")
+        self.features = [
+            (weight, FEATURES[name])
+            for name, weight in weights.items() if weight]
+        self.host_budget = host_budget
+
+    def __call__(self, url, depth, inlinks, host_fetches):
+        return sum(
+            weight * feature(url, depth, inlinks, host_fetches, self.host_budget)
+            for weight, feature in self.features)
+
+
+class HostQueue(object):
+    ''' Pending urls of one host, lowest priority first.
+
+    A url is re-prioritized by pushing it again with a new sequence
+    number; the old heap entry is left behind and skipped when it
+    surfaces, so updates cost O(log n). '''
+    def __init__(self):
+        self.heap = list()
+        # url -> [priority, seq, depth, inlinks] of every live url.
+        self.entries = dict()
+
+    def push(self, url, priority, seq, depth, inlinks):
+        self.entries[url] = [priority, seq, depth, inlinks]
+        heappush(self.heap, (priority, seq, url))
+
+    def _drop_stale(self):
+        while self.heap:
+            priority, seq, url = self.heap[0]
+            entry = self.entries.get(url)
+            if entry is not None and entry[1] == seq:
+                return
+            heappop(self.heap)
+
+    def head_priority(self):
+        self._drop_stale()
+        return self.heap[0][0]
+
+    def pop(self):
+        ''' Removes the best url, returning (url, depth). '''
+        self._drop_stale()
+        _, _, url = heappop(self.heap)
+        _, _, depth, _ = self.entries.pop(url)
+        return url, depth
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        ''' Yields (url, depth, inlinks) of every live url. '''
+        for url, (_, _, depth, inlinks) in self.entries.items():
+            yield url, depth, inlinks
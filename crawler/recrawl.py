@@ -0,0 +1,225 @@
+import atexit
+import os
+import struct
+import time
+import zlib
+from hashlib import blake2b
+from threading import RLock
+
+from utils.near_dup import popcount
+
+# Record layout: crc32, body hash, simhash, outlink digest, fetch time and
+# revisit interval (wall clock seconds), depth, then the lengths and bytes
+# of the url, ETag and Last-Modified. The crc covers everything after
+# itself, so a torn tail is detected on load.
+RECORD_HEADER = struct.Struct(">I8sQ8sddHHHH")
+# Simhashes of two versions of a page further apart than this many bits
+# are a significant change, as for the near-duplicate check.
+CHANGE_BITS = 3
+NO_DIGEST = bytes(8)
+
+
+def body_hash(body):
+    return blake2b(body, digest_size=8).digest()
+
+
+def outlink_digest(links):
+    ''' Digest of the set of links of a page, whatever their order. '''
+    digest = blake2b(digest_size=8)
+    for link in sorted(set(links)):
+        digest.update(link.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.digest()
+
+
+def encode_record(url, entry):
+    content, fingerprint, outlinks, fetched, interval, depth, etag, modified = entry
+    strings = [value.encode("utf-8") for value in (url, etag, modified)]
+    header = RECORD_HEADER.pack(
+        0, content, fingerprint, outlinks, fetched, interval,
+        min(depth, 0xFFFF), *map(len, strings))[4:]
+    body = b"".join(strings)
+    return struct.pack(">I", zlib.crc32(body, zlib.crc32(header))) + header + body
+
+
+def read_records(fp):
+    ''' Yields (url, entry, end offset) until the end of the file or the
+    first torn or corrupt record. '''
+    offset = fp.tell()
+    while True:
+        header = fp.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        (crc, content, fingerprint, outlinks, fetched, interval, depth,
+         url_len, etag_len, modified_len) = RECORD_HEADER.unpack(header)
+        length = url_len + etag_len + modified_len
+        body = fp.read(length)
+        if len(body) < length or zlib.crc32(body, zlib.crc32(header[4:])) != crc:
+            return
+        offset += RECORD_HEADER.size + length
+        url = body[:url_len].decode("utf-8")
+        etag = body[url_len:url_len + etag_len].decode("utf-8")
+        modified = body[url_len + etag_len:].decode("utf-8")
+        yield url, [content, fingerprint, outlinks, fetched, interval, depth,
+                    etag, modified], offset
+
+
+class RecrawlIndex(object):
+    ''' What the crawl knows of every fetched page, kept beside the save
+    file in save_file.recrawl: the hash of its body, its simhash, its ETag
+    and Last-Modified headers, the digest of its links, when it was last
+    fetched and how long to wait before fetching it again.
+
+    The wait starts at interval. A page found unchanged waits twice as
+    long next time, up to max_interval; one whose text or links changed
+    significantly half as long, down to min_interval; a minor change keeps
+    the wait. Records are appended, the last one of a url wins on load,
+    and the file is rewritten with only the live entries once it outgrows
+    them, as for the retry queue. '''
+    def __init__(self, config, restart=False):
+        self.recrawl_file = f"{config.save_file}.recrawl"
+        self.interval = config.recrawl_interval
+        self.min_interval = config.recrawl_min
+        self.max_interval = config.recrawl_max
+        self.sync_interval = config.save_interval
+        self.lock = RLock()
+        # url -> [body hash, simhash, outlink digest, fetch time, interval,
+        # depth, etag, last modified] of every fetched page.
+        self.entries = dict()
+        # url -> (simhash, outlink digest, interval) of the version before
+        # a change, until the new one is parsed.
+        self.changed = dict()
+        self.buffer = list()
+        self.records = 0
+        self.last_commit = time.time()
+        if restart and os.path.exists(self.recrawl_file):
+            os.remove(self.recrawl_file)
+        self._load()
+        self.file = open(self.recrawl_file, "ab")
+        atexit.register(self.close)
+
+    def _load(self):
+        if not os.path.exists(self.recrawl_file):
+            return
+        valid_end = 0
+        with open(self.recrawl_file, "rb") as fp:
+            for url, entry, valid_end in read_records(fp):
+                self.entries[url] = entry
+                self.records += 1
+        if valid_end != os.path.getsize(self.recrawl_file):
+            with open(self.recrawl_file, "r+b") as fp:
+                fp.truncate(valid_end)
+
+    def due(self, url, now):
+        ''' Whether url is due for a fetch by now. Pages fetched before
+        there was an entry for them always are. '''
+        entry = self.entries.get(url)
+        return entry is None or entry[3] + entry[4] <= now
+
+    def depth(self, url):
+        entry = self.entries.get(url)
+        return entry[5] if entry is not None else 0
+
+    def unchanged(self, url, resp, depth=0, accepted=True):
+        ''' Records a successful fetch of url and returns True if its body
+        is the one fetched last time, so that it need not be processed
+        again. Matching ETag or Last-Modified headers are taken for an
+        unchanged body without hashing it. A page the scraper does not
+        accept is never hashed: its fetch is recorded as unchanged, so that
+        it is fetched less often, and False is returned. '''
+        headers = resp.headers
+        etag = headers.get("etag", "") or ""
+        modified = headers.get("last-modified", "") or ""
+        now = time.time()
+        # A url is only fetched by one worker at a time, so its entry can
+        # be read before the body is hashed outside the lock.
+        entry = self.entries.get(url)
+        if not accepted:
+            content = entry[0] if entry is not None else NO_DIGEST
+        elif entry is not None and (
+                (etag and etag == entry[6]) or (modified and modified == entry[7])):
+            content = entry[0]
+        else:
+            content = body_hash(resp.body or b"")
+        with self.lock:
+            self.changed.pop(url, None)
+            if entry is None:
+                self._append(url, [
+                    content, 0, NO_DIGEST, now, self.interval, depth,
+                    etag, modified])
+                return False
+            interval = entry[4]
+            if content == entry[0]:
+                self._append(url, [
+                    content, entry[1], entry[2], now,
+                    min(self.max_interval, max(self.min_interval, interval * 2)), entry[5],
+                    etag, modified])
+                return accepted
+            # Taken for a significant change until the new version is
+            # parsed, see observe_parse.
+            self.changed[url] = (entry[1], entry[2], interval)
+            self._append(url, [
+                content, entry[1], entry[2], now,
+                max(self.min_interval, interval / 2), entry[5], etag, modified])
+            return False
+
+    def observe_parse(self, url, fingerprint, links):
+        ''' Records the simhash and links of a parsed page. A change that
+        left both about the same keeps the previous revisit interval. '''
+        outlinks = outlink_digest(links)
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return
+            previous = self.changed.pop(url, None)
+            interval = entry[4]
+            if previous is not None:
+                old_fingerprint, old_outlinks, old_interval = previous
+                if (old_outlinks == outlinks and popcount(
+                        old_fingerprint ^ fingerprint) <= CHANGE_BITS):
+                    interval = old_interval
+            self._append(url, [
+                entry[0], fingerprint, outlinks, entry[3], interval, entry[5],
+                entry[6], entry[7]])
+
+    def _append(self, url, entry):
+        self.entries[url] = entry
+        self.buffer.append(encode_record(url, entry))
+        if time.time() - self.last_commit >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        ''' Group commit buffered records, rewriting the file once it holds
+        four times more records than live entries. '''
+        with self.lock:
+            if self.buffer:
+                self.file.write(b"".join(self.buffer))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.records += len(self.buffer)
+                self.buffer = list()
+            self.last_commit = time.time()
+            if self.records > 4 * max(len(self.entries), 1024):
+                self.compact()
+
+    def compact(self):
+        with self.lock:
+            self.file.close()
+            tmp_file = f"{self.recrawl_file}.tmp"
+            with open(tmp_file, "wb") as fp:
+                fp.write(b"".join(
+                    encode_record(url, entry)
+                    for url, entry in self.entries.items()))
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_file, self.recrawl_file)
+            self.buffer = list()
+            self.records = len(self.entries)
+            self.file = open(self.recrawl_file, "ab")
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.sync()
+            self.file.close()
@@ -0,0 +1,233 @@
+import atexit
+import os
+import struct
+import time
+import zlib
+from threading import RLock
+
+from utils import get_urldigest
+from utils.seen_set import SeenSet
+
+DIGEST_SIZE = 8
+# Queue record layout: crc32, url length, depth, in-links, url digest,
+# url. The crc covers everything after itself, so a torn tail is detected
+# on load.
+QUEUE_HEADER = struct.Struct(f">IIHI{DIGEST_SIZE}s")
+
+
+def encode_url(digest, url, depth, inlinks):
+    body = url.encode("utf-8")
+    header = QUEUE_HEADER.pack(
+        0, len(body), min(depth, 0xFFFF), min(inlinks, 0xFFFFFFFF), digest)[4:]
+    return struct.pack(">I", zlib.crc32(body, zlib.crc32(header))) + header + body
+
+
+def read_urls(fp):
+    ''' Yields (digest, url, depth, inlinks, end_offset) until the end of
+    the file or the first torn or corrupt record. '''
+    offset = fp.tell()
+    while True:
+        header = fp.read(QUEUE_HEADER.size)
+        if len(header) < QUEUE_HEADER.size:
+            return
+        crc, url_len, depth, inlinks, digest = QUEUE_HEADER.unpack(header)
+        body = fp.read(url_len)
+        if len(body) < url_len or zlib.crc32(body, zlib.crc32(header[4:])) != crc:
+            return
+        offset += QUEUE_HEADER.size + url_len
+        yield digest, body.decode("utf-8"), depth, inlinks, offset
+
+
+class ResumeIndex(object):
+    ''' Restart state of the frontier, kept beside the save file so that a
+    resumed crawl loads in time proportional to its pending urls instead
+    of replaying every url ever discovered.
+
+        save_file.seen   SeenSet of every url discovered before the last
+                         compaction, memory-mapped back on load.
+        save_file.queue  Urls pending at the last compaction, followed by
+                         every url discovered or re-prioritized since, in
+                         order, with their depth and in-link count.
+        save_file.done   Digests of queued urls completed since the last
+                         compaction.
+
+    Appends are group committed like the log save backend. Once the queue
+    and done files outgrow the pending urls they are compacted: the seen
+    set is saved and the queue is rewritten with only the pending urls.
+    Only the digest and queue file offset of each pending url are kept in
+    memory, the urls themselves are read back from the queue file. '''
+    def __init__(self, config):
+        self.seen_file = f"{config.save_file}.seen"
+        self.queue_file = f"{config.save_file}.queue"
+        self.done_file = f"{config.save_file}.done"
+        self.batch_size = config.save_batch
+        self.interval = config.save_interval
+        self.compact_ratio = 4
+        self.lock = RLock()
+        self.seen = None
+        # Digest -> offset in the queue file of the latest record of every
+        # queued url that is not completed yet.
+        self.pending = dict()
+        # Size of the queue file with the buffered records.
+        self.queue_size = 0
+        self.queue_buffer = list()
+        self.done_buffer = list()
+        self.records = 0
+        self.queue = None
+        self.done = None
+        self.last_commit = time.time()
+        atexit.register(self.close)
+
+    @staticmethod
+    def exists(save_file):
+        return all(
+            os.path.exists(f"{save_file}{suffix}")
+            for suffix in (".seen", ".queue", ".done"))
+
+    @staticmethod
+    def remove(save_file):
+        for suffix in (".seen", ".queue", ".done"):
+            if os.path.exists(f"{save_file}{suffix}"):
+                os.remove(f"{save_file}{suffix}")
+
+    def load(self):
+        ''' Restores the seen set and returns an iterator of (url, depth,
+        inlinks) of the pending urls in the order they were discovered, to
+        be consumed before anything else is added. Torn tails left by a
+        crash are truncated. '''
+        with self.lock:
+            self.seen = SeenSet.load(self.seen_file)
+            with open(self.done_file, "rb") as done:
+                data = done.read()
+            valid_end = len(data) - len(data) % DIGEST_SIZE
+            completed = {
+                data[offset:offset + DIGEST_SIZE]
+                for offset in range(0, valid_end, DIGEST_SIZE)}
+            self._truncate(self.done_file, valid_end)
+
+            valid_end = 0
+            with open(self.queue_file, "rb") as queue:
+                for digest, _, _, _, end in read_urls(queue):
+                    self.seen.add_digest(digest)
+                    if digest not in completed:
+                        self.pending[digest] = valid_end
+                    valid_end = end
+                    self.records += 1
+            self._truncate(self.queue_file, valid_end)
+            self.queue_size = valid_end
+            self.records += len(completed)
+            self._open()
+            return self._pending_entries()
+
+    def _pending_entries(self):
+        ''' Yields (url, depth, inlinks) of the latest record of every
+        pending url, read back from the committed queue file. '''
+        with open(self.queue_file, "rb") as queue:
+            offset = 0
+            for digest, url, depth, inlinks, end in read_urls(queue):
+                if self.pending.get(digest) == offset:
+                    yield url, depth, inlinks
+                offset = end
+
+    def create(self, seen, pending):
+        ''' Starts a new index from the given seen set and an iterable of
+        the (url, depth, inlinks) of the pending urls. '''
+        with self.lock:
+            self.seen = seen
+            self.pending = dict()
+            self.compact(
+                (get_urldigest(entry[0], DIGEST_SIZE), *entry) for entry in pending)
+
+    @staticmethod
+    def _truncate(path, valid_end):
+        if valid_end != os.path.getsize(path):
+            with open(path, "r+b") as fp:
+                fp.truncate(valid_end)
+
+    def _open(self):
+        self.queue = open(self.queue_file, "ab")
+        self.done = open(self.done_file, "ab")
+
+    def add(self, url, depth=0, inlinks=0):
+        ''' Records a newly discovered url, or new depth and in-links of a
+        pending one. The frontier adds it to the seen set itself. '''
+        with self.lock:
+            digest = get_urldigest(url, DIGEST_SIZE)
+            record = encode_url(digest, url, depth, inlinks)
+            self.pending[digest] = self.queue_size
+            self.queue_size += len(record)
+            self.queue_buffer.append(record)
+            self._maybe_sync()
+
+    def complete(self, url):
+        with self.lock:
+            digest = get_urldigest(url, DIGEST_SIZE)
+            if self.pending.pop(digest, None) is not None:
+                self.done_buffer.append(digest)
+                self._maybe_sync()
+
+    def _maybe_sync(self):
+        if (len(self.queue_buffer) + len(self.done_buffer) >= self.batch_size
+                or time.time() - self.last_commit >= self.interval):
+            self.sync()
+
+    def sync(self):
+        ''' Group commit buffered appends, compacting once the files hold
+        compact_ratio times more records than there are pending urls. '''
+        with self.lock:
+            for fp, buffer in ((self.queue, self.queue_buffer),
+                               (self.done, self.done_buffer)):
+                if buffer:
+                    fp.write(b"".join(buffer))
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                    self.records += len(buffer)
+                    del buffer[:]
+            self.last_commit = time.time()
+            # The seen set is rewritten on every compaction, so compact no
+            # more often than once per sixteenth of its size in new records.
+            if self.records > self.compact_ratio * max(
+                    len(self.pending), len(self.seen) // 16, 1024):
+                self.compact()
+
+    def compact(self, entries=None):
+        ''' Save the seen set and rewrite the queue with only the pending
+        urls, or with entries, (digest, url, depth, inlinks) of the pending
+        urls, if given. Each file is replaced atomically, and in an order
+        where a crash in between still loads the same state. '''
+        with self.lock:
+            for fp in (self.queue, self.done):
+                if fp is not None:
+                    fp.close()
+            self.seen.save(self.seen_file)
+            if entries is None:
+                entries = (
+                    (get_urldigest(url, DIGEST_SIZE), url, depth, inlinks)
+                    for url, depth, inlinks in self._pending_entries())
+            tmp_file = f"{self.queue_file}.tmp"
+            pending = dict()
+            offset = 0
+            with open(tmp_file, "wb") as queue:
+                for digest, url, depth, inlinks in entries:
+                    record = encode_url(digest, url, depth, inlinks)
+                    queue.write(record)
+                    pending[digest] = offset
+                    offset += len(record)
+                queue.flush()
+                os.fsync(queue.fileno())
+            os.replace(tmp_file, self.queue_file)
+            self.pending = pending
+            self.queue_size = offset
+            open(self.done_file, "wb").close()
+            self.queue_buffer = list()
+            self.done_buffer = list()
+            self.records = len(self.pending)
+            self._open()
+
+    def close(self):
+        with self.lock:
+            if self.queue is None or self.queue.closed:
+                return
+            self.sync()
+            self.queue.close()
+            self.done.close()
@@ -0,0 +1,180 @@
+import atexit
+import os
+import random
+import struct
+import time
+import zlib
+from threading import RLock
+
+# Error classes a failed fetch is retried under, each with its own
+# RETRYLIMITS attempt limit.
+ERROR_CLASSES = ("timeout", "connection", "server", "client", "error")
+# Cache server statuses of a fetch the cache server itself failed.
+SERVER_STATUSES = {601, 602}
+
+PENDING = 0
+FAILED = 1
+CLEARED = 2
+# Record layout: crc32, state, error class, attempts, due time (wall
+# clock), url length, url. The crc covers everything after itself, so a
+# torn tail is detected on load.
+RECORD_HEADER = struct.Struct(">IBBHdH")
+
+
+def classify(status=None, error=None):
+    ''' Error class of a fetch that ended with a non-200 status or raised
+    error. '''
+    if error is not None:
+        name = type(error).__name__
+        if "Timeout" in name:
+            return "timeout"
+        if "Connection" in name or isinstance(error, OSError):
+            return "connection"
+        return "error"
+    if status in SERVER_STATUSES or 500 <= status < 600:
+        return "server"
+    return "client"
+
+
+def encode_record(state, error_class, attempts, due, url):
+    body = url.encode("utf-8")
+    header = RECORD_HEADER.pack(
+        0, state, ERROR_CLASSES.index(error_class), min(attempts, 0xFFFF),
+        due, len(body))[4:]
+    return struct.pack(">I", zlib.crc32(body, zlib.crc32(header))) + header + body
+
+
+def read_records(fp):
+    ''' Yields (state, error class, attempts, due, url, end offset) until
+    the end of the file or the first torn or corrupt record. '''
+    offset = fp.tell()
+    while True:
+        header = fp.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        crc, state, error_class, attempts, due, url_len = RECORD_HEADER.unpack(header)
+        body = fp.read(url_len)
+        if len(body) < url_len or zlib.crc32(body, zlib.crc32(header[4:])) != crc:
+            return
+        offset += RECORD_HEADER.size + url_len
+        yield (state, ERROR_CLASSES[error_class], attempts, due,
+               body.decode("utf-8"), offset)
+
+
+class RetryQueue(object):
+    ''' Failed fetches of the crawl, kept beside the save file in
+    save_file.retry so that backoff and attempt counts survive a restart.
+
+    A failed url is retried after backoff seconds, doubled on every
+    further failure up to max_backoff. Once its failures reach the limit
+    of the error class of the last one, it is permanently failed. Every
+    change is an appended record, the last one of a url wins on load, and
+    the file is rewritten with only the live entries once it outgrows
+    them. '''
+    def __init__(self, config, restart=False):
+        self.retry_file = f"{config.save_file}.retry"
+        self.limits = config.retry_limits
+        self.backoff = config.retry_backoff
+        self.max_backoff = config.retry_max_backoff
+        self.interval = config.save_interval
+        self.lock = RLock()
+        # url -> [state, error class, attempts, due] of pending retries and
+        # permanently failed urls.
+        self.entries = dict()
+        self.buffer = list()
+        self.records = 0
+        self.last_commit = time.time()
+        if restart and os.path.exists(self.retry_file):
+            os.remove(self.retry_file)
+        self._load()
+        self.file = open(self.retry_file, "ab")
+        atexit.register(self.close)
+
+    def _load(self):
+        if not os.path.exists(self.retry_file):
+            return
+        valid_end = 0
+        with open(self.retry_file, "rb") as fp:
+            for state, error_class, attempts, due, url, valid_end in read_records(fp):
+                if state == CLEARED:
+                    self.entries.pop(url, None)
+                else:
+                    self.entries[url] = [state, error_class, attempts, due]
+                self.records += 1
+        if valid_end != os.path.getsize(self.retry_file):
+            with open(self.retry_file, "r+b") as fp:
+                fp.truncate(valid_end)
+
+    def pending(self):
+        ''' (due, url) of every url waiting for a retry. '''
+        with self.lock:
+            return [
+                (entry[3], url) for url, entry in self.entries.items()
+                if entry[0] == PENDING]
+
+    def failed(self, url, error_class):
+        ''' Records a failed fetch of url. Returns when to retry it, or None
+        if it is now permanently failed. '''
+        with self.lock:
+            entry = self.entries.get(url)
+            attempts = entry[2] + 1 if entry is not None else 1
+            if attempts >= self.limits.get(error_class, 1):
+                self._append(url, [FAILED, error_class, attempts, 0.0])
+                return None
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+            # Jitter, so urls failed together are not retried together.
+            due = time.time() + delay * random.uniform(0.75, 1.25)
+            self._append(url, [PENDING, error_class, attempts, due])
+            return due
+
+    def succeeded(self, url):
+        with self.lock:
+            if url in self.entries:
+                del self.entries[url]
+                self.buffer.append(encode_record(CLEARED, "error", 0, 0.0, url))
+                self._maybe_sync()
+
+    def _append(self, url, entry):
+        self.entries[url] = entry
+        self.buffer.append(encode_record(entry[0], entry[1], entry[2], entry[3], url))
+        self._maybe_sync()
+
+    def _maybe_sync(self):
+        if time.time() - self.last_commit >= self.interval:
+            self.sync()
+
+    def sync(self):
+        ''' Group commit buffered records, rewriting the file once it holds
+        four times more records than live entries. '''
+        with self.lock:
+            if self.buffer:
+                self.file.write(b"".join(self.buffer))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.records += len(self.buffer)
+                self.buffer = list()
+            self.last_commit = time.time()
+            if self.records > 4 * max(len(self.entries), 1024):
+                self.compact()
+
+    def compact(self):
+        with self.lock:
+            self.file.close()
+            tmp_file = f"{self.retry_file}.tmp"
+            with open(tmp_file, "wb") as fp:
+                fp.write(b"".join(
+                    encode_record(*entry, url)
+                    for url, entry in self.entries.items()))
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_file, self.retry_file)
+            self.buffer = list()
+            self.records = len(self.entries)
+            self.file = open(self.retry_file, "ab")
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.sync()
+            self.file.close()
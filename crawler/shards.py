@@ -0,0 +1,261 @@
+import copy
+import multiprocessing
+import os
+from collections import Counter
+from hashlib import blake2b
+from queue import Empty
+from threading import Thread
+from urllib.parse import urlparse
+
+from crawler import parse_pool
+from crawler.frontier import Frontier
+from crawler.persistence import get_backend
+from crawler.worker import Worker, catch_interrupts
+from utils import get_logger, log_pipeline
+from utils.seen_set import SeenSet
+from utils.statistics import CrawlStatistics
+import scraper
+
+SHARDS_DIR = "shards"
+# How often a shard with nothing to fetch flushes its outboxes and checks
+# whether the whole crawl is done.
+POLL_INTERVAL = 0.1
+
+
+def shard_of(url, shard_count):
+    ''' Index of the shard that owns url's host. Unlike hash() it is the
+    same in every process and every run. '''
+    netloc = urlparse(url).netloc.encode("utf-8")
+    digest = blake2b(netloc, digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shard_count
+
+
+def shard_dir(shard_id):
+    return os.path.join(SHARDS_DIR, f"shard{shard_id}")
+
+
+def shard_save_file(config, shard_id):
+    return os.path.join(shard_dir(shard_id), os.path.basename(config.save_file))
+
+
+class ShardState(object):
+    ''' Shared by the shard processes: one inbox of url batches per shard,
+    and what is needed to tell when the crawl is done. The crawl is done
+    once every shard is idle and every batch sent has been received; both
+    are only changed under lock, so that state cannot be seen early. '''
+    def __init__(self, shard_count, context):
+        self.inboxes = [context.Queue() for _ in range(shard_count)]
+        self.lock = context.Lock()
+        self.idle = context.RawArray("b", shard_count)
+        self.sent = context.RawValue("q", 0)
+        self.received = context.RawValue("q", 0)
+        self.finished = context.RawValue("b", 0)
+
+
+class ShardedFrontier(Frontier):
+    ''' Frontier of the hosts that hash to one shard. Urls of other hosts
+    are batched per shard and routed to their owner, where a receiver
+    thread adds them. get_tbd_url only returns None once the whole crawl
+    is done, not when this shard runs out of urls. '''
+    def __init__(self, config, restart, shard_id, state):
+        self.shard_id = shard_id
+        self.state = state
+        self.shard_count = len(state.inboxes)
+        self.batch_size = config.shard_batch
+        self.outboxes = [list() for _ in range(self.shard_count)]
+        # Urls handed out by get_tbd_url and not yet released.
+        self.handed_out = set()
+        super().__init__(config, restart)
+        Thread(target=self._receive, daemon=True).start()
+
+    def _add_url(self, url, depth, linked):
+        # Called with self.lock held.
+        shard = shard_of(url, self.shard_count)
+        if shard == self.shard_id:
+            super()._add_url(url, depth, linked)
+            return
+        outbox = self.outboxes[shard]
+        outbox.append((url, depth, linked))
+        if len(outbox) >= self.batch_size:
+            self._send(shard)
+
+    def _send(self, shard):
+        batch = self.outboxes[shard]
+        self.outboxes[shard] = list()
+        with self.state.lock:
+            self.state.sent.value += 1
+        self.state.inboxes[shard].put(batch)
+
+    def _flush(self):
+        for shard, outbox in enumerate(self.outboxes):
+            if outbox:
+                self._send(shard)
+
+    def _receive(self):
+        inbox = self.state.inboxes[self.shard_id]
+        while True:
+            try:
+                batch = inbox.get(timeout=POLL_INTERVAL)
+            except Empty:
+                batch = None
+            with self.lock:
+                if batch is not None:
+                    for url, depth, linked in batch:
+                        super()._add_url(url, depth, linked)
+                    with self.state.lock:
+                        self.state.received.value += 1
+                        self.state.idle[self.shard_id] = 0
+                # Urls found by busy workers do not wait for a full batch.
+                self._flush()
+
+    def _finished(self):
+        ''' Publishes whether this shard is idle and returns True once the
+        whole crawl is done. Called with self.lock held. '''
+        self._flush()
+        stage = parse_pool.shared_stage
+        idle = not (
+            self.tbd_count or self.spill or self.handed_out or self.retry_heap
+            or (stage and stage.pending))
+        state = self.state
+        with state.lock:
+            state.idle[self.shard_id] = idle
+            if (idle and state.sent.value == state.received.value
+                    and all(state.idle)):
+                state.finished.value = 1
+            return bool(state.finished.value)
+
+    def _pop_ready_url(self):
+        url, wait = super()._pop_ready_url()
+        if url is not None:
+            self.handed_out.add(url)
+        return url, wait
+
+    def get_tbd_url(self):
+        with self.lock:
+            while True:
+                url, wait = self._pop_ready_url()
+                if url is not None:
+                    return url
+                if wait is None:
+                    if self.stopped or self._finished():
+                        return None
+                    wait = POLL_INTERVAL
+                self.host_ready.wait(wait)
+
+    def try_get_tbd_url(self):
+        with self.lock:
+            url, wait = self._pop_ready_url()
+            if url is None and wait is None and not (self.stopped or self._finished()):
+                wait = POLL_INTERVAL
+            return url, wait
+
+    def mark_url_complete(self, url, unchanged=False):
+        with self.lock:
+            super().mark_url_complete(url, unchanged)
+            self.handed_out.discard(url)
+
+    def release_url(self, url):
+        with self.lock:
+            self.handed_out.discard(url)
+
+
+def run_shard(config, restart, shard_id, state, worker_factory):
+    ''' Entry point of a shard process. Everything the shard writes (save
+    file, resume index, Logs, scraper output) goes under its shard_dir. '''
+    from crawler import Crawler
+    os.makedirs(shard_dir(shard_id), exist_ok=True)
+    os.chdir(shard_dir(shard_id))
+    config = copy.copy(config)
+    config.save_file = os.path.basename(config.save_file)
+    config.page_store = os.path.basename(config.page_store)
+    if config.metrics_port:
+        config.metrics_port += shard_id
+
+    def frontier_factory(config, restart):
+        return ShardedFrontier(config, restart, shard_id, state)
+
+    crawler = Crawler(
+        config, restart, frontier_factory=frontier_factory,
+        worker_factory=worker_factory)
+    # Crawler.join closes the frontier. Shard processes exit without
+    # running atexit handlers, so the log pipeline is stopped here.
+    crawler.start()
+    log_pipeline.stop()
+
+
+def merge_reports(config):
+    ''' Writes output.txt for the whole crawl from the shards' scraper
+    checkpoints and save files. Each page is fetched by exactly one shard,
+    so word counts add up. Links are tracked by the shard that found them,
+    so the unique pages are the union of the shards' tracked urls, and
+    subdomains are counted over the tracked urls saved by the shard owning
+    their host. '''
+    statistics = CrawlStatistics(top_k=50)
+    tracked_urls = SeenSet()
+    subdomains = Counter()
+    for shard_id in range(config.shards):
+        checkpoint = os.path.join(shard_dir(shard_id), scraper.STATISTICS_FILE)
+        if os.path.exists(checkpoint):
+            shard_statistics = CrawlStatistics.load(checkpoint)
+            statistics.seed(
+                shard_statistics.words, shard_statistics.longest_page_url,
+                shard_statistics.longest_page_words)
+        tracked_file = os.path.join(shard_dir(shard_id), scraper.TRACKED_URLS_FILE)
+        if os.path.exists(tracked_file):
+            tracked_urls.merge(SeenSet.load(tracked_file))
+    backend = get_backend(config.save_backend)
+    for shard_id in range(config.shards):
+        shard_config = copy.copy(config)
+        shard_config.save_file = shard_save_file(config, shard_id)
+        if not backend.exists(shard_config.save_file):
+            continue
+        save = backend(shard_config)
+        for url, _ in save.values():
+            # The frontier saves urls normalized, without a trailing slash.
+            if url not in tracked_urls and f"{url}/" not in tracked_urls:
+                continue
+            netloc = urlparse(url).netloc
+            if netloc.endswith(".ics.uci.edu"):
+                subdomains[netloc] += 1
+        save.close()
+    statistics.subdomains = subdomains
+    scraper.write_output("output.txt", len(tracked_urls), statistics)
+
+
+class ShardedCrawler(object):
+    ''' Runs config.shards crawler processes. Each owns the hosts that hash
+    to it (see shard_of), with its own save file, politeness state, workers
+    and scraper statistics under shards/shardN. Discovered urls are routed
+    to the owning shard in batches of config.shard_batch, and once every
+    shard is done their reports are merged into output.txt. '''
+    def __init__(self, config, restart, worker_factory=Worker):
+        self.config = config
+        self.restart = restart
+        self.logger = get_logger("CRAWLER")
+        self.worker_factory = worker_factory
+        self.processes = list()
+        # The shards stop and save on an interrupt, this process then
+        # merges what they saved.
+        catch_interrupts()
+
+    def start_async(self):
+        context = multiprocessing.get_context()
+        state = ShardState(self.config.shards, context)
+        self.processes = [
+            context.Process(
+                target=run_shard,
+                args=(self.config, self.restart, shard_id, state,
+                      self.worker_factory))
+            for shard_id in range(self.config.shards)]
+        for process in self.processes:
+            process.start()
+
+    def start(self):
+        self.start_async()
+        self.join()
+
+    def join(self):
+        for process in self.processes:
+            process.join()
+        self.logger.info("All shards are done, merging their reports.")
+        merge_reports(self.config)
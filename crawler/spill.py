@@ -0,0 +1,119 @@
+import os
+import struct
+from collections import deque
+
+# Record layout: url length, depth, in-links, url. Segments are rebuilt
+# from the resume index on every start, so they need no checksums.
+SPILL_HEADER = struct.Struct(">IHI")
+
+
+def encode_entry(url, depth, inlinks):
+    body = url.encode("utf-8")
+    return SPILL_HEADER.pack(
+        len(body), min(depth, 0xFFFF), min(inlinks, 0xFFFFFFFF)) + body
+
+
+def read_entries(fp, limit=None):
+    ''' Yields (url, depth, inlinks) from fp, at most limit of them. '''
+    while limit is None or limit > 0:
+        header = fp.read(SPILL_HEADER.size)
+        if len(header) < SPILL_HEADER.size:
+            return
+        url_len, depth, inlinks = SPILL_HEADER.unpack(header)
+        yield fp.read(url_len).decode("utf-8"), depth, inlinks
+        if limit is not None:
+            limit -= 1
+
+
+class SpillQueue(object):
+    ''' Pending urls that did not fit in the frontier's in-memory window,
+    first in, first out, in sequential segment files under directory.
+
+    push appends to the newest segment, starting another one every
+    segment_entries urls. pop_batch reads from the oldest and deletes it
+    once read, so the disk holds only what is still spilled and memory
+    only one write buffer and one read buffer. The files are not durable:
+    the resume index is, and the queue is rebuilt from it on restart. '''
+    def __init__(self, directory, segment_entries=1 << 16):
+        self.directory = directory
+        self.segment_entries = segment_entries
+        # Segment numbers, oldest first; the last one is being written.
+        self.segments = deque()
+        self.next_segment = 0
+        self.writer = None
+        self.written = 0
+        self.reader = None
+        self.count = 0
+        self.clear()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:08}.seg")
+
+    def clear(self):
+        ''' Drops every spilled url, including segments left by an earlier
+        run. '''
+        for fp in (self.writer, self.reader):
+            if fp is not None:
+                fp.close()
+        self.writer = self.reader = None
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".seg"):
+                    os.remove(os.path.join(self.directory, name))
+        self.segments.clear()
+        self.count = 0
+
+    def push(self, url, depth=0, inlinks=0):
+        if self.writer is None or self.written >= self.segment_entries:
+            if self.writer is not None:
+                self.writer.close()
+            os.makedirs(self.directory, exist_ok=True)
+            segment = self.next_segment
+            self.next_segment += 1
+            self.segments.append(segment)
+            self.writer = open(self._path(segment), "wb")
+            self.written = 0
+        self.writer.write(encode_entry(url, depth, inlinks))
+        self.written += 1
+        self.count += 1
+
+    def pop_batch(self, size):
+        ''' Removes and returns up to size of the oldest (url, depth,
+        inlinks). '''
+        batch = list()
+        while len(batch) < size and self.count:
+            segment = self.segments[0]
+            writing = len(self.segments) == 1
+            if writing:
+                self.writer.flush()
+            if self.reader is None:
+                self.reader = open(self._path(segment), "rb")
+            entries = list(read_entries(self.reader, size - len(batch)))
+            batch += entries
+            self.count -= len(entries)
+            if len(batch) < size or (not writing and not self.reader.peek(1)):
+                # The segment is read to its end.
+                self.reader.close()
+                self.reader = None
+                if writing:
+                    self.writer.close()
+                    self.writer = None
+                os.remove(self._path(self.segments.popleft()))
+        return batch
+
+    def __iter__(self):
+        ''' Yields every spilled (url, depth, inlinks), oldest first,
+        without removing them. '''
+        if self.writer is not None:
+            self.writer.flush()
+        for index, segment in enumerate(list(self.segments)):
+            with open(self._path(segment), "rb") as fp:
+                if index == 0 and self.reader is not None:
+                    fp.seek(self.reader.tell())
+                yield from read_entries(fp)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.clear()
@@ -0,0 +1,252 @@
+import atexit
+import json
+import os
+import re
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+
+# Dates (2020-01, 2020-01-31, 20200131) are generalized before numbers so
+# that calendar pages of every day share one template.
+DATE = re.compile(r"(19|20)\d\d[-_.]?(0[1-9]|1[0-2])([-_.]?([012]\d|3[01]))?(?!\d)")
+NUMBER = re.compile(r"\d+")
+HEX_ID = re.compile(r"^[0-9a-f]{16,}$|^[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}$", re.I)
+# Runs of a placeholder are collapsed into one with a +, so that every
+# level of a /year/month/day or endlessly deep archive shares a template.
+PLACEHOLDERS = {"{n}", "{date}", "{id}"}
+# Pages fetched but not yet completed, kept until mark_url_complete. Pages
+# whose parse failed are forgotten oldest first past this many.
+MAX_PENDING = 1 << 16
+# Save the state and the report every this many completed pages.
+SAVE_EVERY = 256
+
+
+def segment_template(segment):
+    if HEX_ID.match(segment):
+        return "{id}"
+    return NUMBER.sub("{n}", DATE.sub("{date}", segment))
+
+
+def section(url):
+    ''' (host, first path segment) of url. Links within a section, as to
+    the next page of a calendar or a deeper archive level, do not count
+    as discoveries. '''
+    parsed = urlparse(url)
+    return parsed.netloc, segment_template(parsed.path.lstrip("/").split("/", 1)[0])
+
+
+def url_template(url):
+    ''' Returns (host, template, query template) of url. The template is
+    the path with dates, numbers and ids generalized, then the
+    sorted names of its query parameters. The query template stands for
+    every query of the path, None when url has no query. '''
+    parsed = urlparse(url)
+    segments = list()
+    for segment in map(segment_template, parsed.path.split("/")):
+        if segment in PLACEHOLDERS and segments and segments[-1].rstrip("+") == segment:
+            segments[-1] = f"{segment}+"
+        else:
+            segments.append(segment)
+    path = "/".join(segments)
+    if not parsed.query:
+        return parsed.netloc, path, None
+    names = sorted({
+        parameter.partition("=")[0]
+        for parameter in parsed.query.split("&") if parameter})
+    return parsed.netloc, f"{path}?{'&'.join(names)}", f"{path}?*"
+
+
+class TemplateStats(object):
+    ''' What a url template of a host has yielded so far. '''
+    FIELDS = ("admitted", "fetched", "novel", "discovering", "blocked",
+              "pruned", "example")
+
+    def __init__(self, admitted=0, fetched=0, novel=0, discovering=0,
+                 blocked=0, pruned=False, example=""):
+        self.admitted = admitted
+        self.fetched = fetched
+        self.novel = novel
+        self.discovering = discovering
+        self.blocked = blocked
+        self.pruned = pruned
+        self.example = example
+
+    @property
+    def yield_rate(self):
+        ''' A page yields 1 if its content was new, 0.5 if only some of its
+        links to other sections were, and 0 otherwise. '''
+        if not self.fetched:
+            return 1.0
+        return (self.novel + 0.5 * self.discovering) / self.fetched
+
+    def to_list(self):
+        return [getattr(self, field) for field in self.FIELDS]
+
+
+class TrapDetector(object):
+    ''' Learns per host which url templates are crawler traps, from what
+    their fetched pages yielded, and blocks new urls of those templates.
+
+    For every fetched page it is told whether the scraper found its
+    content new (observe_page, fed by the simhash near-duplicate check)
+    and which new links it had out of its section (observe_link). Once a
+    template has
+    min_samples fetched pages and a yield under min_yield, it is pruned
+    and admit turns its urls away. A template with too few samples of
+    its own, as one of the many parameter combinations of a faceted
+    search, is judged by the query template of its path instead. '''
+    def __init__(self, path, report_path, min_samples=20, min_yield=0.2,
+                 restart=False):
+        self.logger = get_logger("TRAPS")
+        self.path = path
+        self.report_path = report_path
+        self.min_samples = min_samples
+        self.min_yield = min_yield
+        self.lock = Lock()
+        # host -> template -> TemplateStats
+        self.hosts = dict()
+        # url -> [novel, new links outside its section, section] of fetched
+        # pages.
+        self.pages = dict()
+        self.completed = 0
+        self.closed = False
+        if restart and os.path.exists(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            self._load()
+        atexit.register(self.close)
+
+    def _load(self):
+        with open(self.path) as state:
+            hosts = json.load(state)
+        self.hosts = {
+            host: {
+                template: TemplateStats(*fields)
+                for template, fields in templates.items()}
+            for host, templates in hosts.items()}
+        pruned = sum(
+            stats.pruned for templates in self.hosts.values()
+            for stats in templates.values())
+        self.logger.info(
+            f"Loaded {sum(map(len, self.hosts.values()))} url templates "
+            f"of {len(self.hosts)} hosts, {pruned} of them pruned.")
+
+    def _stats(self, url):
+        ''' (template, TemplateStats) of url's template, then of its query
+        template if it has a query. Called with self.lock held. '''
+        host, *names = url_template(url)
+        templates = self.hosts.get(host)
+        if templates is None:
+            templates = self.hosts[host] = dict()
+        found = list()
+        for name in names:
+            if name is None:
+                break
+            stats = templates.get(name)
+            if stats is None:
+                stats = templates[name] = TemplateStats(example=url)
+            found.append((name, stats))
+        return host, found
+
+    def admit(self, url):
+        ''' False if url belongs to a pruned template. '''
+        with self.lock:
+            _, found = self._stats(url)
+            stats = found[0][1]
+            judged = stats
+            if (len(found) > 1 and not stats.pruned
+                    and stats.fetched < self.min_samples):
+                judged = found[1][1]
+            if judged.pruned:
+                judged.blocked += 1
+                return False
+            stats.admitted += 1
+            return True
+
+    def observe_page(self, url, novel):
+        ''' Called by the scraper for every page it records. '''
+        with self.lock:
+            self._page(url)[0] = novel
+
+    def observe_link(self, parent, url):
+        ''' Called for every link the scraper passed on from parent's page,
+        links it has already tracked being filtered out before. '''
+        link_section = section(url)
+        with self.lock:
+            page = self._page(parent)
+            if link_section != page[2]:
+                page[1] += 1
+
+    def _page(self, url):
+        page = self.pages.get(url)
+        if page is None:
+            page = self.pages[url] = [False, 0, section(url)]
+            if len(self.pages) > MAX_PENDING:
+                del self.pages[next(iter(self.pages))]
+        return page
+
+    def complete(self, url):
+        ''' Counts what the page of url yielded toward its template. '''
+        with self.lock:
+            novel, links, _ = self.pages.pop(url, (False, 0, None))
+            host, found = self._stats(url)
+            for template, stats in found:
+                stats.fetched += 1
+                if novel:
+                    stats.novel += 1
+                elif links:
+                    stats.discovering += 1
+                if (not stats.pruned and stats.fetched >= self.min_samples
+                        and stats.yield_rate < self.min_yield):
+                    stats.pruned = True
+                    stats.example = url
+                    self.logger.info(
+                        f"Pruning {host}{template}: yield "
+                        f"{stats.yield_rate:.2f} over {stats.fetched} pages.")
+            self.completed += 1
+            if self.completed % SAVE_EVERY == 0:
+                self._save()
+
+    def _save(self):
+        # Called with self.lock held.
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as state:
+            json.dump({
+                host: {
+                    template: stats.to_list()
+                    for template, stats in templates.items()}
+                for host, templates in self.hosts.items()}, state)
+        os.replace(tmp_path, self.path)
+        self._write_report()
+
+    def report(self):
+        ''' Lines describing every pruned template and the urls blocked
+        because of it, most blocked first. '''
+        pruned = sorted((
+            (stats.blocked, host, template, stats)
+            for host, templates in self.hosts.items()
+            for template, stats in templates.items() if stats.pruned),
+            key=lambda item: item[0], reverse=True)
+        lines = [
+            f"Pruned url templates: {len(pruned)}, "
+            f"urls blocked: {sum(item[0] for item in pruned)}"]
+        for blocked, host, template, stats in pruned:
+            lines.append(
+                f"{host}{template}: blocked {blocked} urls. "
+                f"{stats.fetched} pages fetched, {stats.novel} with new "
+                f"content and {stats.discovering} with only new links, "
+                f"yield {stats.yield_rate:.2f} < {self.min_yield}. "
+                f"e.g. {stats.example}")
+        return lines
+
+    def _write_report(self):
+        with open(self.report_path, "w") as report:
+            report.write("\n".join(self.report()) + "\n")
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self._save()
+            self.closed = True
@@ -1,90 +1,143 @@
-from threading import Event, Thread, Timer
+from threading import Event, Thread, current_thread, main_thread
 import signal
-import sys
 import time
 
+from functools import lru_cache
 from inspect import getsource
-from urllib.parse import urldefrag
+from crawler.concurrency import get_controller
+from crawler.page_store import get_page_store
+from crawler.parse_pool import get_parse_stage
+from crawler.retry import classify
 from utils.download import download
-from utils import get_logger
+from utils import crawl_log, get_logger
 import scraper
 
 
+# Set by the first interrupt. Workers stop taking urls, and Crawler.join
+# saves the statistics on the main thread once they are done.
+interrupted = Event()
+
+
 # Define the signal handler to handle interruptions
 def handle_interrupt(signum, frame):
-    scraper.print_statistics()  # Print crawler statistics before exiting
-    print("Process paused.")
-    sys.exit(0)
+    # No I/O here: an interrupt arriving during a save must not re-enter
+    # it, since the save holds scraper.file_lock.
+    if not interrupted.is_set():
+        print("Pausing, saving the crawler statistics once the workers stop.")
+    interrupted.set()
+
+
+def catch_interrupts():
+    ''' Routes SIGINT to handle_interrupt. Signal handlers can only be set
+    from the main thread. '''
+    if current_thread() is main_thread():
+        signal.signal(signal.SIGINT, handle_interrupt)
 
-signal.signal(signal.SIGINT, handle_interrupt)
+@lru_cache(maxsize=None)
+def check_scraper_source():
+    # Ensure no usage of forbidden modules in scraper, once per process.
+    source = getsource(scraper)
+    assert {source.find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
+    assert {source.find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
-        # Ensure no usage of forbidden modules in scraper
-        assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
-        assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+        self.parse_stage = get_parse_stage(config, frontier)
+        self.controller = get_controller(config, frontier)
+        self.page_store = get_page_store(config)
+        check_scraper_source()
         super().__init__(daemon=True)
         
     def run(self):
-        visited_urls = set()
         word_statistics = {}
         max_word_count_url = ""
         max_word_count = 0
 
-        # Create an event object to handle timeout
-        timeout_signal = Event()
-
-        # Read the log file to load previously downloaded URLs
-        with open('Logs/Worker.log', 'r') as log_file:
-            for log_entry in log_file:
-                if 'Downloaded' in log_entry and 'status' in log_entry:
-                    downloaded_url = log_entry.split()[1].rstrip(',')
-                    # Remove fragments from URL for uniqueness
-                    downloaded_url = urldefrag(downloaded_url)[0]
-                    visited_urls.add(downloaded_url)
-        
         try:
             while True:
-                # Reset the timeout event and start a timer for each URL
-                timeout_signal.clear()
-                timeout_timer = Timer(10, timeout_signal.set)
-                timeout_timer.start()
-
+                tbd_url = None
                 try:
                     tbd_url = self.frontier.get_tbd_url()
                     if not tbd_url:
+                        # Pages still being parsed may add more urls.
+                        if self.parse_stage and self.parse_stage.wait_idle():
+                            continue
                         self.logger.info("Frontier is empty. Stopping Crawler.")
                         break
 
-                    response = download(tbd_url, self.config, self.logger)
-                    self.logger.info(
-                        f"Downloaded {tbd_url}, status <{response.status}>, "
-                        f"using cache {self.config.cache_server}."
-                    )
+                    fetch_start = time.time()
+                    response = self.fetch(tbd_url)
+                    crawl_log.record(
+                        "fetch", tbd_url, response.status, time.time() - fetch_start)
+                    if self.page_store:
+                        self.page_store.add(tbd_url, response)
 
-                    if response.status == 200:
-                        extracted_urls = scraper.scraper(tbd_url, response, visited_urls, word_statistics, max_word_count_url, max_word_count)
+                    if response.status != 200:
+                        self.frontier.fail_url(tbd_url, classify(response.status))
+                    elif not scraper.accept_response(response):
+                        # Nothing to parse, nor to hash for the recrawl index.
+                        self.frontier.unchanged(tbd_url, response, accepted=False)
+                        self.frontier.mark_url_complete(tbd_url)
+                    elif self.frontier.unchanged(tbd_url, response):
+                        crawl_log.record("unchanged", tbd_url)
+                        self.frontier.mark_url_complete(tbd_url, unchanged=True)
+                    elif self.parse_stage:
+                        scraper.initialize(word_statistics, max_word_count_url, max_word_count)
+                        self.parse_stage.submit(tbd_url, response)
+                    else:
+                        extracted_urls = scraper.scraper(tbd_url, response, word_statistics, max_word_count_url, max_word_count)
                         for extracted_url in extracted_urls:
-                            self.frontier.add_url(extracted_url)
+                            self.frontier.add_url(extracted_url, tbd_url)
                         self.frontier.mark_url_complete(tbd_url)
                 except Exception as error:
-                    self.logger.error(f"An exception occurred: {error}")
+                    # requests is not imported here, so its timeouts are
+                    # told apart by classify.
+                    error_class = classify(error=error)
+                    if error_class == "timeout":
+                        crawl_log.record("timeout", tbd_url, detail=str(error))
+                    else:
+                        self.logger.error(f"An exception occurred: {error}")
+                        crawl_log.record("error", tbd_url, detail=str(error))
+                    if tbd_url:
+                        self.frontier.fail_url(tbd_url, error_class)
                     continue
                 finally:
-                    timeout_timer.cancel()    
-
-                # Skip URL if timeout occurs
-                if timeout_signal.is_set():
-                    self.logger.info(f"Timeout reached for URL {tbd_url}. Skipping.")
-                    continue
+                    if tbd_url:
+                        self.frontier.release_url(tbd_url)
 
-                time.sleep(self.config.time_delay)
+                self.politeness_sleep()
             
-            # Print final statistics when crawling is complete
-            scraper.print_statistics()
+            # Print final statistics when crawling is complete, an
+            # interrupted crawl prints them on the main thread.
+            if not interrupted.is_set():
+                scraper.print_statistics()
         except Exception as error:
             scraper.print_statistics()  # Print statistics on unexpected error
             self.logger.error(f"Unexpected error: {error}")
+
+    def fetch(self, url):
+        ''' Downloads url, within the adaptive concurrency limit if any. '''
+        if self.controller is None:
+            return download(url, self.config, self.logger)
+        self.controller.acquire()
+        fetch_start = time.time()
+        status = None
+        timed_out = False
+        try:
+            response = download(url, self.config, self.logger)
+            status = response.status
+            return response
+        except Exception as error:
+            timed_out = classify(error=error) == "timeout"
+            raise
+        finally:
+            self.controller.release(
+                url, time.time() - fetch_start, status, timed_out)
+
+    def politeness_sleep(self):
+        # The adaptive controller paces hosts through the frontier instead.
+        if self.controller is None:
+            time.sleep(self.config.time_delay)
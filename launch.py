@@ -3,15 +3,29 @@ from argparse import ArgumentParser
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
-from crawler import Crawler
+from crawler import Crawler, ShardedCrawler, ENGINES
+from crawler.offline import reprocess
 
 
-def main(config_file, restart):
+def main(config_file, restart, engine=None, shards=None, offline=False,
+         recrawl=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
+    if engine:
+        config.engine = engine
+    if shards:
+        config.shards = shards
+    if recrawl:
+        config.recrawl = True
+    if offline:
+        reprocess(config)
+        return
     config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    if config.shards > 1:
+        crawler = ShardedCrawler(config, restart, worker_factory=ENGINES[config.engine])
+    else:
+        crawler = Crawler(config, restart, worker_factory=ENGINES[config.engine])
     crawler.start()
 
 
@@ -19,5 +33,10 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", type=str, choices=sorted(ENGINES), default=None)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--offline", action="store_true", default=False)
+    parser.add_argument("--recrawl", action="store_true", default=False)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.engine, args.shards, args.offline,
+         args.recrawl)
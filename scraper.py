@@ -1,25 +1,58 @@
 from collections import Counter
+import os
 import re
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin, urldefrag
+from urllib.parse import urlparse
 from threading import Lock
-from simhash import Simhash, SimhashIndex
+from utils import crawl_log, normalize_all
+from utils.html_extract import extract_text_and_links
+from utils.near_dup import NearDupIndex, content_checksum
+from utils.seen_set import SeenSet
+from utils.statistics import CrawlStatistics
+from utils.url_filter import UrlFilter
 
 # Global variables for tracking visited URLs and word statistics
-tracked_urls = set()
-word_frequency = {}
-max_words_page_url = ""
-max_words_count = 0
-redirect_tracking = Counter()
-page_simhashes = {}
-simhash_index = SimhashIndex([], k=3)
+tracked_urls = SeenSet()
+statistics = CrawlStatistics(top_k=50)
+near_duplicates = NearDupIndex(k=3)
+# Called with (url, novel) for every recorded page, novel being False for
+# near duplicates. The frontier's trap detector learns from it.
+page_observers = []
+# Called with (url, simhash value, extracted links) for every parsed page,
+# before the near-duplicate check. The frontier's recrawl index keeps them.
+parse_observers = []
 
 # Lock for thread-safe writing to output file
 file_lock = Lock()
+# Serializes writing the checkpoint files, which happens outside file_lock
+# from copies taken under it. A copy older than the last one written is
+# dropped rather than written over it.
+checkpoint_lock = Lock()
+checkpoints_taken = 0
+checkpoints_written = 0
 
 update_interval = 0
-php_trap_counter = Counter()
-url_trap_counter = Counter()
+save_count = 0
+output_loaded = False
+
+# Crawl scope, compiled once into url_filter
+ALLOWED_DOMAINS = {"uci.edu"}
+ALLOWED_SUBDOMAINS = {"ics", "cs", "informatics", "stat"}
+url_filter = UrlFilter(
+    ALLOWED_DOMAINS, ALLOWED_SUBDOMAINS,
+    is_tracked=lambda url: url in tracked_urls)
+
+# Compact copies of tracked_urls, near_duplicates and the full statistics,
+# reloaded on restart
+TRACKED_URLS_FILE = "tracked_urls.seen"
+NEAR_DUPLICATES_FILE = "near_duplicates.index"
+STATISTICS_FILE = "statistics.ckpt"
+# Write the three checkpoint files on every this many saves of output.txt,
+# and at shutdown. Each is a full copy, too large to write on every save.
+CHECKPOINT_INTERVAL = 10
+
+MAX_CONTENT_LENGTH = 10_000_000  # 10MB limit example
+TEXT_CONTENT_TYPE = re.compile(
+    r"\s*(text/|application/(xhtml\+)?xml\b|application/[\w.-]+\+xml\b)", re.IGNORECASE)
 
 # Default list of common English stopwords
 stopwords = set([
@@ -43,35 +76,61 @@ stopwords = set([
 ])
 
 
-def save_to_output():
+def write_output(path, unique_pages, crawl_statistics):
+    """Write the crawler report for the given statistics to path"""
+    with open(path, 'w') as file:
+        # Save the total count of unique pages visited
+        file.write(f"Total unique pages: {unique_pages}\n")
+        
+        # Save the page with the highest word count
+        file.write(f"Page with the highest word count: {crawl_statistics.longest_page_url} (Words: {crawl_statistics.longest_page_words})\n")
+        
+        # Save the top 50 most frequent words
+        top_words = crawl_statistics.top(50)
+        file.write("Top 50 most frequent words:\n")
+        for word, count in top_words:
+            file.write(f"{word}: {count}\n")
+        
+        # Save subdomain statistics for .ics.uci.edu
+        file.write("\nSubdomain statistics for .ics.uci.edu:\n")
+        for subdomain, subdomain_count in crawl_statistics.subdomain_counts():
+            file.write(f"{subdomain}, {subdomain_count}\n")
+
+def save_to_output(checkpoint=False):
     """Thread-safe function to save crawler statistics to output.txt"""
+    global save_count, checkpoints_taken, checkpoints_written
+
+    # A run that parsed nothing yet must not overwrite the saved state
+    # with empty statistics.
+    initialize({}, "", 0)
+    snapshots = None
     with file_lock:
         try:
-            with open("output.txt", 'w') as file:
-                # Save the total count of unique pages visited
-                file.write(f"Total unique pages: {len(tracked_urls)}\n")
-                
-                # Save the page with the highest word count
-                file.write(f"Page with the highest word count: {max_words_page_url} (Words: {max_words_count})\n")
-                
-                # Save the top 50 most frequent words
-                top_words = sorted(word_frequency.items(), key=lambda x: x[1], reverse=True)[:50]
-                file.write("Top 50 most frequent words:\n")
-                for word, count in top_words:
-                    file.write(f"{word}: {count}\n")
-                
-                # Save subdomain statistics for .ics.uci.edu
-                subdomains = Counter()
-                for tracked_url in tracked_urls:
-                    parsed = urlparse(tracked_url)
-                    if parsed.netloc.endswith('.ics.uci.edu'):
-                        subdomains[parsed.netloc] += 1
-                
-                file.write("\nSubdomain statistics for .ics.uci.edu:\n")
-                for subdomain, subdomain_count in sorted(subdomains.items()):
-                    file.write(f"{subdomain}, {subdomain_count}\n")
+            statistics.merge()
+            write_output("output.txt", len(tracked_urls), statistics)
+            save_count = (save_count + 1) % CHECKPOINT_INTERVAL
+            if checkpoint or save_count == 0:
+                # Only copied here, the files are written after the lock
+                # is released.
+                checkpoints_taken += 1
+                sequence = checkpoints_taken
+                snapshots = [
+                    (tracked_urls, TRACKED_URLS_FILE, tracked_urls.snapshot()),
+                    (near_duplicates, NEAR_DUPLICATES_FILE, near_duplicates.snapshot()),
+                    (statistics, STATISTICS_FILE, statistics.snapshot())]
         except Exception as err:
             print(f"Error occurred while writing to output.txt: {err}")
+    if snapshots is None:
+        return
+    with checkpoint_lock:
+        if sequence < checkpoints_written:
+            return
+        try:
+            for state, path, snapshot in snapshots:
+                state.save(path, snapshot)
+            checkpoints_written = sequence
+        except Exception as err:
+            print(f"Error occurred while writing the checkpoint files: {err}")
 
 def handle_response_error(resp):
     """Handles response errors based on status codes to determine further processing."""
@@ -88,29 +147,58 @@ def handle_response_error(resp):
             605: "Invalid file extension detected.",
             608: "Access denied by robots.txt."
         }
-        print(f"Critical Error {error_code}: {critical_errors[error_code]}")
+        crawl_log.record("cache_error", resp.url, error_code, detail=critical_errors[error_code])
         return False
 
     # Errors to handle with specific action
     elif error_code in [606, 607]:
         if error_code == 607:
             content_length = resp.headers.get('content-length', 'unknown')
-            print(f"Error 607: Content exceeds size limit - {content_length} bytes")
+            crawl_log.record("cache_error", resp.url, error_code, detail=f"Content exceeds size limit - {content_length} bytes")
         elif error_code == 606:
-            print(f"Error 606: Cannot parse URL.")
+            crawl_log.record("cache_error", resp.url, error_code, detail="Cannot parse URL.")
         return False
 
     # Ignorable errors that can be skipped
     elif error_code in [600, 601, 602]:
-        print(f"Ignorable error {error_code}: Continuing with next URL.")
+        crawl_log.record("cache_error", resp.url, error_code, detail="Ignorable error, continuing with next URL.")
         return True
 
     return True
 
+def track_urls(urls):
+    """Add urls to tracked_urls, counting new .ics.uci.edu subdomain pages"""
+    for url in urls:
+        if tracked_urls.add(url):
+            netloc = urlparse(url).netloc
+            if netloc.endswith('.ics.uci.edu'):
+                statistics.add_subdomain(netloc)
+
 def load_from_output():
-    """Function to restore statistics from output.txt"""
-    global word_frequency, max_words_page_url, max_words_count
-    
+    """Function to restore statistics from the checkpoint, or from output.txt"""
+    global tracked_urls, near_duplicates, statistics
+
+    if os.path.exists(TRACKED_URLS_FILE):
+        try:
+            tracked_urls = SeenSet.load(TRACKED_URLS_FILE)
+        except Exception as err:
+            print(f"Error occurred while reading {TRACKED_URLS_FILE}: {err}")
+    if os.path.exists(NEAR_DUPLICATES_FILE):
+        try:
+            near_duplicates = NearDupIndex.load(NEAR_DUPLICATES_FILE)
+        except Exception as err:
+            print(f"Error occurred while reading {NEAR_DUPLICATES_FILE}: {err}")
+    if os.path.exists(STATISTICS_FILE):
+        try:
+            statistics = CrawlStatistics.load(STATISTICS_FILE, top_k=50)
+            return
+        except Exception as err:
+            print(f"Error occurred while reading {STATISTICS_FILE}: {err}")
+
+    # No checkpoint, fall back to the partial statistics in output.txt
+    word_frequency = {}
+    max_words_page_url = ""
+    max_words_count = 0
     try:
         with open('output.txt', 'r') as file:
             lines = file.readlines()
@@ -119,193 +207,153 @@ def load_from_output():
                 line = lines[index]
                 # Restore word frequency
                 if line.startswith("Top 50 most frequent words:"):
-                    word_frequency = {}
                     index += 1
                     while index < len(lines) and lines[index].strip() != "":
                         word, count = lines[index].split(": ")
                         word_frequency[word] = int(count)
                         index += 1
+                # Restore subdomain statistics
+                elif line.startswith("Subdomain statistics for .ics.uci.edu:"):
+                    index += 1
+                    while index < len(lines) and lines[index].strip() != "":
+                        subdomain, count = lines[index].rsplit(", ", 1)
+                        statistics.subdomains[subdomain] = int(count)
+                        index += 1
                 # Restore the page with the most words
                 elif line.startswith("Page with the highest word count:"):
-                    parts = line.strip().split(' ')
-                    max_words_page_url = parts[5]
-                    max_words_count = int(parts[-1])
+                    match = re.match(r"Page with the highest word count: (\S*) ?\(Words: (\d+)\)", line)
+                    if match:
+                        max_words_page_url = match.group(1)
+                        max_words_count = int(match.group(2))
                 index += 1
     except FileNotFoundError:
-        # Initialize with empty values if the file does not exist
-        word_frequency = {}
-        max_words_count = 0
-        max_words_page_url = ""
+        # Nothing to restore if the file does not exist
+        pass
     except Exception as err:
         print(f"Error occurred while reading from output.txt: {err}")
-        word_frequency = {}
-        max_words_count = 0
-        max_words_page_url = ""
+    statistics.seed(word_frequency, max_words_page_url, max_words_count)
 
 
-def scraper(url, resp, unique_pages, word_count_data, longest_url, longest_word_count):
-    """Scraper function to extract valid links and update statistics"""
-    global max_words_count, max_words_page_url, tracked_urls, word_frequency
-    
-    # Initialize data from saved output or passed parameters
-    if not tracked_urls:
-        tracked_urls = unique_pages
-        load_from_output()
-    if not word_frequency:
-        word_frequency = word_count_data
-    if not max_words_page_url:
-        max_words_page_url = longest_url
-    if max_words_count == 0:
-        max_words_count = longest_word_count
-    
+def initialize(word_count_data, longest_url, longest_word_count):
+    """Restore statistics once per process from saved output or passed parameters"""
+    global output_loaded
+
+    with file_lock:
+        if not output_loaded:
+            load_from_output()
+            statistics.seed(word_count_data, longest_url, longest_word_count)
+            output_loaded = True
+
+def accept_response(resp):
+    """Check whether a response should be parsed at all, before its body is decoded"""
     # Handle response errors
     if not handle_response_error(resp):
-        return []
+        return False
 
-    # Check content size (Error 607)
-    if resp.raw_response and 'content-length' in resp.raw_response.headers:
-        content_length = int(resp.raw_response.headers['content-length'])
-        if content_length > 10_000_000:  # 10MB limit example
-            print(f"Error 607: Content too large ({content_length} bytes)")
-            return []
+    # Only successful pages are parsed, the others are never decoded
+    if resp.status != 200:
+        return False
+
+    # Check content size (Error 607), known without decoding the body
+    content_length = resp.size
+    if 'content-length' in resp.headers:
+        content_length = max(content_length, int(resp.headers['content-length']))
+    if content_length > MAX_CONTENT_LENGTH:
+        crawl_log.record("skip", resp.url, detail=f"Content too large ({content_length} bytes)")
+        return False
+
+    # Skip binaries (pdf, images, archives) served with a non-text type
+    content_type = resp.headers.get('content-type', '')
+    if content_type and not TEXT_CONTENT_TYPE.match(content_type):
+        crawl_log.record("skip", resp.url, detail=f"Non-text content type {content_type}")
+        return False
+    return True
+
+def page_content(resp):
+    """Return the body of a successful response as a memoryview, or None"""
+    if resp.status == 200 and resp.body:
+        return resp.body
+    return None
+
+def scraper(url, resp, word_count_data, longest_url, longest_word_count):
+    """Scraper function to extract valid links and update statistics"""
+    initialize(word_count_data, longest_url, longest_word_count)
+    if not accept_response(resp):
+        return []
 
     extracted_links = extract_next_links(url, resp)
-    valid_links = []
-    i = 0
-    while i < len(extracted_links):
-        link = extracted_links[i]
-        if is_valid(link):
-            valid_links.append(link)
-        i += 1
-    tracked_urls.update(valid_links)
+    return filter_links(extracted_links)
+
+def filter_links(extracted_links):
+    """Keep the canonical forms of valid links, track them and periodically save statistics"""
+    global update_interval
+
+    valid_links = url_filter.filter(normalize_all(extracted_links))
+    track_urls(valid_links)
     
     # Periodically save statistics to output.txt
-    global update_interval
-    update_interval = (update_interval + 1) % 50
-    if update_interval == 0:
+    with file_lock:
+        update_interval = (update_interval + 1) % 50
+        save_now = update_interval == 0
+    if save_now:
         save_to_output()
     
     return valid_links
 
 def extract_next_links(url, resp):
     """Extract links from the page, process text, and update statistics"""
-    global max_words_count, max_words_page_url, tracked_urls, word_frequency, update_interval
+    content = page_content(resp)
+    if content is None:
+        return []
+    return record_page(url, *parse_content(url, content))
+
+def parse_content(url, content):
+    """Parse a page into (links, word counts, simhash value, text checksum).
+
+    Pure function of its arguments so it can run in a worker process."""
+    # Imported on first use: simhash pulls in numpy, which slows startup.
+    from simhash import Simhash
+    # Visible text and absolute, defragmented links in one streaming pass
+    text_content, extracted_links = extract_text_and_links(url, content)
+    text_content = text_content.lower()
+    words = Counter(word for word in re.findall(r"\b[a-zA-Z]{2,}\b", text_content) if word not in stopwords and not word.isdigit())
+
+    return extracted_links, words, Simhash(text_content).value, content_checksum(text_content)
+
+def record_page(url, extracted_links, words, fingerprint, checksum):
+    """Merge a parsed page into the statistics, dropping near duplicates"""
+    # Use the checksum and simhash to detect identical and similar pages
+    for observer in parse_observers:
+        observer(url, fingerprint, extracted_links)
+    duplicate = near_duplicates.is_duplicate(checksum, fingerprint)
+    for observer in page_observers:
+        observer(url, not duplicate)
+    if duplicate:
+        crawl_log.record("skip", url, detail="Similar page")
+        return []
 
-    extracted_links = []
-
-    if resp.status == 200 and resp.raw_response and resp.raw_response.content:
-        soup = BeautifulSoup(resp.raw_response.content, 'lxml')
-        text_content = soup.get_text().lower()
-        words = [word for word in re.findall(r"\b[a-zA-Z]{2,}\b", text_content) if word not in stopwords and not word.isdigit()]
-        
-        # Calculate simhash to detect similar pages
-        current_simhash = Simhash(text_content)
-        if simhash_index.get_near_dups(current_simhash):
-            print(f"Skipping similar page: {url}")
-            return []
-        else:
-            simhash_index.add(url, current_simhash)
-
-        # Update page with the most words
-        word_count = len(words)
-        if word_count > max_words_count:
-            max_words_count = word_count
-            max_words_page_url = url
-
-        # Update word frequency
-        for word in words:
-            word_frequency[word] = word_frequency.get(word, 0) + 1
-
-        # Extract all hyperlinks from the page
-        anchors = soup.find_all('a', href=True)
-        i = 0
-        while i < len(anchors):
-            abs_url, _ = urldefrag(urljoin(url, anchors[i]['href']))
-            extracted_links.append(abs_url)
-            i += 1
+    # Update word frequency and the page with the most words
+    statistics.add_page(url, words)
 
     return extracted_links
 
 
 def is_valid(url):
     """Check if a URL is valid for crawling"""
-    global php_trap_counter, redirect_tracking
-
-    try:
-        parsed = urlparse(url)
-        allowed_subdomains = {"ics", "cs", "informatics", "stat"}
-        allowed_domains = {"uci.edu"}
-        netloc_parts = parsed.netloc.split('.')
-
-        # Check if the domain and subdomain are valid
-        if len(netloc_parts) < 2:
-            return False
-        if redirect_tracking[url] > 5:
-            return False
-
-        redirect_tracking[url] += 1
-
-        domain = ".".join(netloc_parts[-2:])
-        if domain not in allowed_domains:
-            return False
-        if len(netloc_parts) > 2 and netloc_parts[-3] not in allowed_subdomains:
-            return False
-
-        # Additional filtering to avoid traps and unwanted patterns
-        if repeating_path(parsed.path):
-            return False
-        if parsed.path.count("/") > 5:
-            return False
-        if re.search(r'\d{4}-\d{2}', url):
-            return False
-        if url in tracked_urls:
-            return False
-        if parsed.query.count("%") >= 3 or parsed.query.count("=") >= 3 or parsed.query.count("&") >= 3:
-            return False
-        if parsed.scheme not in {"http", "https"}:
-            return False
-        if re.match(r".*\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|pdf|docx|pptx|exe|zip|rar|gz)$", parsed.path.lower()):
-            return False
-
-        # Check for PHP trap URLs
-        php_url = url.strip().split(".php")[0] + ".php"
-        if php_trap_counter[php_url] > 10:
-            return False
-        php_trap_counter[php_url] += 1
-
-        if url_trap_counter[parsed.netloc + parsed.path] > 10:
-            return False
-        url_trap_counter[parsed.netloc + parsed.path] += 1
-
-        return True
-    except Exception as e:
-        print(f"Error processing URL {url}: {e}")
-        return False
-
-def repeating_path(path):
-    """Detect repeating segments within a given path"""
-    path_segments = path.strip("/").split('/')
-    
-    # Check if a segment is followed by itself
-    for i in range(len(path_segments) - 1):
-        if path_segments[i] == path_segments[i + 1]:
-            return True
-    
-    # Count segment occurrences and identify potential traps
-    segment_frequency = {}
-    for segment in path_segments:
-        segment_frequency[segment] = segment_frequency.get(segment, 0) + 1
-        if segment_frequency[segment] >= 3:
-            return True
+    return url_filter.is_valid(url)
 
-    return False
+def in_scope(url):
+    """Check a URL against the crawl scope without counting it as a visit"""
+    return url_filter.in_scope(url)
 
 def print_statistics():
     """Display and save crawler statistics"""
+    initialize({}, "", 0)
+    statistics.merge()
     stats_header = "\nCrawler Statistics Overview:"
     unique_pages_info = f"Total number of unique pages visited: {len(tracked_urls)}"
-    longest_page_info = f"URL of the page with the most words: {max_words_page_url}"
-    word_count_info = f"Word count of the longest page: {max_words_count}"
+    longest_page_info = f"URL of the page with the most words: {statistics.longest_page_url}"
+    word_count_info = f"Word count of the longest page: {statistics.longest_page_words}"
     
     print(stats_header)
     print(unique_pages_info)
@@ -313,9 +361,9 @@ def print_statistics():
     print(word_count_info)
     print("Top 10 frequent words found:")
 
-    top_10_words = sorted(word_frequency.items(), key=lambda x: x[1], reverse=True)[:10]
+    top_10_words = statistics.top(10)
     for word, count in top_10_words:
         print(f"{word}: {count}")
         
     # Save the output to a file
-    save_to_output()
+    save_to_output(checkpoint=True)
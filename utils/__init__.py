@@ -1,35 +1,36 @@
-import os
 import logging
-from hashlib import sha256
+from hashlib import blake2b, sha256
 from urllib.parse import urlparse
 
+from utils import canonical, log_pipeline
+
 def get_logger(name, filename=None):
+    # Records are queued and written to Logs/<filename or name>.log and the
+    # console by a background thread (utils/log_pipeline.py).
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    log_pipeline.attach(logger, filename if filename else name)
     return logger
 
 
-def get_urlhash(url):
+def _url_key(url):
     parsed = urlparse(url)
     # everything other than scheme.
-    return sha256(
+    return (
         f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
-        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8"))
+
+def get_urlhash(url):
+    return sha256(_url_key(url)).hexdigest()
+
+def get_urldigest(url, size=8):
+    """Fixed width binary digest of the url, for compact seen-url sets."""
+    return blake2b(_url_key(url), digest_size=size).digest()
 
 def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+    """Canonical form of url, see utils/canonical.py."""
+    return canonical.canonicalizer.canonicalize(url)
+
+def normalize_all(urls):
+    """Canonical forms of a page of links, without repeats."""
+    return canonical.canonicalizer.canonicalize_all(urls)
@@ -0,0 +1,111 @@
+import asyncio
+import cbor
+from urllib.parse import urlencode
+
+from utils.response import Response
+
+
+class ConnectionPool(object):
+    ''' Keep-alive HTTP/1.1 connections to the cache server.
+
+    At most size requests are in flight at once; finished connections go
+    back to the idle list and are reused by the next request. '''
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self.idle = list()
+        self.slots = asyncio.Semaphore(size)
+
+    async def get(self, target, timeout=None, connect_timeout=None):
+        ''' Returns (status, body) for a GET of target, within timeout for
+        the request and connect_timeout (timeout if None) for opening a new
+        connection. '''
+        async with self.slots:
+            # A reused connection may have been closed by the server while
+            # idle; retry once on a fresh one in that case.
+            while self.idle:
+                reader, writer = self.idle.pop()
+                try:
+                    return await asyncio.wait_for(
+                        self._request(reader, writer, target), timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                except BaseException:
+                    writer.close()
+                    raise
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                timeout if connect_timeout is None else connect_timeout)
+            try:
+                return await asyncio.wait_for(
+                    self._request(reader, writer, target), timeout)
+            except BaseException:
+                writer.close()
+                raise
+
+    async def _request(self, reader, writer, target):
+        writer.write(
+            f"GET {target} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Connection: keep-alive\r\n"
+            f"Accept-Encoding: identity\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        try:
+            status_line = await reader.readuntil(b"\r\n")
+        except asyncio.IncompleteReadError as err:
+            raise ConnectionError("Connection closed by cache server.") from err
+        status = int(status_line.split()[1])
+        headers = dict()
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = list()
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # Skip trailers.
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+            keep_alive = True
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+            keep_alive = True
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        if keep_alive and headers.get("connection", "").lower() != "close":
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, body
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = list()
+
+
+async def download_async(url, config, pool, logger=None, timeout=None):
+    ''' Asyncio counterpart of utils.download.download over a shared pool. '''
+    target = "/?" + urlencode([("q", f"{url}"), ("u", f"{config.user_agent}")])
+    status, body = await pool.get(target, timeout, config.connect_timeout)
+    try:
+        if status < 400 and body:
+            return Response(cbor.loads(body))
+    except (EOFError, ValueError):
+        pass
+    logger.error(f"Spacetime Response error <{status}> with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error <{status}> with url {url}.",
+        "status": status,
+        "url": url})
@@ -0,0 +1,144 @@
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+# Session ids, trackers and share buttons: the same page under another url.
+# A trailing * matches any parameter name with that prefix.
+STRIP_PARAMS = (
+    "utm_*", "fbclid", "gclid", "sessionid", "sid", "phpsessid", "jsessionid",
+    "share", "replytocom")
+# Last path segments that name the default page of their directory.
+INDEX_PAGES = ("index.html", "index.htm")
+UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+PERCENT_ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+# Left as they are in a path or query: reserved characters and escapes.
+PATH_SAFE = "/%:@!$&'()*+,;=~"
+QUERY_SAFE = PATH_SAFE + "?"
+# ";jsessionid=..." path parameters, as appended by Java servers.
+SESSION_PATH_PARAM = re.compile(r";jsessionid=[^/?#]*", re.IGNORECASE)
+URL_PARTS = re.compile(r"^([A-Za-z][A-Za-z0-9+.-]*):(?://([^/?#]*))?([^?#]*)(?:\?([^#]*))?")
+
+
+def _unescape_unreserved(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in UNRESERVED else f"%{match.group(1).upper()}"
+
+
+def normalize_escapes(component, safe):
+    ''' Decodes escaped unreserved characters, upper-cases the remaining
+    escapes and escapes what may not appear unescaped. '''
+    if "%" in component:
+        component = PERCENT_ESCAPE.sub(_unescape_unreserved, component)
+    return quote(component, safe=safe)
+
+
+def split_port(hostport):
+    if hostport.startswith("["):
+        # An IPv6 literal.
+        end = hostport.find("]") + 1 or len(hostport)
+        return hostport[:end], hostport[end + 1:]
+    host, _, port = hostport.partition(":")
+    return host, port
+
+
+def remove_dot_segments(path):
+    ''' RFC 3986 5.2.4: resolves "." and ".." segments of an absolute path. '''
+    if "." not in path:
+        return path
+    output = list()
+    segments = path.split("/")
+    for segment in segments[1:]:
+        if segment == "..":
+            if output:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    if segments[-1] in (".", ".."):
+        output.append("")
+    return "/" + "/".join(output)
+
+
+class Canonicalizer(object):
+    ''' Rewrites urls that name the same page to one canonical form, so that
+    the frontier and the scraper see them as one url.
+
+    The scheme and host are lower-cased and a default port dropped. In the
+    path, dot-segments are resolved, escapes normalized, index pages,
+    ";jsessionid" parameters and trailing slashes dropped. Query parameters
+    in strip_params are removed and the rest sorted. The fragment is
+    removed. Urls that are not http or https are left as they are.
+
+    canonicalize is memoized in an LRU cache, since the same links show up
+    on page after page. canonicalize_all does a whole page of links. '''
+    def __init__(self, strip_params=STRIP_PARAMS, index_pages=INDEX_PAGES,
+                 cache_size=1 << 16):
+        strip_params = [name.strip().lower() for name in strip_params if name.strip()]
+        self.strip_names = frozenset(
+            name for name in strip_params if not name.endswith("*"))
+        self.strip_prefixes = tuple(
+            name[:-1] for name in strip_params if name.endswith("*"))
+        self.index_pages = frozenset(page.lower() for page in index_pages)
+        self.canonicalize = lru_cache(maxsize=cache_size)(self._canonicalize)
+
+    def _stripped(self, name):
+        name = name.lower()
+        return name in self.strip_names or (
+            self.strip_prefixes and name.startswith(self.strip_prefixes))
+
+    def _query(self, query):
+        params = list()
+        for param in query.split("&"):
+            if not param:
+                continue
+            if self._stripped(param.partition("=")[0]):
+                continue
+            params.append(normalize_escapes(param, QUERY_SAFE))
+        params.sort()
+        return "&".join(params)
+
+    def _canonicalize(self, url):
+        match = URL_PARTS.match(url.strip())
+        if match is None:
+            return url
+        scheme, netloc, path, query = match.groups()
+        scheme = scheme.lower()
+        if scheme not in DEFAULT_PORTS or netloc is None:
+            return url
+        userinfo, at, hostport = netloc.rpartition("@")
+        host, port = split_port(hostport.lower())
+        host = host.rstrip(".")
+        if port and port != DEFAULT_PORTS[scheme]:
+            host = f"{host}:{port}"
+        if ";" in path:
+            path = SESSION_PATH_PARAM.sub("", path)
+        path = remove_dot_segments(normalize_escapes(path or "/", PATH_SAFE))
+        # Trailing slashes go first, so that a canonical url is its own
+        # canonical form: /a/index.html/ and /a/index.html are both /a.
+        path = path.rstrip("/")
+        head, _, last = path.rpartition("/")
+        while last.lower() in self.index_pages:
+            path = head.rstrip("/")
+            head, _, last = path.rpartition("/")
+        canonical = f"{scheme}://{userinfo}{at}{host}{path}"
+        if query:
+            query = self._query(query)
+            if query:
+                canonical = f"{canonical}?{query}"
+        return canonical
+
+    def canonicalize_all(self, urls):
+        ''' Canonical forms of a page of links, without repeats, in the order
+        they first appear. '''
+        canonicalize = self.canonicalize
+        return list(dict.fromkeys(canonicalize(url) for url in urls))
+
+
+canonicalizer = Canonicalizer()
+
+
+def configure(strip_params=STRIP_PARAMS, index_pages=INDEX_PAGES):
+    ''' Replaces the canonicalizer used by utils.normalize. '''
+    global canonicalizer
+    canonicalizer = Canonicalizer(strip_params, index_pages)
@@ -1,5 +1,7 @@
 import re
 
+from utils import canonical
+
 
 class Config(object):
     def __init__(self, config):
@@ -8,12 +10,66 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", fallback="threads")
+        self.async_concurrency = int(config["LOCAL PROPERTIES"].get("ASYNCCONCURRENCY", fallback="100"))
+        self.adaptive = config["LOCAL PROPERTIES"].getboolean("ADAPTIVE", fallback=False)
+        self.target_latency = float(config["LOCAL PROPERTIES"].get("TARGETLATENCY", fallback="2.0"))
+        self.max_error_rate = float(config["LOCAL PROPERTIES"].get("MAXERRORRATE", fallback="0.1"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSEPROCESSES", fallback="0"))
+        self.parse_queue = int(config["LOCAL PROPERTIES"].get("PARSEQUEUE", fallback="64"))
+        self.shards = int(config["LOCAL PROPERTIES"].get("SHARDS", fallback="1"))
+        self.shard_batch = int(config["LOCAL PROPERTIES"].get("SHARDBATCH", fallback="64"))
+        self.metrics = config["LOCAL PROPERTIES"].getboolean("METRICS", fallback=False)
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", fallback="10"))
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICSFILE", fallback="metrics.jsonl")
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICSPORT", fallback="0"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.page_store = config["LOCAL PROPERTIES"].get("PAGESTORE", fallback="").strip()
+        self.segment_bytes = int(config["LOCAL PROPERTIES"].get("SEGMENTBYTES", fallback="67108864"))
+        self.page_compression = config["LOCAL PROPERTIES"].get("PAGECOMPRESSION", fallback="zlib")
+        self.save_backend = config["LOCAL PROPERTIES"].get("SAVEBACKEND", fallback="shelve")
+        self.save_batch = int(config["LOCAL PROPERTIES"].get("SAVEBATCH", fallback="256"))
+        self.save_interval = float(config["LOCAL PROPERTIES"].get("SAVEINTERVAL", fallback="1.0"))
+        self.frontier_window = int(config["LOCAL PROPERTIES"].get("FRONTIERWINDOW", fallback="100000"))
+        self.crawl_log = config["LOCAL PROPERTIES"].get("CRAWLLOG", fallback="Logs/crawl").strip()
+        self.crawl_log_bytes = int(config["LOCAL PROPERTIES"].get("CRAWLLOGBYTES", fallback="67108864"))
+        self.crawl_log_keep = int(config["LOCAL PROPERTIES"].get("CRAWLLOGKEEP", fallback="0"))
+        self.console_rate = int(config["LOCAL PROPERTIES"].get("CONSOLERATE", fallback="10"))
+        self.summary_interval = float(config["LOCAL PROPERTIES"].get("SUMMARYINTERVAL", fallback="10"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.registration_cache = config["CONNECTION"].get("REGISTRATIONCACHE", fallback="registration.json").strip()
+        self.registration_ttl = float(config["CONNECTION"].get("REGISTRATIONTTL", fallback="3600"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        weights = config["CRAWLER"].get("PRIORITYWEIGHTS", fallback="depth: 1, host: 1, inlinks: 1, trap: 4")
+        self.priority_weights = {
+            name.strip(): float(weight)
+            for name, weight in (item.split(":") for item in weights.split(",") if item.strip())}
+        self.host_budget = int(config["CRAWLER"].get("HOSTBUDGET", fallback="500"))
+        self.trap_detection = config["CRAWLER"].getboolean("TRAPDETECTION", fallback=False)
+        self.trap_samples = int(config["CRAWLER"].get("TRAPSAMPLES", fallback="20"))
+        self.trap_min_yield = float(config["CRAWLER"].get("TRAPMINYIELD", fallback="0.2"))
+        self.trap_file = config["CRAWLER"].get("TRAPFILE", fallback="traps.json")
+        self.trap_report = config["CRAWLER"].get("TRAPREPORT", fallback="trap_report.txt")
+        self.connect_timeout = float(config["CRAWLER"].get("CONNECTTIMEOUT", fallback="5"))
+        self.read_timeout = float(config["CRAWLER"].get("READTIMEOUT", fallback="10"))
+        self.fetch_deadline = float(config["CRAWLER"].get("FETCHDEADLINE", fallback="10"))
+        limits = config["CRAWLER"].get("RETRYLIMITS", fallback="timeout: 3, connection: 3, server: 3, client: 1, error: 1")
+        self.retry_limits = {
+            name.strip(): int(limit)
+            for name, limit in (item.split(":") for item in limits.split(",") if item.strip())}
+        self.retry_backoff = float(config["CRAWLER"].get("RETRYBACKOFF", fallback="60"))
+        self.retry_max_backoff = float(config["CRAWLER"].get("RETRYMAXBACKOFF", fallback="3600"))
+        self.recrawl = config["CRAWLER"].getboolean("RECRAWL", fallback=False)
+        self.recrawl_interval = float(config["CRAWLER"].get("RECRAWLINTERVAL", fallback="86400"))
+        self.recrawl_min = float(config["CRAWLER"].get("RECRAWLMIN", fallback="3600"))
+        self.recrawl_max = float(config["CRAWLER"].get("RECRAWLMAX", fallback="2592000"))
+        strip_params = config["CRAWLER"].get("STRIPPARAMS", fallback=", ".join(canonical.STRIP_PARAMS))
+        self.strip_params = [name.strip() for name in strip_params.split(",") if name.strip()]
+        index_pages = config["CRAWLER"].get("INDEXPAGES", fallback=", ".join(canonical.INDEX_PAGES))
+        self.index_pages = [page.strip() for page in index_pages.split(",") if page.strip()]
 
         self.cache_server = None
\ No newline at end of file
@@ -0,0 +1,290 @@
+import atexit
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from collections import Counter
+from hashlib import blake2b
+from queue import Empty, SimpleQueue
+from threading import Lock, Thread
+
+from utils import get_logger
+
+# Kinds of records, stored as their position in the index. New kinds go
+# last, so that existing indexes keep their meaning.
+EVENTS = ("fetch", "timeout", "error", "cache_error", "skip", "unchanged")
+# Index entry: time, event, url digest, offset and length of the JSON line.
+INDEX_ENTRY = struct.Struct(">dB8sQI")
+SEGMENT_NAME = re.compile(r"^segment-(\d+)\.jsonl$")
+ENCODER = json.JSONEncoder(separators=(",", ":"))
+# Records written per batch at most, so that a busy queue still rotates
+# and summarizes on time.
+BATCH = 4096
+
+
+def url_digest(url):
+    # Of the url as logged: the index only has to tell logged urls apart.
+    return blake2b(url.encode("utf-8"), digest_size=8).digest()
+
+
+def segment_file(directory, number):
+    return os.path.join(directory, f"segment-{number:06d}.jsonl")
+
+
+def index_file(directory, number):
+    return os.path.join(directory, f"segment-{number:06d}.idx")
+
+
+def segment_numbers(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        int(match.group(1)) for match in map(
+            SEGMENT_NAME.match, os.listdir(directory)) if match)
+
+
+class CrawlLog(object):
+    ''' Structured log of every fetch and every url dropped on the way,
+    one JSON object a line:
+
+        {"time": ..., "event": "fetch", "url": ..., "status": 200,
+         "seconds": 0.21}
+
+    with "detail" for timeouts, errors and skipped pages. Callers only
+    queue a tuple; a background thread encodes records in batches, appends
+    them to segment files of about segment_bytes and keeps the last keep
+    segments (0 for all). Each segment has an index of fixed width
+    (time, event, url digest, offset, length) entries for CrawlLogReader.
+    Every start writes to a new segment, so there is nothing to recover
+    after a crash: the reader skips entries past the end of a segment.
+
+    Every summary_interval seconds the thread logs the fetch rate and
+    counts of statuses and events since the last summary, to the console
+    in place of a line per fetch. '''
+    def __init__(self, directory, segment_bytes=64 << 20, keep=0,
+                 interval=1.0, summary_interval=10.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.keep = keep
+        self.interval = interval
+        self.summary_interval = summary_interval
+        self.logger = get_logger("CRAWL")
+        self.queue = SimpleQueue()
+        os.makedirs(directory, exist_ok=True)
+        self.segment_number = max(segment_numbers(directory), default=0)
+        self.segment = None
+        self.index = None
+        self._rotate()
+        self.statuses = Counter()
+        self.events = Counter()
+        self.last_summary = time.time()
+        self.closed = False
+        self.lock = Lock()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, event, url, status=None, seconds=None, detail=None):
+        self.queue.put((time.time(), event, url, status, seconds, detail))
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.interval)]
+            except Empty:
+                batch = []
+            while len(batch) < BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            stopping = None in batch
+            self._write([item for item in batch if item is not None])
+            if stopping or time.time() - self.last_summary >= self.summary_interval:
+                self._summarize()
+            if stopping:
+                return
+
+    def _write(self, batch):
+        lines = list()
+        entries = list()
+        offset = self.segment.tell()
+        for timestamp, event, url, status, seconds, detail in batch:
+            fields = {"time": round(timestamp, 3), "event": event, "url": url}
+            if status is not None:
+                fields["status"] = status
+            if seconds is not None:
+                fields["seconds"] = round(seconds, 3)
+            if detail is not None:
+                fields["detail"] = detail
+            line = (ENCODER.encode(fields) + "\n").encode("utf-8")
+            if offset and offset + len(line) > self.segment_bytes:
+                self._append(lines, entries)
+                lines, entries = list(), list()
+                self._rotate()
+                offset = 0
+            entries.append(INDEX_ENTRY.pack(
+                timestamp, EVENTS.index(event), url_digest(url), offset,
+                len(line)))
+            lines.append(line)
+            offset += len(line)
+            self.events[event] += 1
+            if event == "fetch":
+                self.statuses[status] += 1
+        self._append(lines, entries)
+
+    def _append(self, lines, entries):
+        # The segment first, so the index never points past its end.
+        if lines:
+            self.segment.write(b"".join(lines))
+            self.segment.flush()
+            self.index.write(b"".join(entries))
+            self.index.flush()
+
+    def _rotate(self):
+        for fp in (self.segment, self.index):
+            if fp is not None:
+                fp.close()
+        self.segment_number += 1
+        self.segment = open(segment_file(self.directory, self.segment_number), "ab")
+        self.index = open(index_file(self.directory, self.segment_number), "ab")
+        if self.keep:
+            for number in segment_numbers(self.directory)[:-self.keep]:
+                for path in (segment_file(self.directory, number),
+                             index_file(self.directory, number)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def _summarize(self):
+        now = time.time()
+        fetches = self.events.pop("fetch", 0)
+        if fetches or self.events:
+            statuses = ", ".join(
+                f"{status}: {count}" for status, count in sorted(self.statuses.items()))
+            others = "".join(
+                f", {count} {event}" for event, count in sorted(self.events.items()))
+            self.logger.info(
+                f"Fetched {fetches} urls ({fetches / max(now - self.last_summary, 1e-9):.1f}/s; "
+                f"{statuses or 'none'}){others}.")
+        self.statuses.clear()
+        self.events.clear()
+        self.last_summary = now
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+            self.segment.close()
+            self.index.close()
+
+
+class CrawlLogReader(object):
+    ''' Read side of a CrawlLog directory. Records are selected on the
+    indexes, by time, event or url, and only the selected lines are read
+    from the memory-mapped segments. '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.numbers = segment_numbers(directory)
+        self.segments = dict()
+
+    def __len__(self):
+        return sum(
+            os.path.getsize(index_file(self.directory, number)) // INDEX_ENTRY.size
+            for number in self.numbers
+            if os.path.exists(index_file(self.directory, number)))
+
+    def _segment(self, number):
+        segment = self.segments.get(number)
+        if segment is None:
+            with open(segment_file(self.directory, number), "rb") as fp:
+                segment = self.segments[number] = (
+                    mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                    if os.path.getsize(fp.name) else b"")
+        return segment
+
+    def entries(self, since=None, until=None, events=None, url=None):
+        ''' Yields (segment, time, event, offset, length) of the records
+        written from since to until, of the given events, and of url. '''
+        codes = None if events is None else {EVENTS.index(event) for event in events}
+        digest = None if url is None else url_digest(url)
+        for number in self.numbers:
+            path = index_file(self.directory, number)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as index:
+                data = index.read()
+            end = len(data) - len(data) % INDEX_ENTRY.size
+            segment_size = len(self._segment(number))
+            for timestamp, code, entry_digest, offset, length in INDEX_ENTRY.iter_unpack(
+                    memoryview(data)[:end]):
+                if offset + length > segment_size:
+                    break
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp > until:
+                    continue
+                if codes is not None and code not in codes:
+                    continue
+                if digest is not None and entry_digest != digest:
+                    continue
+                yield number, timestamp, EVENTS[code], offset, length
+
+    def records(self, since=None, until=None, events=None, url=None):
+        ''' Yields the records selected as by entries, as dicts. '''
+        for number, _, _, offset, length in self.entries(since, until, events, url):
+            yield json.loads(self._segment(number)[offset:offset + length])
+
+    def close(self):
+        for segment in self.segments.values():
+            if isinstance(segment, mmap.mmap):
+                segment.close()
+        self.segments = dict()
+
+
+shared_log = None
+shared_lock = Lock()
+
+
+def open_crawl_log(config):
+    ''' Starts the CrawlLog the module level record writes to, unless
+    CRAWLLOG is empty. '''
+    global shared_log
+    if not config.crawl_log:
+        return None
+    with shared_lock:
+        if shared_log is None:
+            shared_log = CrawlLog(
+                config.crawl_log, config.crawl_log_bytes, config.crawl_log_keep,
+                summary_interval=config.summary_interval)
+        return shared_log
+
+
+def record(event, url, status=None, seconds=None, detail=None):
+    ''' Queues a record for the crawl log, if one is open in this
+    process. '''
+    log = shared_log
+    if log is not None:
+        log.record(event, url, status, seconds, detail)
+
+
+def close_crawl_log():
+    global shared_log
+    with shared_lock:
+        if shared_log is not None:
+            shared_log.close()
+            shared_log = None
+
+
+def _after_fork():
+    # A forked child (a parse process or a shard) opens its own log.
+    global shared_log, shared_lock
+    shared_log = None
+    shared_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
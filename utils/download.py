@@ -1,17 +1,50 @@
-import requests
+import socket
 import cbor
 import time
 
 from utils.response import Response
+from utils.timer import get_timer
+
+
+def abort(response):
+    ''' Shuts the socket of a streamed response down, so that a read
+    blocked on it fails at once. '''
+    connection = response.raw.connection
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
 
 def download(url, config, logger=None):
+    ''' Fetches url from the cache server. Connecting and every read are
+    bounded by CONNECTTIMEOUT and READTIMEOUT, and the whole fetch by
+    FETCHDEADLINE, past which the shared timer aborts the body read.
+    Raises requests.exceptions.Timeout in either case. '''
+    # requests is imported on the first fetch rather than at startup.
+    import requests
     host, port = config.cache_server
+    deadline = time.monotonic() + config.fetch_deadline
     resp = requests.get(
         f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        timeout=(config.connect_timeout, config.read_timeout), stream=True)
+    entry = get_timer().schedule(deadline, lambda: abort(resp))
+    try:
+        content = resp.content
+    except requests.exceptions.RequestException:
+        if time.monotonic() >= deadline:
+            raise requests.exceptions.Timeout(
+                f"Fetch of {url} passed its {config.fetch_deadline}s deadline.")
+        raise
+    finally:
+        get_timer().cancel(entry)
+        resp.close()
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if resp and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
     logger.error(f"Spacetime Response error {resp} with url {url}.")
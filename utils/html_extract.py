@@ -0,0 +1,83 @@
+from urllib.parse import urljoin, urldefrag
+
+from lxml import etree
+
+# Text inside these elements is not visible (BeautifulSoup's get_text skips
+# them as well).
+HIDDEN_TAGS = {"script", "style", "template"}
+# lxml only takes bytes, so a memoryview body is fed through copies of
+# this size rather than copied whole.
+FEED_CHUNK = 64 << 10
+
+
+class TextLinkTarget(object):
+    ''' lxml parser target that collects visible text and resolved,
+    defragmented hrefs as the document streams by, without building a
+    tree. '''
+    def __init__(self, url):
+        self.base = url
+        self.base_seen = False
+        self.hidden_depth = 0
+        self.text = list()
+        self.links = list()
+
+    def start(self, tag, attrib):
+        if tag in HIDDEN_TAGS:
+            self.hidden_depth += 1
+        elif tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.links.append(urldefrag(urljoin(self.base, href.strip()))[0])
+        elif tag == "base" and not self.base_seen:
+            # Only the first <base href> counts.
+            href = attrib.get("href")
+            if href is not None:
+                self.base = urljoin(self.base, href.strip())
+                self.base_seen = True
+
+    def end(self, tag):
+        if tag in HIDDEN_TAGS and self.hidden_depth:
+            self.hidden_depth -= 1
+
+    def data(self, data):
+        if not self.hidden_depth:
+            self.text.append(data)
+
+    def close(self):
+        return "".join(self.text), self.links
+
+
+def extract_streaming(url, content):
+    ''' Returns (visible text, links) of content in a single lxml pass. '''
+    parser = etree.HTMLParser(target=TextLinkTarget(url))
+    if isinstance(content, memoryview):
+        for start in range(0, len(content), FEED_CHUNK):
+            parser.feed(bytes(content[start:start + FEED_CHUNK]))
+    else:
+        parser.feed(content)
+    return parser.close()
+
+
+def extract_soup(url, content):
+    ''' BeautifulSoup version of extract_streaming, for pages lxml's
+    streaming parser rejects. '''
+    from bs4 import BeautifulSoup
+    if isinstance(content, memoryview):
+        content = bytes(content)
+    soup = BeautifulSoup(content, 'lxml')
+    base = url
+    base_tag = soup.find('base', href=True)
+    if base_tag:
+        base = urljoin(url, base_tag['href'].strip())
+    links = [
+        urldefrag(urljoin(base, anchor['href'].strip()))[0]
+        for anchor in soup.find_all('a', href=True)]
+    return soup.get_text(), links
+
+
+def extract_text_and_links(url, content):
+    ''' Returns (visible text, resolved defragmented links) of a page. '''
+    try:
+        return extract_streaming(url, content)
+    except (etree.ParserError, etree.XMLSyntaxError, ValueError):
+        return extract_soup(url, content)
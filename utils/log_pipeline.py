@@ -0,0 +1,139 @@
+import atexit
+import logging
+import os
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+
+LOG_DIRECTORY = "Logs"
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class FileRouter(logging.Handler):
+    ''' Writes every record to Logs/<file>.log of its logger, opening the
+    file on its first record, relative to the directory the process is in
+    by then. '''
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+        # Logger name -> file name, and file name -> FileHandler.
+        self.files = dict()
+        self.handlers = dict()
+
+    def emit(self, record):
+        filename = self.files.get(record.name, record.name)
+        handler = self.handlers.get(filename)
+        if handler is None:
+            os.makedirs(LOG_DIRECTORY, exist_ok=True)
+            handler = logging.FileHandler(
+                os.path.join(LOG_DIRECTORY, f"{filename}.log"))
+            handler.setFormatter(self.formatter)
+            self.handlers[filename] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers = dict()
+        super().close()
+
+
+class ConsoleLimiter(logging.StreamHandler):
+    ''' Console output of at most rate INFO records a second (0 for no
+    limit). Records over the limit only go to the log files, and how many
+    were held back is printed once the second is over. Warnings and errors
+    are always printed. '''
+    def __init__(self, rate):
+        super().__init__()
+        self.setLevel(logging.INFO)
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.rate = rate
+        self.window_start = 0.0
+        self.shown = 0
+        self.suppressed = Counter()
+
+    def emit(self, record):
+        if record.created - self.window_start >= 1.0:
+            self.summarize()
+            self.window_start = record.created
+            self.shown = 0
+        if self.rate and record.levelno < logging.WARNING and self.shown >= self.rate:
+            self.suppressed[record.name] += 1
+            return
+        self.shown += 1
+        super().emit(record)
+
+    def summarize(self):
+        if not self.suppressed:
+            return
+        busiest = ", ".join(
+            f"{name}: {count}" for name, count in self.suppressed.most_common(3))
+        self.stream.write(
+            f"... {sum(self.suppressed.values())} more lines in "
+            f"{LOG_DIRECTORY}/ ({busiest})\n")
+        self.flush()
+        self.suppressed.clear()
+
+
+class PipelineHandler(QueueHandler):
+    ''' Hands records to the listener thread, starting it on the first. '''
+    def enqueue(self, record):
+        if listener is None:
+            start()
+        self.queue.put_nowait(record)
+
+
+router = FileRouter()
+console = ConsoleLimiter(10)
+handler = PipelineHandler(SimpleQueue())
+listener = None
+lock = Lock()
+
+
+def attach(logger, filename):
+    ''' Sends the records of logger to Logs/<filename>.log and the console
+    through the pipeline. Calling it again for a logger does not add
+    another handler. '''
+    router.files[logger.name] = filename
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+
+
+def configure(console_rate):
+    console.rate = console_rate
+
+
+def start():
+    global listener
+    with lock:
+        if listener is None:
+            listener = QueueListener(
+                handler.queue, router, console, respect_handler_level=True)
+            listener.start()
+
+
+def stop():
+    ''' Writes out every queued record and stops the listener. Logging
+    again starts another one. '''
+    global listener
+    with lock:
+        if listener is not None:
+            listener.stop()
+            listener = None
+        console.summarize()
+        router.close()
+
+
+def _after_fork():
+    # The listener thread is not forked along, and the log files of a
+    # child (a shard, in its own directory) are its own.
+    global listener, lock
+    lock = Lock()
+    listener = None
+    handler.queue = SimpleQueue()
+    router.handlers = dict()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(stop)
@@ -0,0 +1,330 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import time
+from collections import Counter
+from threading import Event, Lock, Thread, local
+
+# Histogram buckets are powers of two microseconds, the last one holding
+# everything from about 67 seconds up.
+BUCKETS = 28
+QUANTILES = (0.5, 0.9, 0.99)
+
+# The Metrics every instrumented call records into, None while disabled.
+registry = None
+
+
+class Histogram(object):
+    ''' Latency histogram with power of two buckets, so recording is a
+    frexp and an increment and quantiles are within a factor of two. '''
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = math.frexp(seconds * 1e6)[1] if seconds > 0 else 0
+        self.buckets[min(max(index, 0), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        ''' Upper bound of the bucket holding the q quantile. '''
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(2.0 ** index / 1e6, self.max)
+        return self.max
+
+
+class ThreadMetrics(object):
+    ''' Histograms and counters recorded by one thread. Its lock is only
+    contended while a snapshot is being taken. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = dict()
+        self.counters = Counter()
+
+
+class Metrics(object):
+    ''' Stage latencies, counters and gauges of a crawl.
+
+    Each thread records into its own ThreadMetrics, so recording never
+    waits on other threads; snapshot merges them. Gauges are callables
+    read when a snapshot is taken. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.local = local()
+        self.threads = list()
+        self.gauges = dict()
+        self.started = time.time()
+
+    def _thread(self):
+        try:
+            return self.local.metrics
+        except AttributeError:
+            metrics = self.local.metrics = ThreadMetrics()
+            with self.lock:
+                self.threads.append(metrics)
+            return metrics
+
+    def observe(self, name, seconds):
+        metrics = self._thread()
+        with metrics.lock:
+            histogram = metrics.histograms.get(name)
+            if histogram is None:
+                histogram = metrics.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, name, amount=1):
+        metrics = self._thread()
+        with metrics.lock:
+            metrics.counters[name] += amount
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        ''' Returns (histograms, counters, gauges) merged over threads. '''
+        histograms = dict()
+        counters = Counter()
+        with self.lock:
+            threads = list(self.threads)
+        for metrics in threads:
+            with metrics.lock:
+                for name, histogram in metrics.histograms.items():
+                    histograms.setdefault(name, Histogram()).merge(histogram)
+                counters.update(metrics.counters)
+        gauges = dict()
+        for name, read in self.gauges.items():
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        return histograms, counters, gauges
+
+
+class TimedLock(object):
+    ''' Wraps a Lock or RLock, counting acquisitions and timing the ones
+    that had to wait. Usable as the lock of a Condition. '''
+    def __init__(self, lock, name, metrics):
+        self.lock = lock
+        self.name = name
+        self.metrics = metrics
+
+    def acquire(self, blocking=True, timeout=-1):
+        self.metrics.count(f"{self.name}.acquired")
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        self.metrics.count(f"{self.name}.contended")
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.metrics.observe(f"{self.name}.wait", time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+    # Used by Condition, so that waiting fully releases an RLock.
+    def _is_owned(self):
+        return self.lock._is_owned()
+
+    def _release_save(self):
+        return self.lock._release_save()
+
+    def _acquire_restore(self, state):
+        self.lock._acquire_restore(state)
+
+
+def enable():
+    global registry
+    if registry is None:
+        registry = Metrics()
+    return registry
+
+
+def timed_lock(lock, name):
+    ''' lock itself while metrics are disabled. '''
+    if registry is None:
+        return lock
+    return TimedLock(lock, name, registry)
+
+
+def gauge(name, read):
+    if registry is not None:
+        registry.gauge(name, read)
+
+
+def instrument(owner, attribute, name, on_result=None):
+    ''' Replaces owner.attribute (a function, method or coroutine function)
+    with one timing every call into the name histogram and counting
+    exceptions as name.errors. on_result(metrics, result) may record more.
+    Nothing is wrapped until metrics are enabled, so disabled metrics cost
+    nothing on the instrumented paths. '''
+    function = getattr(owner, attribute)
+    metrics = registry
+
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await function(*args, **kwargs)
+            except BaseException:
+                metrics.count(f"{name}.errors")
+                raise
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+            if on_result is not None:
+                on_result(metrics, result)
+            return result
+    else:
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                metrics.count(f"{name}.errors")
+                raise
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+            if on_result is not None:
+                on_result(metrics, result)
+            return result
+    setattr(owner, attribute, timed)
+
+
+def render_text(report):
+    ''' Prometheus style text of a Reporter report. '''
+    lines = [f"crawler_uptime_seconds {report['uptime']:.3f}"]
+    for name, stage in report["stages"].items():
+        metric = "crawler_" + name.replace(".", "_")
+        lines.append(f"{metric}_seconds_count {stage['count']}")
+        lines.append(f"{metric}_seconds_sum {stage['total']:.6f}")
+        lines.append(f"{metric}_per_second {stage['per_sec']:.3f}")
+        for q in QUANTILES:
+            lines.append(
+                f"{metric}_seconds{{quantile=\"{q}\"}} "
+                f"{stage['p' + str(round(q * 100))]:.6f}")
+        lines.append(f"{metric}_seconds_max {stage['max']:.6f}")
+    for name, value in report["counters"].items():
+        lines.append(f"crawler_{name.replace('.', '_')}_total {value}")
+    for name, value in report["gauges"].items():
+        if value is not None:
+            lines.append(f"crawler_{name.replace('.', '_')} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class Reporter(object):
+    ''' Every interval seconds, appends a report of metrics as one JSON
+    line to path (if any), and serves the latest report as text on
+    127.0.0.1:port (if any). '''
+    def __init__(self, metrics, interval, path=None, port=0):
+        self.metrics = metrics
+        self.interval = interval
+        self.path = path
+        self.stopped = Event()
+        self.previous = (time.time(), dict())
+        self.latest = self.report()
+        self.server = None
+        if port:
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer(
+                ("127.0.0.1", port), self._handler())
+            self.server.daemon_threads = True
+            Thread(target=self.server.serve_forever, daemon=True).start()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def report(self):
+        ''' Stage latencies with calls per second since the last report,
+        plus counters and gauges. '''
+        now = time.time()
+        histograms, counters, gauges = self.metrics.snapshot()
+        last_time, last_counts = self.previous
+        elapsed = max(now - last_time, 1e-9)
+        stages = dict()
+        for name, histogram in sorted(histograms.items()):
+            stage = {
+                "count": histogram.count,
+                "per_sec": (histogram.count - last_counts.get(name, 0)) / elapsed,
+                "total": histogram.total,
+                "mean": histogram.total / histogram.count,
+                "max": histogram.max,
+            }
+            for q in QUANTILES:
+                stage["p" + str(round(q * 100))] = histogram.quantile(q)
+            stages[name] = stage
+        self.previous = (
+            now, {name: histogram.count for name, histogram in histograms.items()})
+        return {
+            "time": now,
+            "uptime": now - self.metrics.started,
+            "stages": stages,
+            "counters": dict(sorted(counters.items())),
+            "gauges": gauges,
+        }
+
+    def dump(self):
+        self.latest = self.report()
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as out:
+                out.write(json.dumps(self.latest) + "\n")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        reporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render_text(reporter.latest).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stop(self):
+        ''' Writes a last report and stops the thread and the server. '''
+        self.stopped.set()
+        self.thread.join()
+        self.dump()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
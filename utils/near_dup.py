@@ -0,0 +1,173 @@
+import os
+import struct
+from array import array
+from hashlib import blake2b
+from itertools import combinations
+from threading import Lock
+
+from utils.seen_set import SeenSet
+
+FINGERPRINT_BITS = 64
+MASK64 = (1 << 64) - 1
+# Header: magic, max distance k, blocks, table capacity, fingerprints, zero flag.
+HEADER = struct.Struct("<4sIIQQI")
+MAGIC = b"NDP2"
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(value):
+        return bin(value).count("1")
+
+
+def content_checksum(text):
+    ''' 8 byte checksum of page text for the exact-duplicate fast path. '''
+    return blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+class NearDupIndex(object):
+    ''' Thread-safe index of page fingerprints for duplicate detection.
+
+    An exact copy is caught by its content checksum in a SeenSet. Near
+    copies are 64 bit simhashes within k bits of a stored one. The
+    fingerprint is cut into blocks; two fingerprints within k bits agree
+    on at least blocks - k of them, so each choice of blocks - k blocks
+    keys one table. With the default k + 2 blocks the keys are about 26
+    bits wide and almost every probe lands on an empty or matching slot,
+    which keeps lookups flat as the index grows.
+
+    Each table is an open-addressing array of fingerprints (the key is read
+    back from the fingerprint), so a page costs 8 bytes per table at half
+    load. Lookups take no lock; inserts lock one table at a time, so
+    concurrent workers only contend when touching the same table. '''
+    def __init__(self, k=3, blocks=None, capacity=1 << 16):
+        self.k = k
+        self.blocks = blocks or k + 2
+        bounds = [
+            FINGERPRINT_BITS * block // self.blocks
+            for block in range(self.blocks + 1)]
+        block_masks = [
+            ((1 << (high - low)) - 1) << low
+            for low, high in zip(bounds, bounds[1:])]
+        self.key_masks = list()
+        for chosen in combinations(block_masks, self.blocks - k):
+            key_mask = 0
+            for block_mask in chosen:
+                key_mask |= block_mask
+            self.key_masks.append(key_mask)
+        capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.tables = [
+            array("Q", bytes(capacity * 8)) for _ in self.key_masks]
+        self.sizes = [0] * len(self.key_masks)
+        self.locks = [Lock() for _ in self.key_masks]
+        # Zero marks an empty slot, so a zero fingerprint is kept aside.
+        self.zero_seen = False
+        self.exact = SeenSet(digest_size=8)
+
+    @staticmethod
+    def _slot(key, mask):
+        return ((key * 0x9E3779B97F4A7C15) & MASK64) >> 32 & mask
+
+    def _near(self, fingerprint):
+        if self.zero_seen and popcount(fingerprint) <= self.k:
+            return True
+        for key_mask, table in zip(self.key_masks, self.tables):
+            mask = len(table) - 1
+            key = fingerprint & key_mask
+            index = self._slot(key, mask)
+            while True:
+                candidate = table[index]
+                if not candidate:
+                    break
+                if (candidate & key_mask == key
+                        and popcount(candidate ^ fingerprint) <= self.k):
+                    return True
+                index = (index + 1) & mask
+        return False
+
+    def _insert(self, table_index, fingerprint):
+        with self.locks[table_index]:
+            table = self.tables[table_index]
+            if (self.sizes[table_index] + 1) * 2 > len(table):
+                table = self._grow(table_index)
+            self._place(table, self.key_masks[table_index], fingerprint)
+            self.sizes[table_index] += 1
+
+    def _place(self, table, key_mask, fingerprint):
+        mask = len(table) - 1
+        index = self._slot(fingerprint & key_mask, mask)
+        while table[index]:
+            index = (index + 1) & mask
+        table[index] = fingerprint
+
+    def _grow(self, table_index):
+        old_table = self.tables[table_index]
+        key_mask = self.key_masks[table_index]
+        table = array("Q", bytes(len(old_table) * 16))
+        for fingerprint in old_table:
+            if fingerprint:
+                self._place(table, key_mask, fingerprint)
+        # Lookups running on the old table finish there.
+        self.tables[table_index] = table
+        return table
+
+    def is_duplicate(self, checksum, fingerprint):
+        ''' Returns "exact" or "near" for a duplicate page, otherwise adds
+        the page to the index and returns None. '''
+        if not self.exact.add_digest(checksum):
+            return "exact"
+        if self._near(fingerprint):
+            return "near"
+        if not fingerprint:
+            self.zero_seen = True
+            return None
+        for table_index in range(len(self.tables)):
+            self._insert(table_index, fingerprint)
+        return None
+
+    def __len__(self):
+        return self.sizes[0] + self.zero_seen
+
+    def snapshot(self):
+        ''' Copy of the index and of its exact checksums as save writes
+        them. '''
+        tables = list()
+        for lock, table in zip(self.locks, self.tables):
+            with lock:
+                tables.append(table.tobytes())
+        parts = [HEADER.pack(
+            MAGIC, self.k, self.blocks, len(tables[0]) // 8, self.sizes[0],
+            self.zero_seen)]
+        for table in tables:
+            parts += [struct.pack("<Q", len(table) // 8), table]
+        return parts, self.exact.snapshot()
+
+    def save(self, path, snapshot=None):
+        ''' Atomically writes the index, or a snapshot taken earlier, to
+        path and path.exact. '''
+        if snapshot is None:
+            snapshot = self.snapshot()
+        index, exact = snapshot
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as save_file:
+            save_file.writelines(index)
+        self.exact.save(f"{path}.exact", exact)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as save_file:
+            magic, k, blocks, capacity, size, zero_seen = HEADER.unpack(
+                save_file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a near duplicate index.")
+            index = cls(k=k, blocks=blocks, capacity=1)
+            for table_index in range(len(index.tables)):
+                (length,) = struct.unpack("<Q", save_file.read(8))
+                table = array("Q")
+                table.frombytes(save_file.read(length * 8))
+                index.tables[table_index] = table
+                index.sizes[table_index] = size
+        index.zero_seen = bool(zero_seen)
+        index.exact = SeenSet.load(f"{path}.exact")
+        return index
@@ -1,14 +1,135 @@
 import pickle
 
+# The body is the first item of a pickled requests.Response's state, under
+# this key: SHORT_BINUNICODE from protocol 4 on, BINUNICODE in protocol 3.
+# Protocol 2 pickles bytes through _codecs.encode and is not looked into.
+CONTENT_KEYS = (b"\x8c\x08_content", b"X\x08\x00\x00\x00_content")
+# Memo opcodes that may follow the key (MEMOIZE, BINPUT, LONG_BINPUT) and
+# bytes opcodes (SHORT_BINBYTES, BINBYTES, BINBYTES8), with argument sizes.
+MEMO_OPS = {0x94: 0, ord("q"): 1, ord("r"): 4}
+BYTES_OPS = {ord("C"): 1, ord("B"): 4, 0x8e: 8}
+FRAME = 0x95
+EMPTY_BYTES = b"C\x00"
+# Below this, unpickling a body along with the rest costs no more than
+# cutting it out: most of the time goes to building the requests.Response.
+INLINE_BODY = 1 << 16
+
+
+def locate_body(pickled):
+    ''' Returns (opcode start, body start, body end) of the body inside a
+    pickled requests.Response, or None if it is not laid out as expected. '''
+    for key in CONTENT_KEYS:
+        position = pickled.find(key, 0, 1024)
+        if position < 0:
+            continue
+        position += len(key)
+        position += 1 + MEMO_OPS.get(pickled[position], -1)
+        size_length = BYTES_OPS.get(pickled[position])
+        if size_length is None:
+            return None
+        start = position + 1 + size_length
+        end = start + int.from_bytes(pickled[position + 1:start], "little")
+        if end > len(pickled):
+            return None
+        return position, start, end
+    return None
+
+
+def strip_body(pickled, location):
+    ''' The pickle with its body replaced by b"", or None if the body is
+    past the first frame. Large bodies are written between frames, small
+    ones inside the first frame, whose length then has to shrink. '''
+    op_start, _, end = location
+    head = bytearray(pickled[:op_start])
+    if len(head) > 11 and head[2] == FRAME:
+        frame_length = int.from_bytes(head[3:11], "little")
+        frame_end = 11 + frame_length
+        if op_start > frame_end:
+            return None
+        if op_start < frame_end:
+            cut = min(end, frame_end) - op_start
+            head[3:11] = (frame_length - cut + len(EMPTY_BYTES)).to_bytes(8, "little")
+    return bytes(head) + EMPTY_BYTES + pickled[end:]
+
+
 class Response(object):
+    ''' A cache server response. Only url, status and error are read up
+    front. size is found without decoding anything, and headers without
+    touching a large body, which body returns as a memoryview into the
+    cache server's payload. raw_response, the full requests.Response, is
+    unpickled on first use. '''
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
+        self._pickled = resp_dict.get("response")
+        self._decoded = False
+        self._head = None
+        self._body = None
+        self._location = None
+        self._raw_decoded = False
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        if not self._raw_decoded:
+            self._decode_raw()
+        return self._raw_response
+
+    def _decode_raw(self):
+        self._raw_decoded = True
         try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
+            self._raw_response = (
+                pickle.loads(self._pickled)
+                if self._pickled is not None else
                 None)
         except TypeError:
-            self.raw_response = None
+            self._raw_response = None
+
+    def _locate(self):
+        if self._location is None and isinstance(self._pickled, bytes):
+            self._location = locate_body(self._pickled) or ()
+        return self._location
+
+    def _decode(self):
+        ''' Unpickles everything but a large body, which is left in place.
+        Small bodies, and pickles the body cannot be cut out of, come from
+        the full raw_response. '''
+        self._decoded = True
+        location = self._locate()
+        stripped = None
+        if location and location[2] - location[1] >= INLINE_BODY:
+            stripped = strip_body(self._pickled, location)
+        if stripped is not None:
+            try:
+                self._head = pickle.loads(stripped)
+                self._body = memoryview(self._pickled)[location[1]:location[2]]
+                return
+            except Exception:
+                pass
+        raw = self.raw_response
+        if raw is not None:
+            self._head = raw
+            self._body = memoryview(raw.content or b"")
+
+    @property
+    def headers(self):
+        if not self._decoded:
+            self._decode()
+        return self._head.headers if self._head is not None else {}
+
+    @property
+    def body(self):
+        ''' The body as a memoryview, None if there is no response. '''
+        if not self._decoded:
+            self._decode()
+        return self._body
+
+    @property
+    def size(self):
+        ''' Size of the body, found without decoding anything. For pickles
+        the body cannot be located in, the size of the whole pickle. '''
+        location = self._locate()
+        if location:
+            return location[2] - location[1]
+        return len(self._pickled) if self._pickled is not None else 0
@@ -0,0 +1,185 @@
+import mmap
+import os
+import struct
+from array import array
+from threading import Lock
+
+from utils import get_urldigest
+
+# Header: magic, digest width in 8 byte words, capacity, count, bloom bytes.
+HEADER = struct.Struct("<4sIQQQ")
+MAGIC = b"SEEN"
+BLOOM_HASHES = 4
+
+
+class SeenSet(object):
+    ''' Set of urls stored as fixed width binary digests.
+
+    Digests (8 or 16 bytes, see utils.get_urldigest) live in an
+    open-addressing table backed by a flat array of 64 bit words, so a url
+    costs 16-32 bytes instead of a python string. An optional Bloom filter
+    in front answers most misses without probing the table. The set can be
+    saved to a file and memory-mapped back on restart. '''
+    def __init__(self, digest_size=8, capacity=1024, bloom_bits=0):
+        if digest_size not in (8, 16):
+            raise ValueError("digest_size must be 8 or 16 bytes.")
+        self.digest_size = digest_size
+        self.width = digest_size // 8
+        self.capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.table = array("Q", bytes(self.capacity * self.width * 8))
+        self.count = 0
+        self.bloom = bytearray((bloom_bits + 7) // 8) if bloom_bits else None
+        self.lock = Lock()
+        self._mmap = None
+
+    def _words(self, url):
+        return self._digest_words(get_urldigest(url, self.digest_size))
+
+    def _digest_words(self, digest):
+        words = struct.unpack(f"<{self.width}Q", digest)
+        # Zero marks an empty slot, so never store it as a first word.
+        return (words[0] or 1,) + words[1:]
+
+    def _find(self, words):
+        ''' Returns (slot index, found) for the digest words. '''
+        table, width = self.table, self.width
+        mask = self.capacity - 1
+        index = words[0] & mask
+        while True:
+            slot = index * width
+            first = table[slot]
+            if first == 0:
+                return slot, False
+            if first == words[0] and (
+                    width == 1 or tuple(table[slot:slot + width]) == words):
+                return slot, True
+            index = (index + 1) & mask
+
+    def _bloom_positions(self, words):
+        size = len(self.bloom) * 8
+        low, high = words[0] & 0xFFFFFFFF, (words[0] >> 32) | 1
+        return [(low + i * high) % size for i in range(BLOOM_HASHES)]
+
+    def _bloom_may_contain(self, words):
+        bloom = self.bloom
+        return all(
+            bloom[bit >> 3] & (1 << (bit & 7))
+            for bit in self._bloom_positions(words))
+
+    def _grow(self):
+        old_table, width = self.table, self.width
+        self.capacity *= 2
+        self.table = array("Q", bytes(self.capacity * width * 8))
+        for slot in range(0, len(old_table), width):
+            if old_table[slot]:
+                words = tuple(old_table[slot:slot + width])
+                new_slot, _ = self._find(words)
+                self.table[new_slot:new_slot + width] = array("Q", words)
+        self._release_mmap()
+
+    def __contains__(self, url):
+        return self._contains(self._words(url))
+
+    def contains_digest(self, digest):
+        return self._contains(self._digest_words(digest))
+
+    def _contains(self, words):
+        with self.lock:
+            if self.bloom is not None and not self._bloom_may_contain(words):
+                return False
+            return self._find(words)[1]
+
+    def add(self, url):
+        ''' Adds url, returning True if it was not seen before. '''
+        return self._add(self._words(url))
+
+    def add_digest(self, digest):
+        ''' Adds a precomputed digest_size byte digest, returning True if
+        it was not seen before. '''
+        return self._add(self._digest_words(digest))
+
+    def _add(self, words):
+        with self.lock:
+            if self.bloom is not None:
+                if not self._bloom_may_contain(words):
+                    self._insert(words)
+                    return True
+            slot, found = self._find(words)
+            if found:
+                return False
+            self._insert(words, slot)
+            return True
+
+    def _insert(self, words, slot=None):
+        if (self.count + 1) * 2 > self.capacity:
+            self._grow()
+            slot = None
+        if slot is None:
+            slot, _ = self._find(words)
+        self.table[slot:slot + self.width] = array("Q", words)
+        self.count += 1
+        if self.bloom is not None:
+            for bit in self._bloom_positions(words):
+                self.bloom[bit >> 3] |= 1 << (bit & 7)
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def merge(self, other):
+        ''' Adds every digest of other, which must have the same digest
+        size. '''
+        if other.width != self.width:
+            raise ValueError("Cannot merge seen sets of different digest sizes.")
+        table, width = other.table, other.width
+        for slot in range(0, len(table), width):
+            if table[slot]:
+                self._add(tuple(table[slot:slot + width]))
+
+    def __len__(self):
+        return self.count
+
+    def snapshot(self):
+        ''' Copy of the set as save writes it. '''
+        with self.lock:
+            bloom = self.bloom if self.bloom is not None else b""
+            return [HEADER.pack(
+                MAGIC, self.width, self.capacity, self.count, len(bloom)),
+                bytes(self.table), bytes(bloom)]
+
+    def save(self, path, snapshot=None):
+        ''' Atomically writes the set, or a snapshot taken earlier, to
+        path. '''
+        if snapshot is None:
+            snapshot = self.snapshot()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as save_file:
+            save_file.writelines(snapshot)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        ''' Memory-maps a set written by save. Pages are copy-on-write, so
+        additions never touch the file until the next save. '''
+        with open(path, "rb") as save_file:
+            mapped = mmap.mmap(
+                save_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, width, capacity, count, bloom_len = HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a seen set file.")
+        seen = cls(digest_size=width * 8, capacity=1)
+        view = memoryview(mapped)
+        table_end = HEADER.size + capacity * width * 8
+        seen.capacity = capacity
+        seen.count = count
+        seen.table = view[HEADER.size:table_end].cast("Q")
+        seen.bloom = view[table_end:table_end + bloom_len] if bloom_len else None
+        seen._mmap = mapped
+        return seen
+
+    def _release_mmap(self):
+        if self._mmap is not None:
+            if self.bloom is not None:
+                self.bloom = bytearray(self.bloom)
+            self._mmap = None
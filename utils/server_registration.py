@@ -1,8 +1,14 @@
+import json
 import os
-from spacetime import Node
-from utils.pcc_models import Register
+import socket
+import time
+
+from crawler.persistence import get_backend
+from crawler.shards import shard_save_file
+from utils import get_logger
 
 def init(df, user_agent, fresh):
+    from utils.pcc_models import Register
     reg = df.read_one(Register, user_agent)
     if not reg:
         reg = Register(user_agent, fresh)
@@ -19,8 +25,63 @@ def init(df, user_agent, fresh):
             df.push()
     return reg.load_balancer
 
-def get_cache_server(config, restart):
+def handshake(config, fresh):
+    # spacetime (and numpy through it) is only imported when registering.
+    from spacetime import Node
+    from utils.pcc_models import Register
     init_node = Node(
         init, Types=[Register], dataframe=(config.host, config.port))
-    return init_node.start(
-        config.user_agent, restart or not os.path.exists(config.save_file))
\ No newline at end of file
+    return init_node.start(config.user_agent, fresh)
+
+def cache_key(config):
+    return f"{config.user_agent}@{config.host}:{config.port}"
+
+def read_cached(config):
+    ''' The load balancer cached for this user agent and registration
+    server, or None if there is none, it expired or it does not accept
+    connections. '''
+    try:
+        with open(config.registration_cache) as cache:
+            entry = json.load(cache).get(cache_key(config))
+        host, port = entry["load_balancer"]
+        if time.time() - entry["time"] > config.registration_ttl:
+            return None
+        socket.create_connection((host, port), config.connect_timeout).close()
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return None
+    return host, port
+
+def write_cached(config, load_balancer):
+    try:
+        with open(config.registration_cache) as cache:
+            entries = json.load(cache)
+    except (OSError, ValueError):
+        entries = dict()
+    entries[cache_key(config)] = {
+        "load_balancer": list(load_balancer), "time": time.time()}
+    tmp_path = f"{config.registration_cache}.tmp"
+    with open(tmp_path, "w") as cache:
+        json.dump(entries, cache)
+    os.replace(tmp_path, config.registration_cache)
+
+def get_cache_server(config, restart):
+    ''' Registers the user agent with the cache server and returns its
+    load balancer (host, port). A crawl that resumes reuses the load
+    balancer of an earlier registration from REGISTRATIONCACHE while it is
+    younger than REGISTRATIONTTL seconds and accepts connections. A fresh
+    crawl always registers, since that is what tells the server to start
+    over. '''
+    save_file = config.save_file
+    if config.shards > 1:
+        save_file = shard_save_file(config, 0)
+    fresh = restart or not get_backend(config.save_backend).exists(save_file)
+    if config.registration_cache and not fresh:
+        load_balancer = read_cached(config)
+        if load_balancer is not None:
+            get_logger("REGISTRATION").info(
+                f"Using the cached load balancer {load_balancer}.")
+            return load_balancer
+    load_balancer = tuple(handshake(config, fresh))
+    if config.registration_cache:
+        write_cached(config, load_balancer)
+    return load_balancer
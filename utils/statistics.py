@@ -0,0 +1,213 @@
+import heapq
+import os
+import struct
+import zlib
+from collections import Counter
+from operator import itemgetter
+from threading import Lock, local
+
+MAGIC = b"STAT"
+COUNT = struct.Struct("<Q")
+LENGTH = struct.Struct("<H")
+
+
+class TopK(object):
+    ''' The k largest counts of keys whose counts only ever grow.
+
+    Because counts never drop, a key outside the top k can only enter by
+    passing the smallest count inside it, so the set stays exact with an
+    O(log k) update. A min-heap with lazily dropped stale entries tracks
+    that smallest count. '''
+    def __init__(self, k):
+        self.k = k
+        self.top = dict()
+        self.heap = list()
+
+    def _min(self):
+        heap, top = self.heap, self.top
+        while heap and top.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def update(self, key, count):
+        if key in self.top:
+            self.top[key] = count
+            heapq.heappush(self.heap, (count, key))
+        elif len(self.top) < self.k:
+            self.top[key] = count
+            heapq.heappush(self.heap, (count, key))
+        else:
+            smallest = self._min()
+            if count <= smallest[0]:
+                return
+            heapq.heappop(self.heap)
+            del self.top[smallest[1]]
+            self.top[key] = count
+            heapq.heappush(self.heap, (count, key))
+        if len(self.heap) > 4 * self.k:
+            self.heap = [(count, key) for key, count in self.top.items()]
+            heapq.heapify(self.heap)
+
+    def items(self, k=None):
+        ''' Top (key, count) pairs, largest first. '''
+        return sorted(self.top.items(), key=itemgetter(1), reverse=True)[:k]
+
+
+class WorkerCounters(object):
+    ''' Counts gathered by one thread between merges. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.words = Counter()
+        self.subdomains = Counter()
+        self.longest_page_url = ""
+        self.longest_page_words = 0
+        self.pages = 0
+
+
+class CrawlStatistics(object):
+    ''' Word, longest page and subdomain statistics for the report.
+
+    Each thread counts into its own WorkerCounters, merged into the shared
+    totals every merge_every pages and before a report. Subdomain counts
+    are kept as urls are tracked and the top words by a TopK, so a report
+    costs O(k log k) instead of a sort of the vocabulary. '''
+    def __init__(self, top_k=50, merge_every=50):
+        self.lock = Lock()
+        self.merge_every = merge_every
+        self.words = dict()
+        self.top_words = TopK(top_k)
+        self.subdomains = Counter()
+        self.longest_page_url = ""
+        self.longest_page_words = 0
+        self.local = local()
+        self.counters = list()
+
+    def _counters(self):
+        counters = getattr(self.local, "counters", None)
+        if counters is None:
+            counters = self.local.counters = WorkerCounters()
+            with self.lock:
+                self.counters.append(counters)
+        return counters
+
+    def add_page(self, url, words):
+        ''' Count the words of a page. words maps word to occurrences. '''
+        counters = self._counters()
+        with counters.lock:
+            counters.words.update(words)
+            word_count = sum(words.values())
+            if word_count > counters.longest_page_words:
+                counters.longest_page_words = word_count
+                counters.longest_page_url = url
+            counters.pages += 1
+            if counters.pages >= self.merge_every:
+                self._merge(counters)
+
+    def add_subdomain(self, netloc):
+        counters = self._counters()
+        with counters.lock:
+            counters.subdomains[netloc] += 1
+
+    def merge(self):
+        ''' Fold every thread's pending counts into the totals. '''
+        with self.lock:
+            counters_list = list(self.counters)
+        for counters in counters_list:
+            with counters.lock:
+                self._merge(counters)
+
+    def _merge(self, counters):
+        # Called with counters.lock held.
+        with self.lock:
+            words, top_words = self.words, self.top_words
+            for word, count in counters.words.items():
+                total = words.get(word, 0) + count
+                words[word] = total
+                top_words.update(word, total)
+            self.subdomains.update(counters.subdomains)
+            if counters.longest_page_words > self.longest_page_words:
+                self.longest_page_words = counters.longest_page_words
+                self.longest_page_url = counters.longest_page_url
+        counters.reset()
+
+    def seed(self, words, longest_page_url, longest_page_words):
+        ''' Start from earlier totals, e.g. parsed back from output.txt. '''
+        with self.lock:
+            for word, count in words.items():
+                total = self.words.get(word, 0) + count
+                self.words[word] = total
+                self.top_words.update(word, total)
+            if longest_page_words > self.longest_page_words:
+                self.longest_page_words = longest_page_words
+                self.longest_page_url = longest_page_url
+
+    def top(self, k=None):
+        with self.lock:
+            return self.top_words.items(k)
+
+    def subdomain_counts(self):
+        with self.lock:
+            return sorted(self.subdomains.items())
+
+    def snapshot(self):
+        ''' Copy of the full totals as save writes them, uncompressed. '''
+        self.merge()
+        with self.lock:
+            parts = [MAGIC]
+            url = self.longest_page_url.encode("utf-8")
+            parts += [LENGTH.pack(len(url)), url,
+                      COUNT.pack(self.longest_page_words)]
+            for table in (self.subdomains, self.words):
+                parts.append(COUNT.pack(len(table)))
+                for key, count in table.items():
+                    key = key.encode("utf-8")
+                    parts += [LENGTH.pack(len(key)), key, COUNT.pack(count)]
+        return b"".join(parts)
+
+    def save(self, path, snapshot=None):
+        ''' Write the full totals, or a snapshot taken earlier, as a
+        compressed binary checkpoint. '''
+        if snapshot is None:
+            snapshot = self.snapshot()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as checkpoint:
+            checkpoint.write(zlib.compress(snapshot))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path, "rb") as checkpoint:
+            data = memoryview(zlib.decompress(checkpoint.read()))
+        if bytes(data[:4]) != MAGIC:
+            raise ValueError(f"{path} is not a statistics checkpoint.")
+        offset = 4
+
+        def read_key():
+            nonlocal offset
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size
+            key = bytes(data[offset:offset + length]).decode("utf-8")
+            offset += length
+            return key
+
+        def read_count():
+            nonlocal offset
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            return count
+
+        statistics = cls(**kwargs)
+        statistics.longest_page_url = read_key()
+        statistics.longest_page_words = read_count()
+        for table in (statistics.subdomains, statistics.words):
+            for _ in range(read_count()):
+                key = read_key()
+                table[key] = read_count()
+        for word, count in heapq.nlargest(
+                statistics.top_words.k, statistics.words.items(),
+                key=itemgetter(1)):
+            statistics.top_words.update(word, count)
+        return statistics
@@ -0,0 +1,70 @@
+import heapq
+import time
+from itertools import count
+from threading import Condition, Lock, Thread
+
+from utils import get_logger
+
+
+class SharedTimer(object):
+    ''' One daemon thread running callbacks at their due time, for every
+    deadline of the process instead of a threading.Timer thread each.
+
+    schedule returns an entry that cancel marks dead; dead entries are
+    skipped when they come up, so both are O(log n). Callbacks run on the
+    timer thread and must be quick. '''
+    def __init__(self):
+        self.logger = get_logger("TIMER")
+        self.heap = list()
+        self.sequence = count()
+        self.changed = Condition()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, when, callback):
+        ''' Runs callback() at time.monotonic() when. '''
+        entry = [when, next(self.sequence), callback]
+        with self.changed:
+            heapq.heappush(self.heap, entry)
+            if self.heap[0] is entry:
+                self.changed.notify()
+        return entry
+
+    def cancel(self, entry):
+        ''' True if the callback of entry had not run yet and never will. '''
+        with self.changed:
+            cancelled = entry[2] is not None
+            entry[2] = None
+            return cancelled
+
+    def _run(self):
+        while True:
+            with self.changed:
+                while self.heap and self.heap[0][2] is None:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.changed.wait()
+                    continue
+                wait = self.heap[0][0] - time.monotonic()
+                if wait > 0:
+                    self.changed.wait(wait)
+                    continue
+                entry = heapq.heappop(self.heap)
+                callback, entry[2] = entry[2], None
+            try:
+                callback()
+            except Exception as error:
+                self.logger.error(f"Timer callback failed: {error}")
+
+
+shared_timer = None
+shared_lock = Lock()
+
+
+def get_timer():
+    ''' The SharedTimer of this process, started on first use. '''
+    global shared_timer
+    with shared_lock:
+        if shared_timer is None:
+            shared_timer = SharedTimer()
+        return shared_timer
@@ -0,0 +1,211 @@
+import re
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import crawl_log
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}")
+EXTENSION_PATTERN = re.compile(
+    r".*\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|pdf|docx|pptx|exe|zip|rar|gz)$")
+
+
+def repeating_path(path):
+    """Detect repeating segments within a given path"""
+    path_segments = path.strip("/").split('/')
+    
+    # Check if a segment is followed by itself
+    for i in range(len(path_segments) - 1):
+        if path_segments[i] == path_segments[i + 1]:
+            return True
+    
+    # Count segment occurrences and identify potential traps
+    segment_frequency = {}
+    for segment in path_segments:
+        segment_frequency[segment] = segment_frequency.get(segment, 0) + 1
+        if segment_frequency[segment] >= 3:
+            return True
+
+    return False
+
+
+class LRUCache(object):
+    ''' Dict that forgets its least recently used keys past maxsize. '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+            return self.data[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class LRUCounter(LRUCache):
+    ''' Counter over the maxsize most recently used keys. '''
+    def increment(self, key):
+        ''' Adds one to key and returns the count before the increment. '''
+        with self.lock:
+            count = self.data.pop(key, 0)
+            self.data[key] = count + 1
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        return count
+
+
+class CountMinSketch(object):
+    ''' Fixed-memory counter for an unbounded number of keys. Estimates
+    never undercount; conservative update keeps overcounting low. '''
+    def __init__(self, width=1 << 18, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("H", bytes(2 * width)) for _ in range(depth)]
+        self.lock = Lock()
+
+    def _cells(self, key):
+        digest = blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+            for row in range(self.depth)]
+
+    def increment(self, key):
+        ''' Adds one to key and returns the estimate before the increment. '''
+        cells = self._cells(key)
+        with self.lock:
+            estimate = min(row[cell] for row, cell in zip(self.rows, cells))
+            if estimate < 0xFFFF:
+                for row, cell in zip(self.rows, cells):
+                    if row[cell] == estimate:
+                        row[cell] = estimate + 1
+        return estimate
+
+
+class UrlFilter(object):
+    ''' The crawl's url rules, compiled once and run cheapest first.
+
+    Domain verdicts are memoized per netloc and the path-only rules
+    (depth, extension, repeating segments) per path, both in bounded
+    LRU caches. Stateful checks run last so urls rejected by a
+    static rule never touch the trap counters, which are bounded too. '''
+    def __init__(self, allowed_domains, allowed_subdomains,
+                 is_tracked=None, max_depth=5, max_query_params=3,
+                 trap_limit=10, revisit_limit=5, cache_size=1 << 16):
+        self.allowed_domains = frozenset(allowed_domains)
+        self.allowed_subdomains = frozenset(allowed_subdomains)
+        self.is_tracked = is_tracked
+        self.max_depth = max_depth
+        self.max_query_params = max_query_params
+        self.trap_limit = trap_limit
+        self.revisit_limit = revisit_limit
+        self.netloc_allowed = lru_cache(maxsize=cache_size)(self._netloc_allowed)
+        self.path_allowed = lru_cache(maxsize=cache_size)(self._path_allowed)
+        self.revisits = LRUCounter(cache_size)
+        self.php_traps = CountMinSketch()
+        self.path_traps = CountMinSketch()
+
+    def _netloc_allowed(self, netloc):
+        netloc_parts = netloc.split('.')
+        if len(netloc_parts) < 2:
+            return False
+        if ".".join(netloc_parts[-2:]) not in self.allowed_domains:
+            return False
+        if len(netloc_parts) > 2 and netloc_parts[-3] not in self.allowed_subdomains:
+            return False
+        return True
+
+    def _path_allowed(self, path):
+        if path.count("/") > self.max_depth:
+            return False
+        if EXTENSION_PATTERN.match(path.lower()):
+            return False
+        return not repeating_path(path)
+
+    def _static_key(self, url):
+        """(netloc, path) of url if it passes every stateless rule, else None"""
+        # Split by hand, the domain rule that rejects most links runs
+        # before the rest of the url is looked at.
+        scheme, separator, rest = url.partition("://")
+        if not separator or scheme.lower() not in ("http", "https"):
+            return None
+        end = len(rest)
+        for delimiter in "/?#":
+            position = rest.find(delimiter, 0, end)
+            if position >= 0:
+                end = position
+        netloc = rest[:end]
+        if not self.netloc_allowed(netloc):
+            return None
+
+        path, _, query = rest[end:].partition("#")[0].partition("?")
+        if ";" in path:
+            path = urlparse(url).path
+        limit = self.max_query_params
+        if query and (query.count("%") >= limit or query.count("=") >= limit
+                      or query.count("&") >= limit):
+            return None
+
+        if not self.path_allowed(path):
+            return None
+        if DATE_PATTERN.search(url):
+            return None
+        return netloc, path
+
+    def in_scope(self, url):
+        """Check url against the stateless rules only, leaving trap counters untouched"""
+        try:
+            return self._static_key(url) is not None
+        except Exception as e:
+            crawl_log.record("error", url, detail=f"Error processing URL: {e}")
+            return False
+
+    def is_valid(self, url):
+        """Check if a URL is valid for crawling"""
+        try:
+            key = self._static_key(url)
+            if key is None:
+                return False
+            if self.is_tracked is not None and self.is_tracked(url):
+                return False
+
+            # Stateful trap checks, each bounded in memory
+            if self.revisits.increment(url) > self.revisit_limit:
+                return False
+            if ".php" in url:
+                php_url = url.strip().split(".php")[0] + ".php"
+                if self.php_traps.increment(php_url) > self.trap_limit:
+                    return False
+            netloc, path = key
+            if self.path_traps.increment(netloc + path) > self.trap_limit:
+                return False
+            return True
+        except Exception as e:
+            crawl_log.record("error", url, detail=f"Error processing URL: {e}")
+            return False
+
+    def filter(self, urls):
+        """Valid urls among urls, in order and without repeats"""
+        seen = set()
+        valid = []
+        for url in urls:
+            if url not in seen:
+                seen.add(url)
+                if self.is_valid(url):
+                    valid.append(url)
+        return valid